@@ -0,0 +1,58 @@
+"""Acumulación de las tablas de muchas facturas en columnas, sin pd.concat repetidos.
+
+Los extractores devuelven cada tabla como un dict {columna: [valores]}.
+AcumuladorTablas va extendiendo listas por columna y construye cada
+DataFrame una sola vez al final, de modo que el coste crece linealmente
+con el número de facturas (concatenar DataFrame a DataFrame en el bucle
+copia todo lo acumulado en cada iteración).
+"""
+import pandas as pd
+
+
+def filas_a_columnas(filas, columnas) -> dict:
+    """Convierte una lista de dicts en {columna: [valores]} con el orden de ``columnas``."""
+    return {columna: [fila.get(columna) for fila in filas] for columna in columnas}
+
+
+def num_filas(columnas: dict) -> int:
+    return len(next(iter(columnas.values()), []))
+
+
+class AcumuladorTablas:
+    """Acumula filas por tabla en listas por columna y crea cada DataFrame una sola vez."""
+
+    def __init__(self):
+        self._tablas = {}   # tabla -> {columna: [valores]}
+        self._filas = {}    # tabla -> número de filas acumuladas
+
+    def anadir_columnas(self, tabla, columnas: dict, **constantes):
+        """Añade las filas de ``columnas`` ({columna: [valores]}) a ``tabla``.
+
+        ``constantes`` son columnas con el mismo valor en todas las filas
+        añadidas (p. ej. Archivo=nombre).
+        """
+        n = num_filas(columnas)
+        acumuladas = self._tablas.setdefault(tabla, {})
+        previas = self._filas.get(tabla, 0)
+        for columna, valores in list(columnas.items()) + [(c, [v] * n) for c, v in constantes.items()]:
+            if columna not in acumuladas:
+                # Columna nueva: las filas anteriores quedan vacías
+                acumuladas[columna] = [None] * previas
+            acumuladas[columna].extend(valores)
+        # Columnas que esta vez no venían
+        for columna, valores in acumuladas.items():
+            if len(valores) < previas + n:
+                valores.extend([None] * (previas + n - len(valores)))
+        self._filas[tabla] = previas + n
+
+    def anadir_filas(self, tabla, filas, **constantes):
+        """Como anadir_columnas, pero a partir de una lista de dicts (una por fila)."""
+        columnas = list(dict.fromkeys(columna for fila in filas for columna in fila))
+        self.anadir_columnas(tabla, filas_a_columnas(filas, columnas), **constantes)
+
+    def dataframe(self, tabla) -> pd.DataFrame:
+        """DataFrame de ``tabla`` (vacío si nunca se añadió nada)."""
+        return pd.DataFrame(self._tablas.get(tabla, {}))
+
+    def dataframes(self) -> dict:
+        return {tabla: self.dataframe(tabla) for tabla in self._tablas}
@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-import fitz  # PyMuPDF
 import re
 import io
-from collections import defaultdict
+
+from documento import TextoDocumento
 
 st.set_page_config(page_title="Factura Endesa a Excel", layout="centered")
 
@@ -65,13 +65,10 @@ def extraer_tabla_energia_y_potencia(texto):
 
     return pd.DataFrame(filas)
 
-if uploaded_file is not None:
-    with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
-        texto = ""
-        for page in doc:
-            texto += page.get_text()
-
-    st.success("✅ PDF procesado correctamente")
+@st.cache_data(show_spinner=False)
+def procesar_pdf(pdf_bytes):
+    """Extrae resumen, detalle y Excel; memoizada por contenido para no repetirlo en cada rerun."""
+    texto = TextoDocumento.desde_pdf(pdf_bytes).texto
 
     # Extraer datos generales
     resumen_dict = extraer_datos_generales(texto)
@@ -80,6 +77,19 @@ if uploaded_file is not None:
     # Extraer tabla por periodo
     df_detalle = extraer_tabla_energia_y_potencia(texto)
 
+    # Generar Excel
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df_resumen.to_excel(writer, sheet_name="Resumen Factura", index=False)
+        df_detalle.to_excel(writer, sheet_name="Energía y Potencia", index=False)
+
+    return df_resumen, df_detalle, output.getvalue()
+
+if uploaded_file is not None:
+    df_resumen, df_detalle, excel_bytes = procesar_pdf(uploaded_file.getvalue())
+
+    st.success("✅ PDF procesado correctamente")
+
     # Mostrar los resultados
     st.subheader("📋 Resumen de la Factura")
     st.dataframe(df_resumen)
@@ -87,17 +97,10 @@ if uploaded_file is not None:
     st.subheader("📊 Energía y Potencia por Periodo")
     st.dataframe(df_detalle)
 
-    # Generar Excel
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df_resumen.to_excel(writer, sheet_name="Resumen Factura", index=False)
-        df_detalle.to_excel(writer, sheet_name="Energía y Potencia", index=False)
-    output.seek(0)
-
     # Botón de descarga
     st.download_button(
         label="⬇️ Descargar Excel",
-        data=output,
+        data=excel_bytes,
         file_name="factura_endesa.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
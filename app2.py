@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
-import fitz  # PyMuPDF
 import re
 import io
 
+from acumulador import AcumuladorTablas
+from documento import TextoDocumento
+
 st.set_page_config(page_title="Factura Endesa a Excel", layout="centered")
 
 st.title("📄 Convertidor PDF → Excel: Factura Endesa")
@@ -37,6 +39,7 @@ def extraer_datos_generales(texto):
 def extraer_tabla_energia_y_potencia(texto, periodo_facturacion):
     """
     Busca patrones del tipo P1 a P6 y extrae las cifras de energía y potencia por periodo.
+    Devuelve una lista de filas (dicts).
     """
     patron = re.compile(
         r"Periodo\s+([1-6])(?:\s+Capacitiva)?\s+"  # P1 a P6
@@ -65,35 +68,45 @@ def extraer_tabla_energia_y_potencia(texto, periodo_facturacion):
         }
         filas.append(fila)
 
-    return pd.DataFrame(filas)
+    return filas
+
+@st.cache_data(show_spinner=False)
+def procesar_pdf(_pdf_bytes, nombre_archivo, file_id):
+    """Extrae (resumen, filas del detalle) de un PDF; memoizada por archivo subido para no repetirlo en cada rerun."""
+    texto = TextoDocumento.desde_pdf(_pdf_bytes).texto
+
+    # Extraer datos generales
+    resumen_dict = extraer_datos_generales(texto)
+
+    # Extraer tabla por periodo
+    periodo_facturacion = resumen_dict.get("Periodo Facturación", "Desconocido")
+    filas_detalle = extraer_tabla_energia_y_potencia(texto, periodo_facturacion)
+
+    return resumen_dict, filas_detalle
 
-# Variable para almacenar todos los datos
-df_resumen_total = pd.DataFrame()
-df_detalle_total = pd.DataFrame()
+@st.cache_data(show_spinner=False)
+def generar_excel(claves, _df_resumen_total, _df_detalle_total):
+    """Genera el Excel acumulado; solo se recalcula si cambia el conjunto de archivos."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        _df_resumen_total.to_excel(writer, sheet_name="Resumen Facturas", index=False)
+        _df_detalle_total.to_excel(writer, sheet_name="Energía y Potencia", index=False)
+    return output.getvalue()
 
 if uploaded_files:
+    # Las filas se acumulan por columnas; los DataFrames se crean una sola vez al final
+    acumulador = AcumuladorTablas()
     for uploaded_file in uploaded_files:
         # Procesar cada archivo PDF individualmente
-        with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
-            texto = ""
-            for page in doc:
-                texto += page.get_text()
+        resumen_dict, filas_detalle = procesar_pdf(uploaded_file.getvalue(), uploaded_file.name, uploaded_file.file_id)
 
         st.success(f"✅ PDF procesado correctamente: {uploaded_file.name}")
 
-        # Extraer datos generales
-        resumen_dict = extraer_datos_generales(texto)
-        df_resumen = pd.DataFrame([resumen_dict])
-        df_resumen['Archivo'] = uploaded_file.name  # Añadir nombre del archivo
-
-        # Extraer tabla por periodo
-        periodo_facturacion = resumen_dict.get("Periodo Facturación", "Desconocido")
-        df_detalle = extraer_tabla_energia_y_potencia(texto, periodo_facturacion)
-        df_detalle['Archivo'] = uploaded_file.name  # Añadir nombre del archivo
+        acumulador.anadir_filas("resumen", [resumen_dict], Archivo=uploaded_file.name)
+        acumulador.anadir_filas("detalle", filas_detalle, Archivo=uploaded_file.name)
 
-        # Acumular los datos en los DataFrames totales
-        df_resumen_total = pd.concat([df_resumen_total, df_resumen], ignore_index=True)
-        df_detalle_total = pd.concat([df_detalle_total, df_detalle], ignore_index=True)
+    df_resumen_total = acumulador.dataframe("resumen")
+    df_detalle_total = acumulador.dataframe("detalle")
 
     # Mostrar los resultados acumulados
     st.subheader("📋 Resumen de las Facturas")
@@ -103,16 +116,13 @@ if uploaded_files:
     st.dataframe(df_detalle_total)
 
     # Generar el archivo Excel acumulado
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df_resumen_total.to_excel(writer, sheet_name="Resumen Facturas", index=False)
-        df_detalle_total.to_excel(writer, sheet_name="Energía y Potencia", index=False)
-    output.seek(0)
+    claves = tuple(f.file_id for f in uploaded_files)
+    excel_bytes = generar_excel(claves, df_resumen_total, df_detalle_total)
 
     # Botón de descarga
     st.download_button(
         label="⬇️ Descargar Excel",
-        data=output,
+        data=excel_bytes,
         file_name="facturas_endesa_acumuladas.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
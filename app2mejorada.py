@@ -1,134 +1,63 @@
 import streamlit as st  
 import pandas as pd
-import fitz  # PyMuPDF
-import re
 import io
-from pdf2image import convert_from_bytes
-import pytesseract
-from PIL import Image
+
+from acumulador import AcumuladorTablas
+from cache_facturas import CacheOCR, agrupar_duplicados, hash_pdf
+from cascada import resumen_niveles
+from metricas import tabla_metricas
+from procesamiento import PROCESOS_POR_DEFECTO, procesar_lote
 
 st.set_page_config(page_title="Factura Endesa a Excel", layout="centered")
 st.title("📄 Convertidor PDF → Excel: Factura Endesa")
 
 uploaded_files = st.file_uploader("Sube tus facturas en PDF", type=["pdf"], accept_multiple_files=True)
 
-# -------------------- FUNCIONES OCR --------------------
-
-def aplicar_ocr_a_pdf(pdf_bytes):
-    texto_ocr = ""
-    poppler_bin_path = r"C:\Users\Maria\Documents\poppler-24.08.0\Library\bin"
-    try:
-        imagenes = convert_from_bytes(pdf_bytes, poppler_path=poppler_bin_path)
-        for img in imagenes:
-            texto_ocr += pytesseract.image_to_string(img, lang='spa') + "\n"
-    except Exception as e:
-        st.warning(f"OCR falló: {e}")
-    return texto_ocr
-
-def obtener_texto_pdf(uploaded_file):
-    pdf_bytes = uploaded_file.read()
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        texto = ""
-        for page in doc:
-            texto += page.get_text()
-    if len(texto.strip()) < 100:
-        st.info(f"🧐 Detectado PDF escaneado: {uploaded_file.name}. Aplicando OCR...")
-        texto = aplicar_ocr_a_pdf(pdf_bytes)
-    return texto
-
-# -------------------- FUNCIONES DE EXTRACCIÓN --------------------
-
-def extraer_datos_generales(texto):
-    campos = {
-        "Factura nº": r"Factura nº:\s*([A-Z0-9]+)",
-        "Fecha Factura": r"Fecha Factura:\s*([\d/]+)",
-        "Periodo Facturación": r"Periodo facturación:\s*([\d/]+\s+al\s+[\d/]+)",
-        "Total Factura": r"Total Factura\s*([\d.,]+)\s*€",
-        "Cliente": r"Razón Social:\s*(.+)",
-        "NIF/CIF": r"NIF/CIF:\s*([A-Z0-9]+)",
-        "Dirección Fiscal": r"Dir\.Fiscal:\s*(.+)",
-        "Dirección Suministro": r"Dir\.Suministro:\s*(.+)",
-        "CUPS": r"CUPS:\s*([A-Z0-9]+)",
-        "Contrato Nº": r"Contrato nº:\s*([0-9]+)",
-        "Modalidad de Contrato": r"Modalidad de Contrato:\s*(.+)",
-        "Fecha Límite de Pago": r"antes del\s*([\d/]+)"
-    }
-    resultados = {}
-    for campo, patron in campos.items():
-        match = re.search(patron, texto)
-        resultados[campo] = match.group(1).strip() if match else ""
-    return resultados
-
-def extraer_tabla_energia_y_potencia(texto, periodo_facturacion):
-    patron = re.compile(
-        r"Periodo\s+([1-6])(?:\s+Capacitiva)?\s+" +
-        r"([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+" +
-        r"([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+" +
-        r"([\d.,]+)"
-    )
-    filas = []
-    for match in patron.finditer(texto):
-        valores = [match.group(i).replace('.', '').replace(',', '.') for i in range(1, 13)]
-        fila = {
-            "Periodo": f"P{valores[0]}",
-            "Consumo kWh": float(valores[1]),
-            "Reactiva (kVArh)": float(valores[2]),
-            "Exceso Reactiva": float(valores[3]),
-            "Cosφ": float(valores[4]),
-            "Importe Reactiva (€)": float(valores[5]),
-            "Potencia Contratada": float(valores[6]),
-            "Max. Registrada": float(valores[7]),
-            "Kp": float(valores[8]),
-            "Te": float(valores[9]),
-            "Excesos Potencia": float(valores[10]),
-            "Importe Potencia (€)": float(valores[11]),
-        }
-        filas.append(fila)
-    return pd.DataFrame(filas)
-
-# -------------------- PROCESAMIENTO PRINCIPAL --------------------
-
-df_resumen_total = pd.DataFrame()
-df_detalle_total = pd.DataFrame()
-
-if uploaded_files:
-    for uploaded_file in uploaded_files:
-        texto = obtener_texto_pdf(uploaded_file)
-
-        if not texto.strip():
-            st.warning(f"❌ No se pudo extraer texto del archivo: {uploaded_file.name}")
-            continue
-
-        st.success(f"✅ PDF procesado correctamente: {uploaded_file.name}")
-
-        resumen_dict = extraer_datos_generales(texto)
-        df_resumen = pd.DataFrame([resumen_dict])
-        df_resumen['Archivo'] = uploaded_file.name
-
-        # Extraer fechas desde "Periodo Facturación"
-        df_resumen[["Inicio Facturación", "Fin Facturación"]] = df_resumen["Periodo Facturación"].str.extract(
-            r"(\d{2}/\d{2}/\d{4})\s+al\s+(\d{2}/\d{2}/\d{4})"
-        )
-        df_resumen["Inicio Facturación"] = pd.to_datetime(df_resumen["Inicio Facturación"], dayfirst=True, errors='coerce')
-        df_resumen["Fin Facturación"] = pd.to_datetime(df_resumen["Fin Facturación"], dayfirst=True, errors='coerce')
-
-        # Eliminar columna original
-        df_resumen.drop(columns=["Periodo Facturación"], inplace=True)
-
-        periodo_facturacion = resumen_dict.get("Periodo Facturación", "")
-        df_detalle = extraer_tabla_energia_y_potencia(texto, periodo_facturacion)
-        df_detalle['Archivo'] = uploaded_file.name
-
-        # Extraer fechas también al detalle
-        match = re.search(r"(\d{2}/\d{2}/\d{4})\s+al\s+(\d{2}/\d{2}/\d{4})", periodo_facturacion)
-        if match:
-            inicio = pd.to_datetime(match.group(1), dayfirst=True, errors='coerce')
-            fin = pd.to_datetime(match.group(2), dayfirst=True, errors='coerce')
-            df_detalle["Inicio Facturación"] = inicio
-            df_detalle["Fin Facturación"] = fin
-
-        df_resumen_total = pd.concat([df_resumen_total, df_resumen], ignore_index=True)
-        df_detalle_total = pd.concat([df_detalle_total, df_detalle], ignore_index=True)
+# -------------------- PROCESAMIENTO POR LOTES --------------------
+
+def hash_subido(archivo):
+    """Hash del contenido, calculado una sola vez por archivo subido en la sesión."""
+    hashes = st.session_state.setdefault("hashes_pdf", {})
+    if archivo.file_id not in hashes:
+        hashes[archivo.file_id] = hash_pdf(archivo.getvalue())
+    return hashes[archivo.file_id]
+
+@st.cache_data(show_spinner=False)
+def procesar_archivos(claves, _contenidos, _procesos):
+    """Procesa el lote en paralelo; memoizada por el conjunto de archivos (nombre, hash).
+
+    Los archivos ya vistos en otros lotes salen de la caché en disco sin volver a leerse.
+    """
+    nombres = [nombre for nombre, _ in claves]
+    return procesar_lote("endesa", zip(nombres, _contenidos), _procesos)
+
+def anadir_fechas(df):
+    """Sustituye "Periodo Facturación" por Inicio/Fin Facturación como fechas, en toda la tabla a la vez."""
+    fechas = df["Periodo Facturación"].str.extract(r"(\d{2}/\d{2}/\d{4})\s+al\s+(\d{2}/\d{2}/\d{4})")
+    df["Inicio Facturación"] = pd.to_datetime(fechas[0], format="%d/%m/%Y", errors='coerce')
+    df["Fin Facturación"] = pd.to_datetime(fechas[1], format="%d/%m/%Y", errors='coerce')
+
+    # Eliminar columna original
+    df.drop(columns=["Periodo Facturación"], inplace=True)
+    return df
+
+# -------------------- ACUMULADO Y EXCEL --------------------
+
+@st.cache_data(show_spinner=False)
+def acumular_resultados(claves, _resultados):
+    """Une las tablas de todos los archivos y genera el Excel.
+
+    Solo se recalcula si cambia el conjunto de archivos (claves = pares nombre/hash).
+    """
+    # Las filas se acumulan por columnas y cada DataFrame se construye una sola vez
+    acumulador = AcumuladorTablas()
+    for nombre_archivo, tablas in _resultados:
+        periodo_facturacion = tablas["resumen"]["Periodo Facturación"][0]
+        acumulador.anadir_columnas("resumen", tablas["resumen"], Archivo=nombre_archivo)
+        acumulador.anadir_columnas("detalle", tablas["detalle"], Archivo=nombre_archivo,
+                                   **{"Periodo Facturación": periodo_facturacion})
+    df_resumen_total = anadir_fechas(acumulador.dataframe("resumen"))
+    df_detalle_total = anadir_fechas(acumulador.dataframe("detalle"))
 
     # Reordenar columnas para que Inicio y Fin estén primero
     resumen_cols = ["Inicio Facturación", "Fin Facturación"] + [col for col in df_resumen_total.columns if col not in ["Inicio Facturación", "Fin Facturación"]]
@@ -146,18 +75,6 @@ if uploaded_files:
     total_importe_reactiva = df_detalle_total["Importe Reactiva (€)"].sum()
     total_importe_potencia = df_detalle_total["Importe Potencia (€)"].sum()
 
-    # Mostrar resultados
-    st.subheader("📋 Resumen de las Facturas")
-    st.dataframe(df_resumen_total)
-
-    st.subheader("📊 Energía y Potencia por Periodo")
-    st.dataframe(df_detalle_total)
-
-    st.markdown("### 🔢 Totales")
-    st.write(f"**Total Consumo (kWh):** {total_consumo_kwh:,.2f} kWh")
-    st.write(f"**Total Importe Energía Reactiva (€):** {total_importe_reactiva:,.2f} €")
-    st.write(f"**Total Importe Potencia (€):** {total_importe_potencia:,.2f} €")
-
     # Crear archivo Excel
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
@@ -199,11 +116,69 @@ if uploaded_files:
         worksheet_detalle.write_number(startrow, col_offset + 2, total_importe_reactiva, number_format)  # Importe Reactiva (€)
         worksheet_detalle.write_number(startrow, col_offset + 3, total_importe_potencia, number_format)  # Importe Potencia (€)
 
-    output.seek(0)
+    totales = (total_consumo_kwh, total_importe_reactiva, total_importe_potencia)
+    return df_resumen_total, df_detalle_total, totales, output.getvalue()
+
+# -------------------- PROCESAMIENTO PRINCIPAL --------------------
+
+procesos = st.sidebar.number_input("⚙️ Procesos en paralelo", min_value=1, value=PROCESOS_POR_DEFECTO)
+
+estadisticas_ocr = CacheOCR().estadisticas()
+st.sidebar.caption(
+    f"🗂️ Caché OCR: {estadisticas_ocr['entradas']} páginas, "
+    f"{estadisticas_ocr['tasa_aciertos']:.0%} de aciertos "
+    f"({estadisticas_ocr['aciertos']} de {estadisticas_ocr['aciertos'] + estadisticas_ocr['fallos']})"
+)
+
+if uploaded_files:
+    claves = tuple((uploaded_file.name, hash_subido(uploaded_file)) for uploaded_file in uploaded_files)
+    resultados = procesar_archivos(claves, [uploaded_file.getvalue() for uploaded_file in uploaded_files], procesos)
+
+    tablas_por_archivo, en_cache = [], []
+    for resultado in resultados:
+        for nivel, mensaje in resultado["avisos"]:
+            getattr(st, nivel)(mensaje)
+
+        if resultado["error"]:
+            st.warning(f"❌ No se pudo procesar el archivo {resultado['archivo']}: {resultado['error']}")
+            continue
+
+        if resultado["desde_cache"]:
+            en_cache.append(resultado["archivo"])
+        st.success(f"✅ PDF procesado correctamente: {resultado['archivo']}")
+        tablas_por_archivo.append((resultado["archivo"], resultado["tablas"]))
+
+    if not tablas_por_archivo:
+        st.stop()
+
+    for nombres in agrupar_duplicados(claves):
+        st.info(f"♻️ Archivos con contenido idéntico: {', '.join(nombres)}")
+    if en_cache:
+        st.info(f"⚡ {len(en_cache)} de {len(uploaded_files)} archivos recuperados de la caché")
+    niveles = resumen_niveles(resultado["informe"] for resultado in resultados)
+    if niveles:
+        st.info(f"🪜 Documentos por nivel de extracción: {niveles}")
+    with st.expander("⏱️ Métricas por archivo"):
+        st.dataframe(tabla_metricas(resultados))
+
+    df_resumen_total, df_detalle_total, totales, excel_bytes = acumular_resultados(claves, tablas_por_archivo)
+    total_consumo_kwh, total_importe_reactiva, total_importe_potencia = totales
+
+    # Mostrar resultados
+    st.subheader("📋 Resumen de las Facturas")
+    st.dataframe(df_resumen_total)
+
+    st.subheader("📊 Energía y Potencia por Periodo")
+    st.dataframe(df_detalle_total)
+
+    st.markdown("### 🔢 Totales")
+    st.write(f"**Total Consumo (kWh):** {total_consumo_kwh:,.2f} kWh")
+    st.write(f"**Total Importe Energía Reactiva (€):** {total_importe_reactiva:,.2f} €")
+    st.write(f"**Total Importe Potencia (€):** {total_importe_potencia:,.2f} €")
 
     st.download_button(
         label="⬇️ Descargar Excel",
-        data=output,
+        data=excel_bytes,
         file_name="facturas_endesa_acumuladas.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
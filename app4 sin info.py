@@ -1,266 +1,129 @@
 import streamlit as st
-import fitz            # PyMuPDF
-import pandas as pd
-import re
-import io
-
-# ---------------------- LECTURA PDF ----------------------
-def leer_texto_pdf(file):
-    """Devuelve el texto del PDF, colapsando saltos de línea y espacios extra."""
-    with fitz.open(stream=file.read(), filetype="pdf") as doc:
-        texto = " ".join(
-            page.get_text()        # Si tuvieras columnas difíciles, prueba page.get_text("blocks")
-            .replace("\n", " ")
-            for page in doc
-        )
-    return re.sub(r"\s{2,}", " ", texto)
-
-# ---------------------- EXTRACCIÓN DE DATOS ----------------------
-def extraer_resumen_factura(texto):
-    """Extrae los campos resumen según el nuevo formato de factura."""
-    campos = {
-    "Nº Factura": r"Nº de factura:\s*(\S+)",
-    "Fecha emisión": r"Fecha emisión factura:\s*(\d{2}/\d{2}/\d{4})",
-    "Periodo facturación": r"Periodo de facturación:\s*del\s*(\d{2}/\d{2}/\d{4})\s*al\s*(\d{2}/\d{2}/\d{4})",
-    "Importe de la factura (€)": r"IMPORTE FACTURA:\s*([\d.,]+)",
-    "Cliente": r"Cliente\s+(.*?)\s+[A-Z]{2}\d{5}",  # heurístico
-    "Dirección suministro": r"Dirección de suministro:\s*(.+?),\s*\d{5}",
-    "CUPS": r"CUPS:\s*([A-Z0-9]+)",
-    "Contrato Nº": r"Referencia del contrato:\s*(\d+)",
-}
-
-
-    datos = {k: (m.group(1).strip() if (m := re.search(p, texto)) else "")
-             for k, p in campos.items()}
-    return pd.DataFrame([datos])
-
-
-# ---------------------- BLOQUES VARIABLES ----------------------
-def _recortar_hasta_siguiente_cabecera(bloque: str) -> str:
-    """Corta el bloque en la primera línea de cabecera (mayúsculas largas)."""
-    match = re.search(r"\n[A-ZÁÉÍÓÚÑ ]{10,}", bloque)
-    return bloque[:match.start()] if match else bloque
-
-
-# ---------------------- ENERGÍA ACTIVA ----------------------
-def extraer_energia_activa(texto, periodo_desde, periodo_hasta, nombre_archivo):
-    datos = []
-
-    # Buscar bloque que comienza en "ENERGÍA ACTIVA kWh"
-    inicio = texto.find("ENERGÍA ACTIVA kWh")
-    if inicio == -1:
-        st.warning(f"❌ No se encontró Energía Activa en {nombre_archivo}")
-        return pd.DataFrame(columns=[
-            "Archivo", "Periodo desde", "Periodo hasta",
-            "Periodo", "Consumo (kWh)", "Tipo Lectura"
-        ])
-
-    # Tomamos bloque desde ese punto y lo cortamos si aparece otra sección
-    bloque = texto[inicio:]
-    bloque = _recortar_hasta_siguiente_cabecera(bloque)
-
-    # Buscar todas las líneas tipo: P1 1.18.1 7275,00 7275,00 1,00 0,00 0,00
-    lineas = re.findall(r"P([1-6])\s+[0-9.]+[\s,]+[\d.,]+\s+[\d.,]+\s+[\d.,]+\s+[\d.,]+\s+[\d.,]+", bloque)
-
-    if not lineas:
-        st.info(f"ℹ️ Energía Activa presente pero sin consumos claros en {nombre_archivo}")
-        return pd.DataFrame(columns=[
-            "Archivo", "Periodo desde", "Periodo hasta",
-            "Periodo", "Consumo (kWh)", "Tipo Lectura"
-        ])
-
-    # Procesar las líneas con consumo
-    for match in re.finditer(r"P([1-6])\s+[^\n]+?([\d.,]+)$", bloque, re.MULTILINE):
-        periodo = f"P{match.group(1)}"
-        try:
-            consumo = float(match.group(2).replace('.', '').replace(',', '.'))
-        except ValueError:
-            consumo = 0.0
-        datos.append({
-            "Archivo": nombre_archivo,
-            "Periodo desde": periodo_desde,
-            "Periodo hasta": periodo_hasta,
-            "Periodo": periodo,
-            "Consumo (kWh)": consumo,
-            "Tipo Lectura": "Estimada"
-        })
-
-    if datos:
-        st.success(f"✅ Energía activa extraída correctamente de {nombre_archivo}")
-        return pd.DataFrame(datos)
-    else:
-        return pd.DataFrame(columns=[
-            "Archivo", "Periodo desde", "Periodo hasta",
-            "Periodo", "Consumo (kWh)", "Tipo Lectura"
-        ])
-
-
-
-# ---------------------- ENERGÍA REACTIVA INDUCTIVA ----------------------
-def extraer_reactiva_inducida(texto, periodo_desde, periodo_hasta, nombre_archivo):
-    datos = []
-    try:
-        inicio = texto.find("ENERGÍA REACTIVA INDUCTIVA kWh")
-        if inicio == -1:
-            st.warning(f"❌ Energía reactiva inductiva no encontrada en {nombre_archivo}")
-            return pd.DataFrame(columns=[
-                "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
-                "Consumo Reactiva (kWh)", "Cos φ", "A facturar Reactiva (€)"
-            ])
-
-        bloque = _recortar_hasta_siguiente_cabecera(texto[inicio:])
-        lineas = re.findall(r"P[1-6]\s+[\d.,]+\s+[\d.,]+\s+[\d.,]+", bloque)
-
-        if not lineas:
-            st.info(f"ℹ️ Energía reactiva inductiva sin valores claros en {nombre_archivo}")
-            return pd.DataFrame(columns=[
-                "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
-                "Consumo Reactiva (kWh)", "Cos φ", "A facturar Reactiva (€)"
-            ])
-
-        for linea in lineas:
-            m = re.match(
-                r"P(?P<periodo>[1-6])\s+"
-                r"(?P<consumo>[\d.,]+)\s+"
-                r"(?P<cosphi>[\d.,]+)\s+"
-                r"(?P<a_facturar>[\d.,]+)",
-                linea
-            )
-            if m:
-                datos.append({
-                    "Archivo": nombre_archivo,
-                    "Periodo desde": periodo_desde,
-                    "Periodo hasta": periodo_hasta,
-                    "Periodo": f'P{m["periodo"]}',
-                    "Consumo Reactiva (kWh)": float(m["consumo"].replace('.', '').replace(',', '.')),
-                    "Cos φ": float(m["cosphi"].replace(',', '.')),
-                    "A facturar Reactiva (€)": float(m["a_facturar"].replace('.', '').replace(',', '.')),
-                })
-
-        st.success(f"✅ Energía reactiva inductiva extraída correctamente de {nombre_archivo}")
-        return pd.DataFrame(datos)
-
-    except Exception as e:
-        st.error(f"Error al procesar Energía Reactiva Inductiva en {nombre_archivo}: {e}")
-        return pd.DataFrame(columns=[
-            "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
-            "Consumo Reactiva (kWh)", "Cos φ", "A facturar Reactiva (€)"
-        ])
-
-
-# ---------------------- EXCESOS DE POTENCIA ----------------------
-def extraer_excesos_potencia(texto, periodo_desde, periodo_hasta, nombre_archivo):
-    inicio = texto.find("EXCESOS DE POTENCIA")
-    if inicio == -1:
-        st.warning(f"❌ No se encontró Excesos de Potencia en {nombre_archivo}")
-        return pd.DataFrame(columns=[
-            "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
-            "Contratada (kW)", "Demandada (kW)", "A facturar Exceso (€)"
-        ])
-
-    bloque = _recortar_hasta_siguiente_cabecera(texto[inicio:])
-    lineas = re.findall(r"P[1-6].+", bloque)
-    datos = []
-
-    if lineas:
-        st.write(f"✅ Excesos de potencia encontrados en {nombre_archivo}")
-        for linea in lineas:
-            m = re.match(
-                r"P(?P<periodo>[1-6])\s+"
-                r"(?P<contratada>[\d.,]+)\s+"
-                r"(?P<demandada>[\d.,]+)\s+"
-                r"(?P<a_facturar>[\d.,]+)",
-                linea
-            )
-            if m:
-                datos.append({
-                    "Archivo": nombre_archivo,
-                    "Periodo desde": periodo_desde,
-                    "Periodo hasta": periodo_hasta,
-                    "Periodo": f'P{m["periodo"]}',
-                    "Contratada (kW)": float(m["contratada"].replace('.', '').replace(',', '.')),
-                    "Demandada (kW)": float(m["demandada"].replace('.', '').replace(',', '.')),
-                    "A facturar Exceso (€)": float(m["a_facturar"].replace('.', '').replace(',', '.')),
-                })
-    else:
-        st.warning(f"❌ No se reconocieron filas de Excesos en {nombre_archivo}")
-
-    if not datos:
-        return pd.DataFrame(columns=[
-            "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
-            "Contratada (kW)", "Demandada (kW)", "A facturar Exceso (€)"
-        ])
-    return pd.DataFrame(datos)
-
-
-# ---------------------- EXPORTAR A EXCEL ----------------------
-def _ordenar_por_fecha(df: pd.DataFrame):
-    """Convierte y ordena si la columna existe y el DF no está vacío."""
-    if not df.empty and "Periodo desde" in df.columns:
-        df["Periodo desde"] = pd.to_datetime(df["Periodo desde"], dayfirst=True, errors="coerce")
-        df.sort_values("Periodo desde", inplace=True)
-
-def generar_excel_acumulado(df_resumenes, df_activa, df_reactiva, df_excesos):
-    for df in (df_resumenes, df_activa, df_reactiva, df_excesos):
-        _ordenar_por_fecha(df)
-
-    # Reconvertimos fechas a string dd/mm/yyyy
-    for df in (df_resumenes, df_activa, df_reactiva, df_excesos):
-        if not df.empty and "Periodo desde" in df.columns:
-            df["Periodo desde"] = df["Periodo desde"].dt.strftime("%d/%m/%Y")
-
-    total_kwh = df_activa.groupby("Archivo")["Consumo (kWh)"].sum().reset_index()
-    total_kwh.rename(columns={"Consumo (kWh)": "Total Consumo (kWh)"}, inplace=True)
-
-    total_reactiva = (df_reactiva.groupby("Archivo")["A facturar Reactiva (€)"].sum()
-                      .reset_index()) if not df_reactiva.empty else pd.DataFrame(columns=["Archivo", "Total Reactiva Inductiva (€)"])
-    total_reactiva.rename(columns={"A facturar Reactiva (€)": "Total Reactiva Inductiva (€)"}, inplace=True)
-
-    total_excesos = (df_excesos.groupby("Archivo")["A facturar Exceso (€)"].sum()
-                     .reset_index()) if not df_excesos.empty else pd.DataFrame(columns=["Archivo", "Total Excesos Potencia (€)"])
-    total_excesos.rename(columns={"A facturar Exceso (€)": "Total Excesos Potencia (€)"}, inplace=True)
-
-    df_totales = total_kwh.merge(total_reactiva, on="Archivo", how="outer").merge(total_excesos, on="Archivo", how="outer").fillna(0)
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_resumenes.to_excel(writer, sheet_name="Resumen Factura", index=False)
-        df_activa.to_excel(writer, sheet_name="Energía Activa", index=False)
-        df_reactiva.to_excel(writer, sheet_name="Energía Reactiva Inductiva", index=False)
-        df_excesos.to_excel(writer, sheet_name="Excesos Potencia", index=False)
-        df_totales.to_excel(writer, sheet_name="Totales por Archivo", index=False)
-    return output.getvalue()
 
+from acumulador import AcumuladorTablas
+from cache_facturas import agrupar_duplicados, hash_pdf
+from cascada import resumen_niveles
+from exportar import (excel_de_tablas, formatos_disponibles, fusionar_acumulado, leer_acumulado, tablas_factura,
+                      ya_acumulado, zip_tablas)
+from metricas import tabla_metricas
+from procesamiento import PROCESOS_POR_DEFECTO, iterar_lote
 
-# ---------------------- STREAMLIT APP ----------------------
-st.set_page_config(page_title="Facturas Eléctricas", layout="wide")
-st.title("🔄 Procesador de múltiples facturas eléctricas")
+# ---------------------- PROCESAMIENTO POR LOTES ----------------------
+def hash_subido(archivo):
+    """Hash del contenido, calculado una sola vez por archivo subido en la sesión."""
+    hashes = st.session_state.setdefault("hashes_pdf", {})
+    if archivo.file_id not in hashes:
+        hashes[archivo.file_id] = hash_pdf(archivo.getvalue())
+    return hashes[archivo.file_id]
 
-archivos = st.file_uploader("📁 Sube varios archivos PDF", type="pdf", accept_multiple_files=True)
+def procesar_archivos(claves, contenidos, procesos):
+    """Resultados del lote en orden de entrada, memoizados en la sesión por archivo (nombre, hash).
+
+    Solo los archivos que no se han procesado antes pasan a iterar_lote, en
+    paralelo; añadir un PDF al lote no vuelve a procesar los demás.
+    """
+    memoria = st.session_state.setdefault("resultados_pdf", {})
+    pendientes = {clave: contenido for clave, contenido in zip(claves, contenidos) if clave not in memoria}
+    if pendientes:
+        archivos = ((nombre, contenido) for (nombre, _), contenido in pendientes.items())
+        for clave, resultado in zip(pendientes, iterar_lote("factura", archivos, procesos)):
+            memoria[clave] = resultado
+    return [memoria[clave] for clave in claves]
 
-if archivos:
-    resumenes, activas, reactivas, excesos = [], [], [], []
 
-    for archivo in archivos:
-        texto = leer_texto_pdf(archivo)
-        nombre_archivo = archivo.name
+@st.cache_data(show_spinner=False)
+def acumular_resultados(claves, _tablas_por_archivo):
+    """Une las tablas y calcula los totales por archivo; solo se recalcula si cambia el conjunto de archivos."""
+    acumulador = AcumuladorTablas()
+    for tablas in _tablas_por_archivo:
+        for nombre, columnas in tablas.items():
+            acumulador.anadir_columnas(nombre, columnas)
+    df_resumenes = acumulador.dataframe("resumen")
+    df_activas   = acumulador.dataframe("activa")
+    df_reactivas = acumulador.dataframe("reactiva")
+    df_excesos   = acumulador.dataframe("excesos")
 
-        df_resumen = extraer_resumen_factura(texto)
-        periodo_desde = df_resumen.at[0, "Periodo desde"]
-        periodo_hasta = df_resumen.at[0, "Periodo hasta"]
-        df_resumen["Archivo"] = nombre_archivo
-        resumenes.append(df_resumen)
+    return tablas_factura(df_resumenes, df_activas, df_reactivas, df_excesos)
 
-        activas.append(extraer_energia_activa(texto, periodo_desde, periodo_hasta, nombre_archivo))
-        reactivas.append(extraer_reactiva_inducida(texto, periodo_desde, periodo_hasta, nombre_archivo))
-        excesos.append(extraer_excesos_potencia(texto, periodo_desde, periodo_hasta, nombre_archivo))
 
-    df_resumenes = pd.concat(resumenes, ignore_index=True)
-    df_activas   = pd.concat(activas,   ignore_index=True)
-    df_reactivas = pd.concat(reactivas, ignore_index=True)
-    df_excesos   = pd.concat(excesos,   ignore_index=True)
+@st.cache_data(show_spinner=False)
+def leer_acumulado_subido(hash_libro, _contenido):
+    return leer_acumulado(_contenido)
 
-    excel_bytes = generar_excel_acumulado(df_resumenes, df_activas, df_reactivas, df_excesos)
+
+@st.cache_data(show_spinner=False)
+def fusionar_con_acumulado(claves, _acumulado, _nuevas):
+    """Fusiona las tablas nuevas con las del libro; ``claves`` identifica el libro y los PDF nuevos."""
+    return fusionar_acumulado(_acumulado, _nuevas)
+
+
+@st.cache_data(show_spinner=False)
+def excel_lote(claves, _tablas, _archivos):
+    return excel_de_tablas(_tablas, _archivos)
+
+
+@st.cache_data(show_spinner=False)
+def zip_lote(claves, formatos, _tablas):
+    return zip_tablas(_tablas, formatos)
+
+
+# ---------------------- STREAMLIT APP ----------------------
+st.set_page_config(page_title="Facturas Eléctricas", layout="wide")
+st.title("🔄 Procesador de múltiples facturas eléctricas")
+
+archivos = st.file_uploader("📁 Sube varios archivos PDF", type="pdf", accept_multiple_files=True)
+
+procesos = st.sidebar.number_input("⚙️ Procesos en paralelo", min_value=1, value=PROCESOS_POR_DEFECTO)
+generar_excel = st.sidebar.checkbox("📅 Generar Excel", value=True)
+formatos = st.sidebar.multiselect("🗂️ Tablas en otros formatos (zip)", formatos_disponibles())
+anterior = st.sidebar.file_uploader("📚 Excel acumulado anterior (solo se procesan los PDF nuevos)", type="xlsx")
+
+if archivos:
+    claves = tuple((archivo.name, hash_subido(archivo)) for archivo in archivos)
+
+    # Con un libro anterior, los PDF que ya están en él no se vuelven a procesar
+    acumulado, registro, hash_libro = None, {}, None
+    if anterior is not None:
+        hash_libro = hash_subido(anterior)
+        acumulado, registro = leer_acumulado_subido(hash_libro, anterior.getvalue())
+    nuevos = [(archivo, clave) for archivo, clave in zip(archivos, claves) if not ya_acumulado(registro, *clave)]
+    if len(nuevos) < len(archivos):
+        st.info(f"📚 {len(archivos) - len(nuevos)} de {len(archivos)} archivos ya estaban en el Excel acumulado")
+    claves_nuevas = tuple(clave for _, clave in nuevos)
+    resultados = procesar_archivos(claves_nuevas, [archivo.getvalue() for archivo, _ in nuevos], procesos)
+
+    tablas_por_archivo, en_cache, procesados = [], [], {}
+    for resultado in resultados:
+        for nivel, mensaje in resultado["avisos"]:
+            getattr(st, nivel)(mensaje)
+        if resultado["error"]:
+            st.error(f"❌ Error al procesar {resultado['archivo']}: {resultado['error']}")
+            continue
+        if resultado["desde_cache"]:
+            en_cache.append(resultado["archivo"])
+        tablas_por_archivo.append(resultado["tablas"])
+        procesados[resultado["archivo"]] = resultado["hash"]
+
+    if not tablas_por_archivo and acumulado is None:
+        st.stop()
+
+    for nombres in agrupar_duplicados(claves):
+        st.info(f"♻️ Archivos con contenido idéntico: {', '.join(nombres)}")
+    if en_cache:
+        st.info(f"⚡ {len(en_cache)} de {len(nuevos)} archivos recuperados de la caché")
+    niveles = resumen_niveles(resultado["informe"] for resultado in resultados)
+    if niveles:
+        st.info(f"🪜 Documentos por nivel de extracción: {niveles}")
+    with st.expander("⏱️ Métricas por archivo"):
+        st.dataframe(tabla_metricas(resultados))
+
+    clave_lote = (hash_libro, claves_nuevas)
+    tablas = acumular_resultados(claves_nuevas, tablas_por_archivo) if tablas_por_archivo else None
+    if acumulado is not None:
+        tablas = fusionar_con_acumulado(clave_lote, acumulado, tablas) if tablas is not None else acumulado
+    df_resumenes, df_activas, df_reactivas, df_excesos = (
+        tablas["resumen"], tablas["activa"], tablas["reactiva"], tablas["excesos"]
+    )
 
     st.success("✅ Archivos procesados correctamente.")
 
@@ -277,11 +140,19 @@ if archivos:
     st.dataframe(df_excesos)
 
     st.subheader("📌 Totales por archivo")
-    st.dataframe(pd.read_excel(io.BytesIO(excel_bytes), sheet_name="Totales por Archivo"))
-
-    st.download_button(
-        label="📅 Descargar Excel acumulado",
-        data=excel_bytes,
-        file_name="facturas_acumuladas.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    st.dataframe(tablas["totales"])
+
+    if generar_excel:
+        st.download_button(
+            label="📅 Descargar Excel acumulado",
+            data=excel_lote(clave_lote, tablas, {**registro, **procesados}),
+            file_name="facturas_acumuladas.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+    if formatos:
+        st.download_button(
+            label=f"🗂️ Descargar tablas ({', '.join(formatos)})",
+            data=zip_lote(clave_lote, tuple(formatos), tablas),
+            file_name="facturas_acumuladas.zip",
+            mime="application/zip",
+        )
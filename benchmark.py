@@ -0,0 +1,859 @@
+"""Pruebas de rendimiento y de acierto de cada parte del proceso.
+
+acumulador, excel, numeros y memoria trabajan con tablas sintéticas en
+memoria; el resto lee PDF: los de muestra de la carpeta del proyecto o los
+indicados (campos, tablas, plantillas, lectura, clasificar, ocr, etapas) o
+una carpeta de generar_facturas.py (acierto).
+
+Uso:
+    python benchmark.py acumulador [--tamanos 100 1000 5000]
+    python benchmark.py campos [--repeticiones 2000] [pdf ...]
+    python benchmark.py tablas [--repeticiones 50] [pdf ...]
+    python benchmark.py plantillas [--repeticiones 20] [pdf ...]
+    python benchmark.py lectura [--repeticiones 20] [pdf ...]
+    python benchmark.py clasificar [--repeticiones 20] [pdf ...]
+    python benchmark.py ocr [--paginas 8] [--hilos 4] [pdf ...]
+    python benchmark.py excel [--tamanos 1000 10000]
+    python benchmark.py numeros [--tamanos 66 10000 1000000]
+    python benchmark.py memoria [--tamanos 1000 20000]
+    python benchmark.py etapas [--tamanos 3 10 100 1000] [--comparar COMMIT] [--sin-guardar] [pdf ...]
+    python benchmark.py acierto CARPETA [--procesos 4]
+
+Las pruebas que reciben PDF admiten también los de generar_facturas.py
+(p. ej. "etapas sinteticas/*.pdf --tamanos 10000"); "acierto" compara lo
+extraído de una carpeta generada con su verdad.jsonl, leyendo completo y
+con las plantillas aprendidas, y termina con error si las plantillas
+aciertan menos (p. ej. "generar_facturas.py sinteticas -n 40" y después
+"acierto sinteticas").
+"""
+import argparse
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import cycle, islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import pandas as pd
+
+import extractores_endesa
+import extractores_factura
+import ocr
+from acumulador import AcumuladorTablas, num_filas
+from cache_facturas import CacheOCR
+from documento import normalizar
+from exportar import EscritorExcel, tablas_factura, totales_por_archivo
+from generar_facturas import leer_verdad
+from extractores_endesa import COLUMNAS_DETALLE
+from extractores_factura import COLUMNAS_ACTIVA, COLUMNAS_EXCESOS, COLUMNAS_REACTIVA
+from plantillas import AlmacenPlantillas
+from procesamiento import FAMILIA_AUTO, FAMILIAS, PROCESOS_POR_DEFECTO, clasificar_pdf, iterar_lote
+from tablas_layout import convertir_columnas
+
+CARPETA_MUESTRAS = Path(__file__).parent
+# Una línea JSON por ejecución de "etapas", para comparar entre commits
+RESULTADOS_ETAPAS = CARPETA_MUESTRAS / "benchmark_resultados.jsonl"
+
+
+def _cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    funcion(*args)
+    return time.perf_counter() - inicio
+
+
+# ---------------------- ACUMULADO DE TABLAS ----------------------
+def _iterar_tablas_sinteticas(n):
+    """Genera n resultados como los del extractor Endesa: resumen de 1 fila y detalle de 6."""
+    for i in range(n):
+        resumen = {"Factura nº": [f"F{i:07d}"], "Periodo Facturación": ["01/01/2025 al 31/01/2025"],
+                   "Total Factura": ["1.234,56"], "CUPS": ["ES0000000000000000AA"]}
+        detalle = {columna: ([f"P{p}" for p in range(1, 7)] if columna == "Periodo"
+                             else [float(i + p) for p in range(6)])
+                   for columna in COLUMNAS_DETALLE}
+        yield f"factura_{i}.pdf", {"resumen": resumen, "detalle": detalle}
+
+
+def _tablas_sinteticas(n):
+    return list(_iterar_tablas_sinteticas(n))
+
+
+def _acumular_con_concat(resultados):
+    # Lo que hacían las apps: DataFrames de cada archivo concatenados uno a uno
+    df_resumen_total = pd.DataFrame()
+    df_detalle_total = pd.DataFrame()
+    for nombre, tablas in resultados:
+        df_resumen = pd.DataFrame(tablas["resumen"])
+        df_resumen["Archivo"] = nombre
+        df_detalle = pd.DataFrame(tablas["detalle"])
+        df_detalle["Archivo"] = nombre
+        df_resumen_total = pd.concat([df_resumen_total, df_resumen], ignore_index=True)
+        df_detalle_total = pd.concat([df_detalle_total, df_detalle], ignore_index=True)
+    return df_resumen_total, df_detalle_total
+
+
+def _acumular_por_columnas(resultados):
+    acumulador = AcumuladorTablas()
+    for nombre, tablas in resultados:
+        acumulador.anadir_columnas("resumen", tablas["resumen"], Archivo=nombre)
+        acumulador.anadir_columnas("detalle", tablas["detalle"], Archivo=nombre)
+    return acumulador.dataframe("resumen"), acumulador.dataframe("detalle")
+
+
+def bench_acumulador(tamanos):
+    print(f"{'facturas':>9} {'concat (s)':>11} {'µs/fact.':>9} {'columnas (s)':>13} {'µs/fact.':>9}")
+    for n in tamanos:
+        resultados = _tablas_sinteticas(n)
+        t_concat = _cronometrar(_acumular_con_concat, resultados)
+        t_columnas = _cronometrar(_acumular_por_columnas, resultados)
+        print(f"{n:>9} {t_concat:>11.3f} {t_concat / n * 1e6:>9.0f} "
+              f"{t_columnas:>13.3f} {t_columnas / n * 1e6:>9.0f}")
+
+
+# ---------------------- EXPORTACIÓN A EXCEL ----------------------
+def _excel_en_memoria(n):
+    # Lo que hacen las apps: todo el lote en DataFrames y el libro en un BytesIO
+    df_resumen, df_detalle = _acumular_por_columnas(_iterar_tablas_sinteticas(n))
+    salida = io.BytesIO()
+    with pd.ExcelWriter(salida, engine="xlsxwriter") as writer:
+        df_resumen.to_excel(writer, sheet_name="Resumen Facturas", index=False)
+        df_detalle.to_excel(writer, sheet_name="Energía y Potencia", index=False)
+    return len(salida.getvalue())
+
+
+def _excel_en_streaming(n, ruta):
+    excel = EscritorExcel(ruta)
+    for nombre, tablas in _iterar_tablas_sinteticas(n):
+        excel.anadir("endesa", tablas, nombre)
+    excel.cerrar()
+    return Path(ruta).stat().st_size
+
+
+def _medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    segundos = time.perf_counter() - inicio
+    # ru_maxrss va en KB en Linux
+    return segundos, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, resultado
+
+
+def _pico_memoria(funcion, *args):
+    """(segundos, pico de memoria residente en MB, resultado) de una llamada en un proceso nuevo."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_medir, funcion, *args).result()
+
+
+def bench_excel(tamanos):
+    """Pico de memoria del libro en memoria frente al escrito en streaming a disco.
+
+    Cada medida se hace en un proceso nuevo: el pico incluye lo que ocupan
+    los módulos importados (pandas, PyMuPDF...).
+    """
+    print(f"{'facturas':>9} {'memoria (s)':>12} {'RSS (MB)':>10} {'streaming (s)':>14} {'RSS (MB)':>10} "
+          f"{'xlsx (MB)':>10}")
+    with tempfile.TemporaryDirectory() as carpeta:
+        for n in tamanos:
+            t_memoria, pico_memoria, _ = _pico_memoria(_excel_en_memoria, n)
+            t_streaming, pico_streaming, tamano = _pico_memoria(_excel_en_streaming, n,
+                                                                str(Path(carpeta) / f"lote_{n}.xlsx"))
+            print(f"{n:>9} {t_memoria:>12.2f} {pico_memoria:>10.1f} {t_streaming:>14.2f} "
+                  f"{pico_streaming:>10.1f} {tamano / 1e6:>10.1f}")
+
+
+# ---------------------- TIPOS DE LAS TABLAS DEL LOTE ----------------------
+def _tablas_factura_lote(n):
+    """DataFrames resumen, activa, reactiva y excesos de n facturas "factura" sintéticas (6 periodos)."""
+    acumulador = AcumuladorTablas()
+    for i in range(n):
+        nombre = f"factura_{i}.pdf"
+        desde, hasta = f"{1 + i % 28:02d}/{1 + i % 12:02d}/2025", f"{1 + i % 28:02d}/{1 + (i + 1) % 12:02d}/2025"
+        comunes = {"Archivo": nombre, "Periodo desde": desde, "Periodo hasta": hasta}
+        acumulador.anadir_columnas("resumen", {"Nº Factura": [f"F{i:07d}"], "Fecha emisión": [hasta],
+                                               "Importe de la factura (€)": ["1.234,56"]}, **comunes)
+        periodos = {"Periodo": [f"P{p}" for p in range(1, 7)]}
+        acumulador.anadir_columnas("activa", {
+            **periodos, "Consumo (kWh)": [float(100 * p + i % 50) for p in range(6)], "Tipo Lectura": ["Estimada"] * 6,
+        }, **comunes)
+        acumulador.anadir_columnas("reactiva", {
+            **periodos, "Consumo Reactiva (kWh)": [float(p) for p in range(6)], "Cos φ": [0.95] * 6,
+            "A facturar Reactiva (€)": [round(p * 1.37, 2) for p in range(6)],
+        }, **comunes)
+        acumulador.anadir_columnas("excesos", {
+            **periodos, "Contratada (kW)": [50.0] * 6, "Demandada (kW)": [48.5] * 6,
+            "A facturar Exceso (€)": [round(p * 2.11, 2) for p in range(6)],
+        }, **comunes)
+    columnas = {"activa": COLUMNAS_ACTIVA, "reactiva": COLUMNAS_REACTIVA, "excesos": COLUMNAS_EXCESOS}
+    return [acumulador.dataframe(tabla)[columnas[tabla]] if tabla in columnas else acumulador.dataframe(tabla)
+            for tabla in ("resumen", "activa", "reactiva", "excesos")]
+
+
+def _tablas_factura_antes(df_resumenes, df_activa, df_reactiva, df_excesos):
+    # Lo que hacían las apps: fechas a datetime para ordenar y de vuelta a texto, todo en object/float64
+    for df in (df_resumenes, df_activa, df_reactiva, df_excesos):
+        df["Periodo desde"] = pd.to_datetime(df["Periodo desde"], dayfirst=True, errors="coerce")
+        df.sort_values("Periodo desde", inplace=True)
+        df["Periodo desde"] = df["Periodo desde"].dt.strftime("%d/%m/%Y")
+    return {"resumen": df_resumenes, "activa": df_activa, "reactiva": df_reactiva, "excesos": df_excesos,
+            "totales": totales_por_archivo(df_activa, df_reactiva, df_excesos)}
+
+
+def _memoria_tablas(tablas):
+    return sum(df.memory_usage(deep=True).sum() for df in tablas.values()) / 1e6
+
+
+def bench_memoria(tamanos):
+    """Memoria y tiempo de las tablas del lote: texto/object y float64 frente a tablas_factura (compactar)."""
+    print(f"{'facturas':>9} {'filas':>8} {'antes (MB)':>11} {'(s)':>6} {'compactas (MB)':>15} {'(s)':>6}")
+    for n in tamanos:
+        dfs = _tablas_factura_lote(n)
+        inicio = time.perf_counter()
+        antes = _tablas_factura_antes(*[df.copy() for df in dfs])
+        t_antes = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        compactas = tablas_factura(*dfs)
+        t_compactas = time.perf_counter() - inicio
+        filas = sum(len(df) for df in compactas.values())
+        print(f"{n:>9} {filas:>8} {_memoria_tablas(antes):>11.1f} {t_antes:>6.2f} "
+              f"{_memoria_tablas(compactas):>15.1f} {t_compactas:>6.2f}")
+
+
+# ---------------------- CIFRAS "1.234,56" ----------------------
+def _celdas_sinteticas(n):
+    """n celdas como las de las tablas de las facturas; una de cada cien no es un número."""
+    generador = random.Random(0)
+    return [("1,2,3" if i % 100 == 99
+             else f"{generador.randint(0, 99999):,},{generador.randint(0, 99):02d}".replace(",", "."))
+            for i in range(n)]
+
+
+def _numeros_celda_a_celda_antes(celdas):
+    # Lo que hacían los extractores: replace + float con su try/except por celda
+    valores = []
+    for celda in celdas:
+        try:
+            valores.append(float(celda.replace('.', '').replace(',', '.')))
+        except ValueError:
+            valores.append(0.0)
+    return valores
+
+
+def _numeros_convertir_columnas(celdas):
+    # Lo que hacen ahora los extractores con cada columna de cifras
+    columnas = {"cifras": celdas}
+    convertir_columnas(columnas, ["cifras"])
+    return columnas["cifras"]
+
+
+def _numeros_pyarrow(celdas):
+    # Columna entera con pyarrow.compute, con NaN en las celdas que no son un número
+    import pyarrow  # dependencia opcional
+    import pyarrow.compute as pc
+    texto = pc.replace_substring(pc.replace_substring(pyarrow.array(celdas, type=pyarrow.string()), ".", ""),
+                                 ",", ".")
+    validos = pc.fill_null(pc.match_substring_regex(texto, r"^(?:\d+(?:\.\d*)?|\.\d+)$"), False)
+    return pc.cast(pc.if_else(validos, texto, None), pyarrow.float64()).to_numpy(zero_copy_only=False)
+
+
+def bench_numeros(tamanos):
+    """Conversión de columnas de cifras: celda a celda (convertir_columnas) frente a pyarrow.compute.
+
+    66 celdas son las cifras del detalle de una factura Endesa, lo que se
+    convierte de una vez por documento.
+    """
+    con_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    print(f"{'celdas':>9} {'antes (ns/c.)':>14} {'celdas (ns/c.)':>15} {'pyarrow (ns/c.)':>16}")
+    for n in tamanos:
+        celdas = _celdas_sinteticas(n)
+        repeticiones = max(1, 200_000 // n)
+        funciones = [_numeros_celda_a_celda_antes, _numeros_convertir_columnas]
+        if con_pyarrow:
+            funciones.append(_numeros_pyarrow)
+        # El mejor de 5: con pocas celdas por llamada el ruido pesa más que la diferencia
+        tiempos = [min(_cronometrar(lambda: [funcion(celdas) for _ in range(repeticiones)]) for _ in range(5))
+                   / repeticiones / n * 1e9 for funcion in funciones]
+        print(f"{n:>9} {tiempos[0]:>14.0f} {tiempos[1]:>15.0f} "
+              f"{tiempos[2] if con_pyarrow else float('nan'):>16.0f}")
+
+
+# ---------------------- CAMPOS RESUMEN ----------------------
+def _campos_por_separado(campos, texto):
+    # Lo que hacían los extractores: un re.search sin precompilar por campo
+    resultados = {}
+    for campo, patron in campos.items():
+        match = re.search(patron, texto)
+        resultados[campo] = match.group(1).strip() if match else ""
+    return resultados
+
+
+def _compilar_una_pasada(campos):
+    """Todos los patrones en una sola alternancia, para recorrer el texto una vez."""
+    partes, grupos, n = [], [], 0
+    for i, patron in enumerate(campos.values()):
+        partes.append(f"(?P<c{i}>{patron})")
+        grupos.append(n + 2)
+        n += 1 + re.compile(patron).groups
+    return re.compile("|".join(partes)), list(campos), grupos
+
+
+def _campos_una_pasada(compilado, texto):
+    alternancia, nombres, grupos = compilado
+    resultados = {}
+    for match in alternancia.finditer(texto):
+        i = int(match.lastgroup[1:])
+        resultados.setdefault(nombres[i], match.group(grupos[i]).strip())
+        if len(resultados) == len(nombres):
+            break
+    # Ojo: un campo que empieza donde otro (p. ej. Periodo desde/hasta) queda tapado
+    return {nombre: resultados.get(nombre, "") for nombre in nombres}
+
+
+def _textos_muestra(rutas):
+    """Texto de cada PDF tal como lo reciben los extractores de cada familia (sin OCR)."""
+    textos = []
+    for ruta in rutas:
+        pdf_bytes = ruta.read_bytes()
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            texto_endesa = "".join(page.get_text() for page in doc)
+        textos.append((ruta.name, extractores_factura.leer_texto_pdf(pdf_bytes), texto_endesa))
+    return textos
+
+
+def bench_campos(rutas, repeticiones):
+    familias = {
+        "factura": extractores_factura.CAMPOS_RESUMEN,
+        "endesa": extractores_endesa.CAMPOS_GENERALES,
+    }
+    textos = _textos_muestra(rutas)
+    print(f"{'familia':>8} {'por campo (µs)':>15} {'precompilado (µs)':>18} {'una pasada (µs)':>16}  iguales")
+    for familia, buscador in familias.items():
+        campos = {nombre: patron.pattern for nombre, patron in buscador.patrones.items()}
+        una_pasada = _compilar_una_pasada(campos)
+        documentos = [texto_factura if familia == "factura" else texto_endesa
+                      for _, texto_factura, texto_endesa in textos]
+        iguales = all(_campos_por_separado(campos, texto) == buscador.buscar(texto)
+                      for texto in documentos)
+        tiempos = []
+        for funcion in (lambda t: _campos_por_separado(campos, t), buscador.buscar,
+                        lambda t: _campos_una_pasada(una_pasada, t)):
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                for texto in documentos:
+                    funcion(texto)
+            tiempos.append((time.perf_counter() - inicio) / (repeticiones * len(documentos)) * 1e6)
+        print(f"{familia:>8} {tiempos[0]:>15.1f} {tiempos[1]:>18.1f} {tiempos[2]:>16.1f}  {'sí' if iguales else 'NO'}")
+
+
+# ---------------------- TABLAS POR POSICIÓN ----------------------
+def bench_tablas(rutas, repeticiones):
+    """Extracción completa por expresión regular frente a lectura por posición de las palabras."""
+    familias = {"factura": extractores_factura, "endesa": extractores_endesa}
+    print(f"{'archivo':<40} {'familia':>8} {'regex (ms)':>11} {'layout (ms)':>12} {'por posición':>13}  iguales")
+    for ruta in rutas:
+        pdf_bytes = ruta.read_bytes()
+        for familia, modulo in familias.items():
+            _, por_regex = modulo.extraer_tablas(pdf_bytes, ruta.name, [], "regex")
+            if not any(num_filas(tabla) for nombre, tabla in por_regex.items() if nombre != "resumen"):
+                continue    # PDF de otra familia
+            avisos = []
+            _, por_posicion = modulo.extraer_tablas(pdf_bytes, ruta.name, avisos, "layout")
+            # Los extractores avisan de las tablas que no pudieron leer por posición
+            reconocida = "no" if any("no reconocida" in mensaje for _, mensaje in avisos) else "sí"
+            iguales = por_regex == por_posicion
+            tiempos = []
+            for modo in ("regex", "layout"):
+                inicio = time.perf_counter()
+                for _ in range(repeticiones):
+                    modulo.extraer_tablas(pdf_bytes, ruta.name, None, modo)
+                tiempos.append((time.perf_counter() - inicio) / repeticiones * 1e3)
+            print(f"{ruta.name[:40]:<40} {familia:>8} {tiempos[0]:>11.2f} {tiempos[1]:>12.2f} "
+                  f"{reconocida:>13}  {'sí' if iguales else 'NO'}")
+
+
+# ---------------------- PLANTILLAS ----------------------
+def bench_plantillas(rutas, repeticiones):
+    """Lectura completa frente a lectura de las regiones de la plantilla aprendida."""
+    familias = {"factura": extractores_factura, "endesa": extractores_endesa}
+    print(f"{'archivo':<40} {'familia':>8} {'completa (ms)':>14} {'plantilla (ms)':>15}  iguales")
+    with tempfile.TemporaryDirectory() as directorio:
+        almacen = AlmacenPlantillas(directorio)
+        for ruta in rutas:
+            pdf_bytes = ruta.read_bytes()
+            for familia, modulo in familias.items():
+                _, completas = modulo.extraer_tablas(pdf_bytes, ruta.name, [], plantillas=almacen)  # aprende
+                antes = almacen.estadisticas()["aciertos"]
+                _, con_plantilla = modulo.extraer_tablas(pdf_bytes, ruta.name, [], plantillas=almacen)
+                if almacen.estadisticas()["aciertos"] == antes:
+                    continue    # PDF de otra familia: no hay plantilla que le sirva
+                tiempos = []
+                for plantillas in (None, almacen):
+                    inicio = time.perf_counter()
+                    for _ in range(repeticiones):
+                        modulo.extraer_tablas(pdf_bytes, ruta.name, None, plantillas=plantillas)
+                    tiempos.append((time.perf_counter() - inicio) / repeticiones * 1e3)
+                print(f"{ruta.name[:40]:<40} {familia:>8} {tiempos[0]:>14.2f} {tiempos[1]:>15.2f}  "
+                      f"{'sí' if completas == con_plantilla else 'NO'}")
+
+
+# ---------------------- LECTURA PEREZOSA ----------------------
+def bench_lectura(rutas, repeticiones):
+    """Lectura de todas las páginas frente a parar en cuanto están todos los datos."""
+    familias = {"factura": extractores_factura, "endesa": extractores_endesa}
+    print(f"{'archivo':<40} {'familia':>8} {'completa (ms)':>14} {'perezosa (ms)':>14} {'páginas':>8}  iguales")
+    for ruta in rutas:
+        pdf_bytes = ruta.read_bytes()
+        for familia, modulo in familias.items():
+            informe = {}
+            _, completas = modulo.extraer_tablas(pdf_bytes, ruta.name, [], lectura="completa")
+            _, perezosas = modulo.extraer_tablas(pdf_bytes, ruta.name, [], lectura="perezosa", informe=informe)
+            if informe["paginas_leidas"] == informe["paginas_total"]:
+                continue    # PDF de otra familia: nunca se completa
+            tiempos = []
+            for lectura in ("completa", "perezosa"):
+                inicio = time.perf_counter()
+                for _ in range(repeticiones):
+                    modulo.extraer_tablas(pdf_bytes, ruta.name, None, lectura=lectura)
+                tiempos.append((time.perf_counter() - inicio) / repeticiones * 1e3)
+            paginas = f"{informe['paginas_leidas']}/{informe['paginas_total']}"
+            print(f"{ruta.name[:40]:<40} {familia:>8} {tiempos[0]:>14.2f} {tiempos[1]:>14.2f} {paginas:>8}  "
+                  f"{'sí' if completas == perezosas else 'NO'}")
+
+
+# ---------------------- CLASIFICACIÓN ----------------------
+def bench_clasificar(rutas, repeticiones):
+    """Detectar la familia por la primera página frente a pasar el PDF por todos los extractores."""
+    print(f"{'archivo':<40} {'familia':>8} {'clasificar (ms)':>16} {'todos los extractores (ms)':>27}")
+    for ruta in rutas:
+        pdf_bytes = ruta.read_bytes()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            familia = clasificar_pdf(pdf_bytes)
+        t_clasificar = (time.perf_counter() - inicio) / repeticiones * 1e3
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            for extraer_tablas, *_ in FAMILIAS.values():
+                extraer_tablas(pdf_bytes, ruta.name, None)
+        t_todos = (time.perf_counter() - inicio) / repeticiones * 1e3
+        print(f"{ruta.name[:40]:<40} {familia or '—':>8} {t_clasificar:>16.2f} {t_todos:>27.2f}")
+
+
+# ---------------------- MOTORES OCR ----------------------
+def _reconocer_paginas(motor, imagenes, hilos):
+    """Segundos en reconocer ``imagenes`` con ``hilos`` páginas a la vez."""
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        list(pool.map(motor.reconocer, imagenes))
+    return time.perf_counter() - inicio
+
+
+def bench_ocr(rutas, paginas, hilos):
+    """Páginas/s de cada motor OCR con un hilo y con ``hilos`` a la vez.
+
+    pytesseract con un hilo es como se hacía antes (un proceso tesseract por
+    página, una tras otra). Las páginas se rasterizan una sola vez y se
+    reconocen sin CacheOCR, así que solo cuenta Tesseract.
+    """
+    imagenes = []
+    for ruta in rutas:
+        with fitz.open(ruta) as doc:
+            numeros = range(doc.page_count)
+        imagenes += [img for _, img in ocr.renderizar_paginas(ruta.read_bytes(), numeros)]
+        if len(imagenes) >= paginas:
+            break
+    imagenes = imagenes[:paginas]
+    print(f"{len(imagenes)} páginas a {ocr.DPI_OCR} ppp, OMP_THREAD_LIMIT={os.environ.get('OMP_THREAD_LIMIT', '—')}")
+    print(f"{'motor':<12} {'hilos':>6} {'(s)':>9} {'páginas/s':>10} {'vs pytesseract x1':>18}")
+    referencia = None
+    for nombre in ("pytesseract", "tesserocr"):
+        try:
+            motor = ocr.crear_motor(nombre)
+        except ImportError:
+            print(f"{nombre:<12} no instalado")
+            continue
+        for n in sorted({1, hilos}):
+            try:
+                segundos = _reconocer_paginas(motor, imagenes, n)
+            except Exception as e:
+                print(f"{nombre:<12} no disponible: {e}")
+                break
+            if referencia is None:
+                referencia = segundos
+            print(f"{nombre:<12} {n:>6} {segundos:>9.2f} {len(imagenes) / segundos:>10.2f} "
+                  f"{referencia / segundos:>17.2f}x")
+
+
+# ---------------------- ETAPAS DEL PROCESO ----------------------
+ETAPAS = ("texto", "normalizar", "campos", "tablas", "ocr", "dataframes", "excel")
+# Muestras distintas que pasan por OCR como mucho (con miles de PDF generados tardaría horas)
+MUESTRAS_OCR = 3
+
+
+def _marca_etapa(etapa, segundos, documentos, **extra):
+    # ru_maxrss va en KB en Linux; es el pico del proceso hasta el final de la etapa
+    return {"etapa": etapa, "segundos": segundos, "documentos": documentos,
+            "docs_s": documentos / segundos if segundos else None,
+            "pico_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, **extra}
+
+
+def _etapas_lote(rutas, n, carpeta):
+    """Cada etapa del proceso, una tras otra, sobre n documentos copiados en bucle de ``rutas``.
+
+    Las etapas se miden por separado con lo que deja la anterior, igual que
+    en extraer_tablas en modo regex: texto de las páginas, vista normalizada,
+    campos resumen, tablas por expresión regular, OCR, DataFrames del lote y
+    libro Excel en streaming. Se ejecuta en un proceso nuevo (_pico_memoria).
+    """
+    muestras = [(ruta.name, ruta.read_bytes()) for ruta in rutas]
+    familias = {nombre: clasificar_pdf(pdf_bytes) for nombre, pdf_bytes in muestras}
+    lote = [(f"{i:05d} {nombre}", pdf_bytes, familias[nombre])
+            for i, (nombre, pdf_bytes) in enumerate(islice(cycle(muestras), n))]
+    marcas = []
+
+    inicio = time.perf_counter()
+    paginas = []
+    for _, pdf_bytes, _ in lote:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            paginas.append([page.get_text() for page in doc])
+    marcas.append(_marca_etapa("texto", time.perf_counter() - inicio, n))
+
+    # Factura trabaja con la vista normalizada; Endesa, con el texto tal cual
+    inicio = time.perf_counter()
+    textos = [normalizar(" ".join(p)) if familia == "factura" else "".join(p)
+              for p, (_, _, familia) in zip(paginas, lote)]
+    marcas.append(_marca_etapa("normalizar", time.perf_counter() - inicio, n))
+
+    inicio = time.perf_counter()
+    campos = [extractores_factura.CAMPOS_RESUMEN.buscar(texto) if familia == "factura"
+              else extractores_endesa.CAMPOS_GENERALES.buscar(texto) if familia == "endesa" else {}
+              for texto, (_, _, familia) in zip(textos, lote)]
+    marcas.append(_marca_etapa("campos", time.perf_counter() - inicio, n))
+
+    inicio = time.perf_counter()
+    resultados = []
+    for texto, resumen, (nombre, _, familia) in zip(textos, campos, lote):
+        tablas = {"resumen": {campo: [valor] for campo, valor in resumen.items()}}
+        if familia == "factura":
+            secciones = extractores_factura.indice_secciones(texto)
+            argumentos = (texto, resumen["Periodo desde"], resumen["Periodo hasta"], nombre, None, secciones)
+            tablas["resumen"]["Archivo"] = [nombre]
+            for tabla, (extraer, _) in extractores_factura.TABLAS_REGEX.items():
+                tablas[tabla] = extraer(*argumentos)
+        elif familia == "endesa":
+            tablas["detalle"] = extractores_endesa.extraer_tabla_energia_y_potencia(texto, nombre)
+        resultados.append((nombre, familia, tablas))
+    marcas.append(_marca_etapa("tablas", time.perf_counter() - inicio, n))
+
+    # OCR de la primera página de las primeras muestras distintas, con una caché vacía: las
+    # copias del lote saldrían de CacheOCR sin pasar por Tesseract
+    ocr._cache_ocr = CacheOCR(Path(carpeta) / f"ocr_{n}")
+    avisos = []
+    inicio = time.perf_counter()
+    for _, pdf_bytes in muestras[:MUESTRAS_OCR]:
+        ocr.aplicar_ocr_a_paginas(pdf_bytes, [0], avisos)
+    segundos = time.perf_counter() - inicio
+    fallos = [mensaje for nivel, mensaje in avisos if nivel == "warning"]
+    marcas.append(_marca_etapa("ocr", None if fallos else segundos, len(muestras[:MUESTRAS_OCR]),
+                               **({"nota": f"no disponible: {fallos[0]}"} if fallos else {})))
+
+    inicio = time.perf_counter()
+    acumuladores = {}
+    for nombre, familia, tablas in resultados:
+        acumulador = acumuladores.setdefault(familia, AcumuladorTablas())
+        for tabla, columnas in tablas.items():
+            constantes = {"Archivo": nombre} if familia == "endesa" else {}
+            acumulador.anadir_columnas(tabla, columnas, **constantes)
+    if "factura" in acumuladores:
+        tablas_factura(*(acumuladores["factura"].dataframe(tabla)
+                         for tabla in ("resumen", "activa", "reactiva", "excesos")))
+    if "endesa" in acumuladores:
+        acumuladores["endesa"].dataframes()
+    marcas.append(_marca_etapa("dataframes", time.perf_counter() - inicio, n))
+
+    inicio = time.perf_counter()
+    excel = EscritorExcel(str(Path(carpeta) / f"lote_{n}.xlsx"))
+    for nombre, familia, tablas in resultados:
+        if familia is not None:
+            excel.anadir(familia, tablas, nombre)
+    excel.cerrar()
+    marcas.append(_marca_etapa("excel", time.perf_counter() - inicio, n))
+    return marcas
+
+
+def _commit_actual():
+    """Commit corto de HEAD, con "-sucio" si hay cambios sin confirmar; None fuera de git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=CARPETA_MUESTRAS,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        cambios = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=CARPETA_MUESTRAS,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-sucio" if cambios else "")
+
+
+def leer_resultados(ruta=RESULTADOS_ETAPAS) -> list:
+    """Ejecuciones guardadas de "etapas", de la más antigua a la más reciente."""
+    if not ruta.exists():
+        return []
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def _referencia(ejecuciones, commit, actual):
+    """Última ejecución del commit indicado o, sin él, la última de un commit distinto del actual."""
+    for ejecucion in reversed(ejecuciones):
+        if commit is not None and (ejecucion["commit"] or "").startswith(commit):
+            return ejecucion
+        if commit is None and ejecucion["commit"] != actual:
+            return ejecucion
+    return None
+
+
+def bench_etapas(rutas, tamanos, comparar=None, guardar=True):
+    """Tiempo, documentos por segundo y pico de memoria de cada etapa con lotes de varios tamaños.
+
+    Cada lote se mide en un proceso nuevo. El resultado se añade a
+    RESULTADOS_ETAPAS con el commit y la plataforma, y se compara con una
+    ejecución anterior (la de ``comparar`` o la última de otro commit).
+    """
+    commit = _commit_actual()
+    ejecucion = {"fecha": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+                 "python": platform.python_version(), "plataforma": platform.platform(),
+                 "muestras": [ruta.name for ruta in rutas], "lotes": {}}
+    referencia = _referencia(leer_resultados(), comparar, commit)
+    if comparar is not None and referencia is None:
+        print(f"No hay resultados guardados del commit {comparar}")
+    print(f"commit {commit or '—'}" + (f", comparado con {referencia['commit']} ({referencia['fecha']})"
+                                        if referencia else ""))
+    print(f"{'docs':>6} {'etapa':<11} {'(s)':>9} {'docs/s':>10} {'pico (MB)':>10} {'vs ref.':>8}")
+    with tempfile.TemporaryDirectory() as carpeta:
+        for n in tamanos:
+            _, _, marcas = _pico_memoria(_etapas_lote, rutas, n, carpeta)
+            ejecucion["lotes"][str(n)] = marcas
+            anteriores = {marca["etapa"]: marca for marca in (referencia or {}).get("lotes", {}).get(str(n), [])}
+            for marca in marcas:
+                anterior = anteriores.get(marca["etapa"], {}).get("segundos")
+                if marca["segundos"] is None:
+                    print(f"{n:>6} {marca['etapa']:<11} {marca.get('nota', '—')}")
+                    continue
+                # Más de 1,00x es más lento que la referencia
+                relacion = f"{marca['segundos'] / anterior:.2f}x" if anterior else "—"
+                print(f"{n:>6} {marca['etapa']:<11} {marca['segundos']:>9.4f} {marca['docs_s']:>10.1f} "
+                      f"{marca['pico_mb']:>10.1f} {relacion:>8}")
+    if guardar:
+        with open(RESULTADOS_ETAPAS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(ejecucion, ensure_ascii=False) + "\n")
+        print(f"Resultados añadidos a {RESULTADOS_ETAPAS.name}")
+
+
+# ---------------------- ACIERTO SOBRE FACTURAS SINTÉTICAS ----------------------
+def _celda_correcta(extraida, verdadera):
+    if isinstance(verdadera, float):
+        return isinstance(extraida, (int, float)) and abs(extraida - verdadera) < 1e-6
+    return extraida == verdadera
+
+
+def _resultados_lote(carpeta, nombres, procesos, usar_cache):
+    """{archivo: resultado} de iterar_lote con la familia detectada, como en convertir_facturas."""
+    archivos = ((nombre, Path(carpeta) / nombre) for nombre in nombres)
+    return {resultado["archivo"]: resultado
+            for resultado in iterar_lote(FAMILIA_AUTO, archivos, procesos, usar_cache)}
+
+
+def _resultados_con_plantillas(carpeta, nombres, procesos):
+    """Resultados leyendo con las plantillas, el camino por defecto de convertir_facturas y las apps.
+
+    Con una caché vacía en un directorio temporal, una primera pasada aprende
+    la plantilla de cada formato; después se borra la caché de resultados
+    (se conservan las plantillas) y la segunda pasada, la que se puntúa, lee
+    cada documento con la plantilla de su formato. Cada pasada va en un
+    proceso nuevo para que tome PDF_A_EXCEL_CACHE_DIR.
+    """
+    contexto = multiprocessing.get_context("spawn")
+    anterior = os.environ.get("PDF_A_EXCEL_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as directorio:
+        os.environ["PDF_A_EXCEL_CACHE_DIR"] = directorio
+        try:
+            for pasada in ("aprender", "puntuar"):
+                with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                    resultados = pool.submit(_resultados_lote, carpeta, nombres, procesos, True).result()
+                if pasada == "aprender":
+                    (Path(directorio) / "facturas.sqlite3").unlink()
+        finally:
+            if anterior is None:
+                del os.environ["PDF_A_EXCEL_CACHE_DIR"]
+            else:
+                os.environ["PDF_A_EXCEL_CACHE_DIR"] = anterior
+    return resultados
+
+
+def _puntuar(verdad, resultados):
+    """({(familia, tabla, columna): [correctas, total]}, {familia: [exactos, total, con error]})."""
+    celdas, documentos = {}, {}
+    for nombre, esperado in verdad.items():
+        resultado = resultados[nombre]
+        cuenta = documentos.setdefault(esperado["familia"], [0, 0, 0])
+        cuenta[1] += 1
+        if resultado["error"]:
+            cuenta[2] += 1
+        exacto = resultado["familia"] == esperado["familia"]
+        for tabla, columnas in esperado["tablas"].items():
+            for columna, valores in columnas.items():
+                extraidos = resultado["tablas"].get(tabla, {}).get(columna, [])
+                correctas = sum(_celda_correcta(extraida, verdadera)
+                                for extraida, verdadera in zip(extraidos, valores))
+                total = celdas.setdefault((esperado["familia"], tabla, columna), [0, 0])
+                total[0] += correctas
+                total[1] += len(valores)
+                exacto = exacto and correctas == len(valores) == len(extraidos)
+        cuenta[0] += exacto
+    return celdas, documentos
+
+
+def bench_acierto(carpeta, procesos):
+    """Extrae los PDF de una carpeta de generar_facturas.py y los compara celda a celda con verdad.jsonl.
+
+    Se puntúan dos caminos de convertir_facturas (iterar_lote con la familia
+    detectada): la lectura completa, sin caché ni plantillas, y la lectura
+    con las plantillas aprendidas del propio lote (_resultados_con_plantillas).
+    Cuentan PDF_A_EXCEL_MODO_TABLAS, PDF_A_EXCEL_LECTURA...
+
+    Devuelve 1 si con plantillas alguna columna acierta menos celdas que
+    leyendo completo (p. ej. un campo recortado por su región) y 0 si no.
+    """
+    verdad = leer_verdad(carpeta)
+    puntuaciones = {}
+    for camino in ("completa", "plantillas"):
+        inicio = time.perf_counter()
+        if camino == "completa":
+            resultados = _resultados_lote(carpeta, list(verdad), procesos, False)
+        else:
+            resultados = _resultados_con_plantillas(carpeta, list(verdad), procesos)
+        segundos = time.perf_counter() - inicio
+        puntuaciones[camino] = _puntuar(verdad, resultados)
+        # Con plantillas el tiempo incluye la pasada que las aprende
+        print(f"{camino}: {len(verdad)} documentos en {segundos:.1f} s ({len(verdad) / segundos:.1f} docs/s)")
+
+    (celdas, documentos), (celdas_plantillas, documentos_plantillas) = puntuaciones.values()
+    print(f"\n{'familia':>8} {'docs':>7} {'exactos':>8} {'con error':>10} {'exactos (plantillas)':>21} "
+          f"{'con error (plantillas)':>23}")
+    for familia, (exactos, total, con_error) in sorted(documentos.items()):
+        exactos_plantillas, _, con_error_plantillas = documentos_plantillas[familia]
+        print(f"{familia:>8} {total:>7} {exactos:>8} {con_error:>10} {exactos_plantillas:>21} "
+              f"{con_error_plantillas:>23}")
+    fallidas = [(clave, correctas, total, celdas_plantillas[clave][0])
+                for clave, (correctas, total) in celdas.items()
+                if min(correctas, celdas_plantillas[clave][0]) < total]
+    if fallidas:
+        print(f"\n{'familia':>8} {'tabla':<9} {'columna':<28} {'acierto':>8} {'plantillas':>11}")
+        for (familia, tabla, columna), correctas, total, correctas_plantillas in sorted(fallidas):
+            print(f"{familia:>8} {tabla:<9} {columna:<28} {correctas / total:>8.1%} "
+                  f"{correctas_plantillas / total:>11.1%}")
+    peores = [f"{familia} {tabla} {columna}" for (familia, tabla, columna), correctas, _, correctas_plantillas
+              in sorted(fallidas) if correctas_plantillas < correctas]
+    if peores:
+        print(f"\nERROR: con plantillas se acierta menos que leyendo completo en: {', '.join(peores)}")
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento de pdf-a-excel.")
+    subparsers = parser.add_subparsers(dest="prueba", required=True)
+
+    p = subparsers.add_parser("acumulador", help="concat en bucle frente a AcumuladorTablas")
+    p.add_argument("--tamanos", type=int, nargs="+", default=[100, 1000, 5000],
+                   help="número de facturas de cada lote")
+
+    p = subparsers.add_parser("campos", help="búsqueda de los campos resumen en los PDF de muestra")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--repeticiones", type=int, default=2000)
+
+    p = subparsers.add_parser("tablas", help="tablas P1-P6 por expresión regular frente a por posición")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--repeticiones", type=int, default=50)
+
+    p = subparsers.add_parser("plantillas", help="lectura completa frente a las regiones de la plantilla")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--repeticiones", type=int, default=20)
+
+    p = subparsers.add_parser("lectura", help="lectura de todas las páginas frente a lectura perezosa")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--repeticiones", type=int, default=20)
+
+    p = subparsers.add_parser("clasificar", help="detección del formato por la primera página")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--repeticiones", type=int, default=20)
+
+    p = subparsers.add_parser("ocr", help="páginas/s de pytesseract y tesserocr con uno y varios hilos")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--paginas", type=int, default=8, help="páginas a reconocer (por defecto: 8)")
+    p.add_argument("--hilos", type=int, default=max(ocr.HILOS_OCR, 2),
+                   help=f"páginas a la vez (por defecto: {max(ocr.HILOS_OCR, 2)})")
+
+    p = subparsers.add_parser("excel", help="libro Excel en memoria frente a escrito en streaming")
+    p.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000],
+                   help="número de facturas de cada lote")
+
+    p = subparsers.add_parser("numeros", help="cifras \"1.234,56\" celda a celda frente a pyarrow.compute")
+    p.add_argument("--tamanos", type=int, nargs="+", default=[66, 10000, 1000000],
+                   help="celdas de cada columna")
+
+    p = subparsers.add_parser("memoria", help="tipos de las tablas del lote: object/float64 frente a compactos")
+    p.add_argument("--tamanos", type=int, nargs="+", default=[1000, 20000],
+                   help="número de facturas de cada lote")
+
+    p = subparsers.add_parser("etapas", help="tiempo, docs/s y memoria de cada etapa, guardado por commit")
+    p.add_argument("pdfs", type=Path, nargs="*", help="PDF a usar (por defecto, los de la carpeta del proyecto)")
+    p.add_argument("--tamanos", type=int, nargs="+", help="documentos de cada lote "
+                   "(por defecto, los PDF de muestra y copias hasta 10, 100 y 1000)")
+    p.add_argument("--comparar", metavar="COMMIT",
+                   help="commit guardado con el que comparar (por defecto, la última ejecución de otro commit)")
+    p.add_argument("--sin-guardar", action="store_true", help=f"no añadir el resultado a {RESULTADOS_ETAPAS.name}")
+
+    p = subparsers.add_parser("acierto", help="lo extraído de una carpeta de generar_facturas.py frente a su verdad")
+    p.add_argument("carpeta", type=Path, help="carpeta con los PDF y verdad.jsonl")
+    p.add_argument("--procesos", type=int, default=PROCESOS_POR_DEFECTO,
+                   help=f"procesos en paralelo (por defecto: {PROCESOS_POR_DEFECTO})")
+
+    args = parser.parse_args(argv)
+    if args.prueba == "acumulador":
+        bench_acumulador(args.tamanos)
+    elif args.prueba == "campos":
+        bench_campos(args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf")), args.repeticiones)
+    elif args.prueba == "tablas":
+        bench_tablas(args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf")), args.repeticiones)
+    elif args.prueba == "plantillas":
+        bench_plantillas(args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf")), args.repeticiones)
+    elif args.prueba == "lectura":
+        bench_lectura(args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf")), args.repeticiones)
+    elif args.prueba == "clasificar":
+        bench_clasificar(args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf")), args.repeticiones)
+    elif args.prueba == "ocr":
+        bench_ocr(args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf")), args.paginas, args.hilos)
+    elif args.prueba == "excel":
+        bench_excel(args.tamanos)
+    elif args.prueba == "numeros":
+        bench_numeros(args.tamanos)
+    elif args.prueba == "memoria":
+        bench_memoria(args.tamanos)
+    elif args.prueba == "etapas":
+        rutas = args.pdfs or sorted(CARPETA_MUESTRAS.glob("*.pdf"))
+        bench_etapas(rutas, args.tamanos or [len(rutas), 10, 100, 1000], args.comparar, not args.sin_guardar)
+    elif args.prueba == "acierto":
+        return bench_acierto(args.carpeta, args.procesos)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Cachés persistentes en disco de los resultados de extracción de facturas.
+
+CacheFacturas identifica cada entrada por el SHA-256 del PDF más la
+versión del extractor que lo procesó, y guarda el texto normalizado, las
+tablas extraídas (resumen, activa, reactiva, excesos...) en el formato de
+los extractores ({columna: [valores]}) y los avisos de la extracción, que
+se repiten al recuperarla.
+
+CacheOCR guarda el texto reconocido de cada página escaneada, identificada
+por el hash de sus píxeles y de los ajustes de OCR, de modo que una página
+repetida en otro documento solo se reconoce una vez.
+
+En ambas el tamaño total se limita expulsando las entradas usadas hace más
+tiempo (LRU).
+
+Configuración por variables de entorno:
+    PDF_A_EXCEL_CACHE_DIR         directorio de las bases SQLite
+    PDF_A_EXCEL_CACHE_MAX_MB      tamaño máximo de la caché de facturas en MB
+    PDF_A_EXCEL_CACHE_OCR_MAX_MB  tamaño máximo de la caché de OCR en MB
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+DIRECTORIO_CACHE = Path(os.environ.get("PDF_A_EXCEL_CACHE_DIR",
+                                       Path.home() / ".cache" / "pdf-a-excel"))
+TAMANO_MAX_CACHE = int(os.environ.get("PDF_A_EXCEL_CACHE_MAX_MB", "256")) * 1024 * 1024
+TAMANO_MAX_CACHE_OCR = int(os.environ.get("PDF_A_EXCEL_CACHE_OCR_MAX_MB", "64")) * 1024 * 1024
+
+
+def hash_pdf(pdf_bytes: bytes) -> str:
+    """SHA-256 en hexadecimal del contenido del PDF."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _valor_json(valor):
+    # Los escalares de numpy (int64, bool_...) no son serializables tal cual
+    return valor.item() if hasattr(valor, "item") else str(valor)
+
+
+def _tabla_a_json(tabla) -> dict:
+    # Admite también DataFrames (app3 sigue trabajando con ellos)
+    if isinstance(tabla, pd.DataFrame):
+        return {"columnas": list(tabla.columns), "filas": tabla.astype(object).values.tolist()}
+    return {"columnas": list(tabla), "filas": [list(fila) for fila in zip(*tabla.values())]}
+
+
+def _tabla_desde_json(datos: dict) -> dict:
+    return {columna: [fila[i] for fila in datos["filas"]]
+            for i, columna in enumerate(datos["columnas"])}
+
+
+def _expulsar(conn, tabla, columnas_clave, tamano_max):
+    """Borra de ``tabla`` las entradas menos usadas recientemente hasta caber en tamano_max."""
+    total = conn.execute(f"SELECT COALESCE(SUM(tamano), 0) FROM {tabla}").fetchone()[0]
+    if total <= tamano_max:
+        return
+    claves = ", ".join(columnas_clave)
+    condicion = " AND ".join(f"{columna} = ?" for columna in columnas_clave)
+    for *clave, tamano in conn.execute(
+            f"SELECT {claves}, tamano FROM {tabla} ORDER BY ultimo_acceso").fetchall():
+        if total <= tamano_max:
+            break
+        conn.execute(f"DELETE FROM {tabla} WHERE {condicion}", clave)
+        total -= tamano
+
+
+class CacheFacturas:
+    """Caché SQLite de texto, tablas y avisos por (hash del PDF, versión del extractor)."""
+
+    def __init__(self, directorio=None, tamano_max=None):
+        self.directorio = Path(directorio or DIRECTORIO_CACHE)
+        self.tamano_max = TAMANO_MAX_CACHE if tamano_max is None else tamano_max
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.ruta = self.directorio / "facturas.sqlite3"
+        with self._conectar() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                " hash TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " texto TEXT NOT NULL,"
+                " tablas TEXT NOT NULL,"
+                " tamano INTEGER NOT NULL,"
+                " ultimo_acceso REAL NOT NULL,"
+                " avisos TEXT NOT NULL DEFAULT '[]',"
+                " PRIMARY KEY (hash, version))"
+            )
+            # Cachés creadas antes de guardar los avisos
+            if "avisos" not in {fila[1] for fila in conn.execute("PRAGMA table_info(resultados)")}:
+                conn.execute("ALTER TABLE resultados ADD COLUMN avisos TEXT NOT NULL DEFAULT '[]'")
+
+    def _conectar(self):
+        # Una conexión por operación: Streamlit ejecuta cada sesión en su hilo
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def obtener(self, hash_archivo: str, version: str):
+        """Devuelve (texto, {nombre: {columna: [valores]}}, avisos) o None si no está en caché."""
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT texto, tablas, avisos FROM resultados WHERE hash = ? AND version = ?",
+                (hash_archivo, version),
+            ).fetchone()
+            if fila is None:
+                return None
+            conn.execute(
+                "UPDATE resultados SET ultimo_acceso = ? WHERE hash = ? AND version = ?",
+                (time.time(), hash_archivo, version),
+            )
+        texto, tablas, avisos = fila
+        return (texto, {nombre: _tabla_desde_json(datos) for nombre, datos in json.loads(tablas).items()},
+                [tuple(aviso) for aviso in json.loads(avisos)])
+
+    def guardar(self, hash_archivo: str, version: str, texto: str, tablas: dict, avisos=()):
+        """Guarda el texto, las tablas y los avisos (pares nivel/mensaje) de un PDF y aplica el límite de tamaño."""
+        tablas_json = json.dumps({nombre: _tabla_a_json(tabla) for nombre, tabla in tablas.items()},
+                                 default=_valor_json, ensure_ascii=False)
+        avisos_json = json.dumps(list(avisos), ensure_ascii=False)
+        tamano = sum(len(parte.encode("utf-8")) for parte in (texto, tablas_json, avisos_json))
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO resultados (hash, version, texto, tablas, tamano, ultimo_acceso, avisos)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (hash_archivo, version, texto, tablas_json, tamano, time.time(), avisos_json),
+            )
+            _expulsar(conn, "resultados", ("hash", "version"), self.tamano_max)
+
+    def estadisticas(self) -> dict:
+        with self._conectar() as conn:
+            entradas, tamano = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM resultados"
+            ).fetchone()
+        return {"entradas": entradas, "tamano": tamano, "tamano_max": self.tamano_max}
+
+
+class CacheOCR:
+    """Caché SQLite del texto OCR por página, con contadores de aciertos y fallos."""
+
+    def __init__(self, directorio=None, tamano_max=None):
+        self.directorio = Path(directorio or DIRECTORIO_CACHE)
+        self.tamano_max = TAMANO_MAX_CACHE_OCR if tamano_max is None else tamano_max
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.ruta = self.directorio / "ocr.sqlite3"
+        with self._conectar() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS paginas ("
+                " clave TEXT PRIMARY KEY,"
+                " texto TEXT NOT NULL,"
+                " tamano INTEGER NOT NULL,"
+                " ultimo_acceso REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL)"
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    @staticmethod
+    def clave(img, ajustes: str) -> str:
+        """Hash de los píxeles de la imagen PIL junto con tamaño, modo y ajustes de OCR."""
+        h = hashlib.sha256(f"{img.mode}|{img.size}|{ajustes}|".encode("utf-8"))
+        h.update(img.tobytes())
+        return h.hexdigest()
+
+    def obtener(self, clave: str):
+        """Devuelve el texto de la página o None, y actualiza los contadores."""
+        with self._conectar() as conn:
+            fila = conn.execute("SELECT texto FROM paginas WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None:
+                conn.execute("UPDATE paginas SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave))
+            contador = "aciertos" if fila is not None else "fallos"
+            conn.execute(
+                "INSERT INTO contadores VALUES (?, 1) ON CONFLICT(nombre) DO UPDATE SET valor = valor + 1",
+                (contador,),
+            )
+        return fila[0] if fila is not None else None
+
+    def guardar(self, clave: str, texto: str):
+        with self._conectar() as conn:
+            conn.execute("INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?)",
+                         (clave, texto, len(texto.encode("utf-8")), time.time()))
+            _expulsar(conn, "paginas", ("clave",), self.tamano_max)
+
+    def estadisticas(self) -> dict:
+        with self._conectar() as conn:
+            entradas, tamano = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM paginas"
+            ).fetchone()
+            contadores = dict(conn.execute("SELECT nombre, valor FROM contadores").fetchall())
+        aciertos, fallos = contadores.get("aciertos", 0), contadores.get("fallos", 0)
+        consultas = aciertos + fallos
+        return {"entradas": entradas, "tamano": tamano, "tamano_max": self.tamano_max,
+                "aciertos": aciertos, "fallos": fallos,
+                "tasa_aciertos": aciertos / consultas if consultas else 0.0}
+
+
+def agrupar_duplicados(hashes_por_archivo) -> list:
+    """Recibe pares (nombre, hash) y devuelve las listas de nombres con el mismo contenido."""
+    grupos = {}
+    for nombre, hash_archivo in hashes_por_archivo:
+        grupos.setdefault(hash_archivo, []).append(nombre)
+    return [nombres for nombres in grupos.values() if len(nombres) > 1]
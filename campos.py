@@ -0,0 +1,48 @@
+"""Extracción de campos sueltos (nº de factura, fechas, CUPS...) con patrones precompilados.
+
+Cada familia de factura define sus campos una vez, al importar el módulo,
+como un BuscadorCampos. Todos los campos se obtienen con una sola llamada.
+No se limita la búsqueda a una región (p. ej. la primera página): los
+campos están al principio del documento y cada patrón para en su primera
+coincidencia, así que recortar el texto apenas cambia el tiempo.
+
+Se descartó unir todos los patrones en una alternancia ``a|b|c...`` para
+recorrer el texto una sola vez: el motor ``re`` de CPython solo acelera la
+búsqueda cuando el patrón empieza por un literal, y con la alternancia
+prueba cada rama en cada posición (unas 10 veces más lento; ver
+``python benchmark.py campos``).
+"""
+import re
+
+
+class BuscadorCampos:
+    """Campos {nombre: patrón con un grupo} compilados una sola vez."""
+
+    def __init__(self, campos: dict, flags=0):
+        self.patrones = {nombre: re.compile(patron, flags) for nombre, patron in campos.items()}
+
+    def buscar(self, texto: str) -> dict:
+        """Devuelve {campo: valor} con la primera coincidencia de cada campo.
+
+        Los campos que no aparecen quedan como "".
+        """
+        return {nombre: (m.group(1).strip() if (m := patron.search(texto)) else "")
+                for nombre, patron in self.patrones.items()}
+
+    def tramos(self, texto: str):
+        """{campo: (inicio, fin)} de la coincidencia de cada campo, o None si falta alguno."""
+        tramos = {}
+        for nombre, patron in self.patrones.items():
+            if (m := patron.search(texto)) is None:
+                return None
+            tramos[nombre] = m.span()
+        return tramos
+
+    def buscar_en(self, textos: dict):
+        """Como buscar(), pero cada campo en su propio texto ({campo: texto}); None si falta alguno."""
+        resultados = {}
+        for nombre, patron in self.patrones.items():
+            if (m := patron.search(textos.get(nombre, ""))) is None:
+                return None
+            resultados[nombre] = m.group(1).strip()
+        return resultados
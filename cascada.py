@@ -0,0 +1,150 @@
+"""Extracción en cascada: primero lo barato y solo si lo extraído no cuadra, lo caro.
+
+Cada documento se extrae por niveles (NIVELES): expresiones regulares
+sobre la capa de texto, después tablas por posición de las palabras y,
+por último, OCR de las páginas escaneadas. Tras cada nivel una validación
+rápida de la familia (validar_tablas de su extractor: campos obligatorios,
+fechas, periodos de P1 en adelante sin saltos, importes por periodo que no superen el
+total de la factura...) decide si hace falta pasar al siguiente. El OCR
+solo se intenta si el documento tiene páginas escaneadas.
+
+Se activa con PDF_A_EXCEL_MODO_TABLAS=cascada (ver procesamiento).
+"""
+from collections import Counter
+from datetime import datetime
+
+from metricas import sumar_tiempos
+from tablas_layout import numero_es
+
+# Nivel -> argumentos de extraer_tablas; cada uno solo se prueba si el anterior no valida
+NIVELES = {
+    "regex": {"modo": "regex", "ocr": False},
+    "layout": {"modo": "layout", "ocr": False},
+    "ocr": {"modo": "layout", "ocr": True, "lectura": "completa"},
+}
+
+# Margen en euros al comparar sumas de importes con el total
+TOLERANCIA_IMPORTE = 0.01
+
+
+def _avisar(avisos, nivel, mensaje):
+    if avisos is not None:
+        avisos.append((nivel, mensaje))
+
+
+# ---------------------- COMPROBACIONES ----------------------
+def importe_es(valor):
+    """"3.737,86" -> 3737.86; None si falta o no es un número."""
+    try:
+        return numero_es(valor) if valor else None
+    except ValueError:
+        return None
+
+
+def fecha_es(valor):
+    """"31/05/2025" -> datetime; None si falta o no es una fecha."""
+    try:
+        return datetime.strptime(valor, "%d/%m/%Y")
+    except (TypeError, ValueError):
+        return None
+
+
+def comprobar_campos(resumen, campos) -> list:
+    """Problemas por cada campo obligatorio vacío de la fila de resumen."""
+    return [f"falta {campo}" for campo in campos if not resumen.get(campo)]
+
+
+def comprobar_periodo(desde, hasta) -> list:
+    inicio, fin = fecha_es(desde), fecha_es(hasta)
+    if inicio is None or fin is None:
+        return [f"periodo de facturación no válido ({desde} - {hasta})"]
+    return [] if inicio <= fin else [f"periodo de facturación invertido ({desde} - {hasta})"]
+
+
+def comprobar_tabla(columnas, tabla, columna_periodo="Periodo") -> list:
+    """La tabla debe tener una fila por periodo, de P1 al último sin saltos ni repeticiones,
+    y ninguna cifra que no se haya podido leer (NaN, ver tablas_layout.convertir_columnas)."""
+    periodos = columnas.get(columna_periodo, [])
+    if not periodos:
+        return [f"{tabla} sin filas"]
+    if sorted(periodos) != [f"P{i}" for i in range(1, len(periodos) + 1)]:
+        return [f"{tabla} con periodos incompletos o repetidos ({', '.join(periodos)})"]
+    no_validas = [f"{periodos[fila]} {columna}" for columna, valores in columnas.items()
+                  for fila, valor in enumerate(valores) if valor != valor]
+    if no_validas:
+        return [f"{tabla} con cifras no válidas ({', '.join(no_validas)})"]
+    return []
+
+
+def comprobar_importes(partes, total, descripcion) -> list:
+    """La suma de los importes por periodo no puede superar el total de la factura."""
+    suma = sum(valor for valor in partes if valor is not None and valor == valor)
+    if total is not None and suma > total + TOLERANCIA_IMPORTE:
+        return [f"{descripcion} ({suma:.2f} €) supera el total de la factura ({total:.2f} €)"]
+    return []
+
+
+# ---------------------- CASCADA ----------------------
+def extraer_en_cascada(extraer_tablas, validar, pdf_bytes, nombre_archivo, avisos=None, plantillas=None,
+                       informe=None):
+    """Como ``extraer_tablas``, subiendo de nivel solo mientras lo extraído no valide.
+
+    ``validar(texto, tablas)`` devuelve la lista de problemas (vacía si todo
+    cuadra). Se devuelve el primer nivel que valida o, si ninguno lo hace,
+    el de menos problemas, con un aviso. Las plantillas solo se usan en el
+    primer nivel. En ``informe`` se anota lo del extractor en el nivel
+    elegido más nivel y problemas; los tiempos son la suma de todos los niveles.
+    """
+    elegido, error = None, None
+    rechazados = []
+    ultimo_informe = {}
+    informes_niveles = []   # los tiempos de todos los niveles probados cuentan
+    for nivel, opciones in NIVELES.items():
+        if nivel == "ocr" and ultimo_informe.get("paginas_escaneadas") == 0:
+            break
+        avisos_nivel, ultimo_informe = [], {}
+        informes_niveles.append(ultimo_informe)
+        try:
+            texto, tablas = extraer_tablas(pdf_bytes, nombre_archivo, avisos_nivel, informe=ultimo_informe,
+                                           plantillas=plantillas if nivel == "regex" else None, **opciones)
+        except Exception as e:
+            error = e
+            rechazados.append((nivel, [f"{type(e).__name__}: {e}"]))
+            continue
+        problemas = validar(texto, tablas)
+        intento = (nivel, problemas, texto, tablas, avisos_nivel, ultimo_informe)
+        if elegido is None or len(problemas) < len(elegido[1]):
+            elegido = intento
+        if not problemas:
+            break
+        rechazados.append((nivel, problemas))
+
+    if elegido is None:
+        # Ningún nivel llegó a extraer: se conservan los avisos del último (p. ej. fallos del OCR)
+        if avisos is not None:
+            avisos.extend(avisos_nivel)
+        raise error
+    nivel, problemas, texto, tablas, avisos_nivel, informe_nivel = elegido
+    for nivel_rechazado, problemas_nivel in rechazados:
+        if nivel_rechazado != nivel:
+            _avisar(avisos, "info", f"🪜 {nombre_archivo}: el nivel {nivel_rechazado} no valida "
+                                    f"({'; '.join(problemas_nivel)})")
+    if avisos is not None:
+        avisos.extend(avisos_nivel)
+    if problemas:
+        _avisar(avisos, "warning", f"⚠️ {nombre_archivo} no supera la validación: {'; '.join(problemas)}")
+    if informe is not None:
+        informe.update(informe_nivel, nivel=nivel, problemas=problemas,
+                       tiempos=sumar_tiempos(informe, *informes_niveles))
+    return texto, tablas
+
+
+def resumen_niveles(informes) -> str:
+    """"regex 12, layout 2, ocr 1 (1 sin validar)" de los informes de un lote; "" sin cascada."""
+    informes = [informe for informe in informes if "nivel" in informe]
+    if not informes:
+        return ""
+    cuenta = Counter(informe["nivel"] for informe in informes)
+    sin_validar = sum(1 for informe in informes if informe["problemas"])
+    texto = ", ".join(f"{nivel} {cuenta[nivel]}" for nivel in NIVELES if nivel in cuenta)
+    return texto + (f" ({sin_validar} sin validar)" if sin_validar else "")
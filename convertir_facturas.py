@@ -0,0 +1,235 @@
+"""Conversión por lotes de facturas PDF desde la línea de comandos, sin Streamlit.
+
+Ejemplos:
+    python convertir_facturas.py facturas/ -o salida/
+    python convertir_facturas.py "facturas/2025-*/*.pdf" -o salida/ --formato endesa --procesos 16
+    python convertir_facturas.py facturas/ -o salida/ --formato auto
+    python convertir_facturas.py facturas/ -o salida/ --excel salida/facturas.xlsx
+    python convertir_facturas.py facturas/ -o salida/ --formatos parquet csv
+    python convertir_facturas.py facturas/ -o salida/ --acumulado facturas_acumuladas.xlsx
+    PDF_A_EXCEL_LECTURA=perezosa python convertir_facturas.py facturas/ -o salida/
+    PDF_A_EXCEL_MODO_TABLAS=cascada python convertir_facturas.py facturas/ -o salida/
+    python convertir_facturas.py facturas/ -o salida/ --metricas metricas.jsonl
+    python convertir_facturas.py facturas/ -o salida/ --perfil perfil.prof
+
+Por cada tabla extraída (resumen, activa, reactiva, excesos, totales...)
+se escribe un archivo en la carpeta de salida en cada formato de
+--formatos (CSV por defecto; Parquet y Arrow si está pyarrow); con --formato auto, el formato de cada
+documento se detecta por su primera página y cada uno va a su subcarpeta
+(salida/factura/, salida/endesa/). Todas las tablas llevan el Archivo de
+cada fila y las Endesa también su periodo de facturación, igual que en el
+Excel (exportar.tablas_documento). Con --excel se escribe además un libro
+con una hoja por tabla, en streaming (exportar.EscritorExcel), sin acumular
+el lote en memoria. Las filas se añaden a medida que termina cada
+documento, en el orden de entrada. Con --acumulado, los PDF que ya están
+en ese libro (por hash, ver exportar.leer_acumulado) no se procesan y los
+nuevos se fusionan en él en orden de fecha. Al final se imprime un resumen con
+el rendimiento, las páginas leídas, los documentos resueltos en cada nivel
+de la cascada (si se usa) y los errores.
+
+Con --metricas se escribe una línea JSON por documento (bytes, páginas,
+páginas con OCR y segundos de cada etapa, ver metricas.linea_metricas) y
+una última con los totales del lote, incluido el tiempo de exportación.
+Con --perfil el lote se ejecuta en un solo proceso bajo cProfile: las
+estadísticas se guardan en esa ruta (para pstats o snakeviz) y se
+imprimen las funciones con más tiempo acumulado.
+"""
+import argparse
+import glob
+import json
+import sys
+import time
+from pathlib import Path
+
+from acumulador import AcumuladorTablas
+from cache_facturas import hash_pdf
+from cascada import resumen_niveles
+from exportar import (FORMATOS, EscritorExcel, crear_escritor, excel_de_tablas, formatos_disponibles,
+                      fusionar_acumulado, leer_acumulado, tablas_documento, tablas_factura, ya_acumulado)
+from metricas import linea_metricas, perfilar, resumen_perfil
+from procesamiento import FAMILIA_AUTO, FAMILIAS, PROCESOS_POR_DEFECTO, iterar_lote
+
+
+def buscar_pdfs(entradas) -> list:
+    """Expande carpetas (recursivamente) y patrones glob a una lista ordenada de PDFs."""
+    rutas = []
+    for entrada in entradas:
+        ruta = Path(entrada)
+        if ruta.is_dir():
+            rutas.extend(sorted(p for p in ruta.rglob("*") if p.suffix.lower() == ".pdf"))
+        elif ruta.is_file():
+            rutas.append(ruta)
+        else:
+            rutas.extend(sorted(Path(p) for p in glob.glob(entrada, recursive=True)))
+    # Sin repetir rutas, conservando el orden
+    return list(dict.fromkeys(rutas))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convierte lotes de facturas PDF a CSV.")
+    parser.add_argument("entradas", nargs="+", help="carpetas, PDFs o patrones glob")
+    parser.add_argument("-o", "--salida", type=Path, default=Path("salida"),
+                        help="carpeta donde escribir las tablas (por defecto: salida)")
+    parser.add_argument("--formatos", nargs="+", choices=list(FORMATOS), default=["csv"],
+                        help="formatos de las tablas (por defecto: csv)")
+    parser.add_argument("--formato", choices=sorted(FAMILIAS) + [FAMILIA_AUTO], default="factura",
+                        help="familia de factura y extractor a usar, o auto para detectarla en cada "
+                             "documento (por defecto: factura)")
+    parser.add_argument("--procesos", type=int, default=PROCESOS_POR_DEFECTO,
+                        help=f"procesos en paralelo (por defecto: {PROCESOS_POR_DEFECTO})")
+    parser.add_argument("--excel", type=Path, metavar="RUTA",
+                        help="escribir también un libro Excel con todas las tablas (en streaming)")
+    parser.add_argument("--acumulado", type=Path, metavar="RUTA",
+                        help="libro Excel acumulado que se amplía solo con los PDF que no estén ya en él "
+                             "(se crea si no existe; solo con --formato factura)")
+    parser.add_argument("--sin-cache", action="store_true", help="no usar la caché en disco ni las plantillas aprendidas")
+    parser.add_argument("--metricas", type=Path, metavar="RUTA",
+                        help="escribir en RUTA una línea JSON con las métricas de cada documento y del lote")
+    parser.add_argument("--perfil", type=Path, metavar="RUTA",
+                        help="ejecutar en un solo proceso bajo cProfile y guardar las estadísticas en RUTA")
+    parser.add_argument("-v", "--detalle", action="store_true",
+                        help="mostrar los avisos de cada extractor")
+    args = parser.parse_args(argv)
+    no_disponibles = [formato for formato in args.formatos if formato not in formatos_disponibles()]
+    if no_disponibles:
+        parser.error(f"{', '.join(no_disponibles)} necesita pyarrow (pip install pyarrow)")
+    if args.acumulado and args.formato != "factura":
+        parser.error("--acumulado solo admite --formato factura")
+
+    if args.perfil is None:
+        return convertir(args)
+    # cProfile solo ve el proceso actual: con un pool no aparecería la extracción
+    args.procesos = 1
+    args.perfil.parent.mkdir(parents=True, exist_ok=True)
+    with perfilar(args.perfil) as perfil:
+        codigo = convertir(args)
+    print(f"\nPerfil en: {args.perfil}\n")
+    print(resumen_perfil(perfil))
+    return codigo
+
+
+def convertir(args) -> int:
+    """Convierte el lote de ``args`` (ver main) e imprime el resumen; devuelve el código de salida."""
+    rutas = buscar_pdfs(args.entradas)
+    if not rutas:
+        print("No se encontraron PDFs en las entradas indicadas.", file=sys.stderr)
+        return 2
+
+    acumulado, registro = None, {}
+    if args.acumulado and args.acumulado.exists():
+        acumulado, registro = leer_acumulado(args.acumulado.read_bytes())
+    omitidos = 0
+    if registro:
+        pendientes = [ruta for ruta in rutas if not ya_acumulado(registro, ruta.name, hash_pdf(ruta.read_bytes()))]
+        omitidos, rutas = len(rutas) - len(pendientes), pendientes
+        if not rutas:
+            print(f"Los {omitidos} PDFs ya están en {args.acumulado}; no hay nada que añadir.")
+            return 0
+    nuevas = AcumuladorTablas() if args.acumulado else None
+    procesados = {}     # nombre -> hash de los PDF añadidos al acumulado
+
+    escritores = {}     # familia -> [escritor de cada formato]
+    if args.excel:
+        args.excel.parent.mkdir(parents=True, exist_ok=True)
+    excel = EscritorExcel(str(args.excel)) if args.excel else None
+    por_familia = {}
+    errores, en_cache, bytes_leidos = [], 0, 0
+    paginas_leidas, paginas_total = 0, 0
+    informes = []
+    exportacion = 0.0   # segundos escribiendo tablas, Excel y acumulado
+    if args.metricas:
+        args.metricas.parent.mkdir(parents=True, exist_ok=True)
+    metricas = args.metricas.open("w", encoding="utf-8") if args.metricas else None
+    inicio = time.perf_counter()
+    try:
+        archivos = ((ruta.name, ruta) for ruta in rutas)
+        for i, (ruta, resultado) in enumerate(
+                zip(rutas, iterar_lote(args.formato, archivos, args.procesos, not args.sin_cache)), 1):
+            bytes_leidos += ruta.stat().st_size
+            if metricas is not None:
+                metricas.write(json.dumps(linea_metricas(resultado), ensure_ascii=False) + "\n")
+            if args.detalle:
+                for nivel, mensaje in resultado["avisos"]:
+                    print(f"    [{nivel}] {mensaje}", file=sys.stderr)
+            if resultado["error"]:
+                errores.append((ruta, resultado["error"]))
+                print(f"[{i}/{len(rutas)}] ❌ {ruta}: {resultado['error']}", file=sys.stderr)
+                continue
+            en_cache += resultado["desde_cache"]
+            paginas_leidas += resultado["informe"].get("paginas_leidas", 0)
+            paginas_total += resultado["informe"].get("paginas_total", 0)
+            informes.append(resultado["informe"])
+            familia = resultado["familia"]
+            inicio_exportacion = time.perf_counter()
+            if familia not in escritores:
+                carpeta = args.salida / familia if args.formato == FAMILIA_AUTO else args.salida
+                escritores[familia] = [crear_escritor(carpeta, formato) for formato in args.formatos]
+            tablas = tablas_documento(familia, resultado["tablas"], resultado["archivo"])
+            for escritor in escritores[familia]:
+                escritor.escribir(tablas)
+            if excel is not None:
+                excel.anadir(familia, tablas, resultado["archivo"], resultado["hash"])
+            if nuevas is not None:
+                for nombre, columnas in resultado["tablas"].items():
+                    nuevas.anadir_columnas(nombre, columnas)
+                procesados[resultado["archivo"]] = resultado["hash"]
+            exportacion += time.perf_counter() - inicio_exportacion
+            por_familia[familia] = por_familia.get(familia, 0) + 1
+            print(f"[{i}/{len(rutas)}] ✅ {ruta}{' (caché)' if resultado['desde_cache'] else ''}")
+    finally:
+        inicio_exportacion = time.perf_counter()
+        for escritores_familia in escritores.values():
+            for escritor in escritores_familia:
+                escritor.cerrar()
+        if excel is not None:
+            excel.cerrar()
+        exportacion += time.perf_counter() - inicio_exportacion
+    inicio_exportacion = time.perf_counter()
+    if procesados:
+        tablas = tablas_factura(*(nuevas.dataframe(tabla) for tabla in ("resumen", "activa", "reactiva", "excesos")))
+        if acumulado is not None:
+            tablas = fusionar_acumulado(acumulado, tablas)
+        # Se escribe aparte y se sustituye al final: un fallo a medias no estropea el libro anterior
+        args.acumulado.parent.mkdir(parents=True, exist_ok=True)
+        temporal = args.acumulado.with_name(args.acumulado.name + ".tmp")
+        temporal.write_bytes(excel_de_tablas(tablas, {**registro, **procesados}))
+        temporal.replace(args.acumulado)
+    exportacion += time.perf_counter() - inicio_exportacion
+    duracion = time.perf_counter() - inicio
+    if metricas is not None:
+        with metricas:
+            metricas.write(json.dumps({
+                "lote": True, "documentos": len(rutas), "errores": len(errores), "de_cache": en_cache,
+                "bytes": bytes_leidos, "paginas_total": paginas_total, "paginas_leidas": paginas_leidas,
+                "procesos": args.procesos, "segundos": round(duracion, 6),
+                "exportacion": round(exportacion, 6), "docs_por_segundo": round(len(rutas) / duracion, 3),
+            }) + "\n")
+
+    print(f"\n{len(rutas)} documentos en {duracion:.1f} s "
+          f"({len(rutas) / duracion:.1f} docs/s, {bytes_leidos / duracion / 1e6:.1f} MB/s)")
+    print(f"  correctos: {len(rutas) - len(errores)} (de caché: {en_cache})")
+    if args.formato == FAMILIA_AUTO and por_familia:
+        print("  por formato: " + ", ".join(f"{familia} {n}" for familia, n in sorted(por_familia.items())))
+    if paginas_total:
+        print(f"  páginas leídas: {paginas_leidas} de {paginas_total} "
+              f"({paginas_total - paginas_leidas} sin leer)")
+    niveles = resumen_niveles(informes)
+    if niveles:
+        print(f"  por nivel de extracción: {niveles}")
+    if omitidos:
+        print(f"  ya en el acumulado (sin procesar): {omitidos}")
+    print(f"  con error: {len(errores)}")
+    for ruta, error in errores:
+        print(f"    {ruta}: {error}")
+    print(f"  tablas ({', '.join(args.formatos)}) en: {args.salida}")
+    if args.excel:
+        print(f"  Excel en: {args.excel}")
+    if args.acumulado:
+        print(f"  Excel acumulado en: {args.acumulado} ({len(procesados)} archivos añadidos)")
+    if args.metricas:
+        print(f"  métricas en: {args.metricas}")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Texto de un PDF extraído una sola vez, con vista cruda por página y vista normalizada.
+
+- ``texto``: las páginas tal cual (con saltos de línea), unidas sin separador.
+- ``normalizado``: saltos de línea convertidos en espacios y espacios
+  repetidos colapsados, como lo espera el extractor "factura". Se calcula
+  la primera vez que se pide, y el mapa de offsets solo si se usa posicion().
+- ``posicion(offset)``: página y línea (desde 0) de un carácter de la vista
+  normalizada, para volver al texto original sin tener que buscar otra vez;
+  ``posicion_texto(offset)`` hace lo mismo para la vista ``texto``.
+
+Con PDF_A_EXCEL_LECTURA=perezosa (por defecto "completa") los extractores
+leen las páginas en orden y paran en cuanto tienen todos los campos y
+tablas (leer_hasta_completar); las páginas sin leer quedan vacías, de modo
+que los números de página no cambian. Lo que aún falta se comprueba solo en
+la página recién leída (Completitud), no en todo lo leído.
+"""
+import os
+import re
+from bisect import bisect_right
+from functools import cached_property
+from itertools import accumulate
+
+import fitz  # PyMuPDF
+
+MODO_LECTURA = os.environ.get("PDF_A_EXCEL_LECTURA", "completa")
+
+_ESPACIOS_REPETIDOS = re.compile(r"\s{2,}")
+
+
+def normalizar(texto: str) -> str:
+    """Saltos de línea a espacios y blancos repetidos colapsados en uno."""
+    return _ESPACIOS_REPETIDOS.sub(" ", texto.replace("\n", " "))
+
+
+class TextoDocumento:
+    """Páginas de texto de un documento y sus vistas derivadas."""
+
+    def __init__(self, paginas, leidas=None):
+        self.paginas = list(paginas)
+        # Páginas cuyo texto se llegó a extraer (el resto quedan vacías)
+        self.paginas_leidas = len(self.paginas) if leidas is None else leidas
+
+    @classmethod
+    def desde_pdf(cls, pdf_bytes):
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return cls(page.get_text() for page in doc)
+
+    def lineas(self, pagina) -> list:
+        """Líneas sin normalizar de la página indicada (desde 0)."""
+        return self.paginas[pagina].splitlines()
+
+    @cached_property
+    def texto(self) -> str:
+        return "".join(self.paginas)
+
+    @cached_property
+    def _unido(self) -> str:
+        # Base de la vista normalizada: páginas separadas por un espacio
+        return " ".join(self.paginas)
+
+    @cached_property
+    def normalizado(self) -> str:
+        return normalizar(self._unido)
+
+    @cached_property
+    def _mapa_offsets(self):
+        """Inicios de cada tramo en la vista normalizada y sus equivalentes en _unido.
+
+        Solo los blancos de 2 o más caracteres cambian de longitud al
+        normalizar, así que basta un punto de corte por cada uno de ellos.
+        """
+        inicios_norm, inicios_unido = [0], [0]
+        recortado = 0
+        for match in _ESPACIOS_REPETIDOS.finditer(self._unido):
+            recortado += match.end() - match.start() - 1
+            inicios_unido.append(match.end())
+            inicios_norm.append(match.end() - recortado)
+        return inicios_norm, inicios_unido
+
+    @cached_property
+    def _inicios_pagina(self) -> list:
+        # Offset de cada página dentro de _unido (cada separador ocupa 1 carácter)
+        return [0] + list(accumulate(len(pagina) + 1 for pagina in self.paginas))[:-1]
+
+    def posicion(self, offset: int):
+        """(página, línea) del carácter ``offset`` de la vista normalizada."""
+        inicios_norm, inicios_unido = self._mapa_offsets
+        tramo = bisect_right(inicios_norm, offset) - 1
+        offset_unido = min(inicios_unido[tramo] + offset - inicios_norm[tramo], len(self._unido))
+        pagina = bisect_right(self._inicios_pagina, offset_unido) - 1
+        dentro = offset_unido - self._inicios_pagina[pagina]
+        return pagina, self.paginas[pagina].count("\n", 0, dentro)
+
+    def posicion_texto(self, offset: int):
+        """(página, línea) del carácter ``offset`` de la vista ``texto``."""
+        inicios = [0] + list(accumulate(len(pagina) for pagina in self.paginas))[:-1]
+        pagina = bisect_right(inicios, offset) - 1
+        return pagina, self.paginas[pagina].count("\n", 0, offset - inicios[pagina])
+
+
+def cierra_coincidencia(patron):
+    """Condición de Completitud: ``patron`` aparece y detrás de su coincidencia sigue más texto."""
+    def cumple(texto):
+        m = patron.search(texto)
+        return m is not None and m.end() < len(texto.rstrip())
+    return cumple
+
+
+class Completitud:
+    """Si las páginas leídas hasta ahora ya tienen todo lo que busca un extractor.
+
+    ``condiciones`` es {nombre: función(texto) -> bool}. Cada página se
+    comprueba junto con la anterior, por si algo queda partido entre las
+    dos, y solo contra las condiciones que aún no se han cumplido: el coste
+    de cada página no crece con lo ya leído. Con ``normalizada`` el texto se
+    normaliza antes, como la vista TextoDocumento.normalizado.
+    """
+
+    def __init__(self, condiciones: dict, normalizada=False):
+        self.pendientes = dict(condiciones)
+        self.normalizada = normalizada
+        self._anterior = ""
+
+    def anadir(self, pagina: str) -> bool:
+        """Comprueba la página recién leída; devuelve True si ya no falta nada."""
+        texto = normalizar(f"{self._anterior} {pagina}") if self.normalizada else self._anterior + pagina
+        self._anterior = pagina
+        for nombre in [nombre for nombre, cumple in self.pendientes.items() if cumple(texto)]:
+            del self.pendientes[nombre]
+        return not self.pendientes
+
+
+def leer_hasta_completar(doc, completo) -> TextoDocumento:
+    """Lee las páginas de ``doc`` en orden hasta que ``completo`` (una Completitud) no echa nada en falta."""
+    textos = []
+    for page in doc:
+        textos.append(page.get_text())
+        if completo.anadir(textos[-1]):
+            break
+    leidas = len(textos)
+    return TextoDocumento(textos + [""] * (doc.page_count - leidas), leidas)
@@ -0,0 +1,470 @@
+"""Exportación de las tablas del lote: Excel, CSV, Parquet y Arrow.
+
+- tablas_factura: las tablas del lote de las facturas "Nº de factura /
+  IMPORTE FACTURA" con tipos compactos (fechas datetime64, etiquetas
+  categóricas, float32 donde no se pierde nada), ordenadas por fecha y
+  con la tabla de totales por archivo calculada directamente (sin
+  escribir y releer un Excel).
+- excel_de_tablas / generar_excel_acumulado: libro en memoria con esas
+  tablas (lo usan las apps de Streamlit).
+- leer_acumulado / fusionar_acumulado: modo incremental. Un libro ya
+  exportado (con su hoja oculta de archivos procesados y el hash de cada
+  uno) se lee de vuelta; solo se procesan los PDF que no estén en él y sus
+  tablas se fusionan en orden de fecha, recalculando solo los totales de
+  los archivos nuevos.
+- exportar_tabla / zip_tablas: cada tabla en CSV, Parquet o Arrow (IPC), y
+  todas en un zip para descargar.
+- EscritorCSV, EscritorArrow y EscritorExcel: escritura en streaming a
+  disco; cada documento añade sus filas en cuanto termina y la memoria no
+  crece con el tamaño del lote. EscritorExcel usa el modo constant_memory
+  de xlsxwriter y EscritorArrow escribe por grupos de filas. Las filas
+  quedan en el orden de entrada: en streaming no se pueden reordenar
+  después.
+
+Parquet y Arrow necesitan pyarrow (dependencia opcional, en
+requirements-opcional.txt); sin él solo están CSV y Excel
+(formatos_disponibles). Todos los escritores reciben las tablas de
+tablas_documento, así que tienen las mismas columnas que el Excel, y las
+fechas como fechas: en CSV y Excel se escriben como dd/mm/aaaa
+(FORMATO_FECHA) y en Parquet y Arrow, como marcas de tiempo.
+"""
+import importlib.util
+import io
+import re
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+import xlsxwriter
+
+from acumulador import num_filas
+
+# Familia -> {tabla: hoja}; las mismas hojas que los libros de las apps
+HOJAS_EXCEL = {
+    "factura": {
+        "resumen": "Resumen Factura",
+        "activa": "Energía Activa",
+        "reactiva": "Energía Reactiva Inductiva",
+        "excesos": "Excesos Potencia",
+        "totales": "Totales por Archivo",
+    },
+    "endesa": {
+        "resumen": "Resumen Facturas",
+        "detalle": "Energía y Potencia",
+    },
+}
+# Hoja oculta con el nombre y el hash de cada PDF del libro (para el modo incremental)
+HOJA_ARCHIVOS = "Archivos procesados"
+# Columnas de fecha (dd/mm/aaaa) y de etiquetas repetidas en cada fila de las tablas "factura"
+COLUMNAS_FECHA_FACTURA = ["Periodo desde", "Periodo hasta", "Fecha emisión"]
+COLUMNAS_CATEGORIA = ["Archivo", "Periodo", "Tipo Lectura"]
+# Columna de totales por archivo -> (tabla, columna que se suma)
+TOTALES_FACTURA = {
+    "Total Consumo (kWh)": ("activa", "Consumo (kWh)"),
+    "Total Reactiva Inductiva (€)": ("reactiva", "A facturar Reactiva (€)"),
+    "Total Excesos Potencia (€)": ("excesos", "A facturar Exceso (€)"),
+}
+# Columnas de fecha de las hojas Endesa y columnas de detalle que se suman en su fila TOTAL
+COLUMNAS_FECHA_ENDESA = ["Inicio Facturación", "Fin Facturación"]
+TOTALES_ENDESA = [("Consumo", "Consumo kWh"), ("Importe Reactiva", "Importe Reactiva (€)"),
+                  ("Importe Potencia", "Importe Potencia (€)")]
+
+# Formato de las fechas en los CSV y en las celdas de Excel
+FORMATO_FECHA = "%d/%m/%Y"
+FORMATO_FECHA_EXCEL = "dd/mm/yyyy"
+
+# Formato -> extensión de los archivos
+FORMATOS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+# Filas que EscritorArrow junta antes de escribir un grupo
+FILAS_POR_GRUPO = 50_000
+
+_PERIODO_ENDESA = re.compile(r"(\d{2}/\d{2}/\d{4})\s+al\s+(\d{2}/\d{2}/\d{4})")
+
+
+def formatos_disponibles() -> list:
+    """Formatos de FORMATOS que se pueden escribir con los paquetes instalados."""
+    con_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    return [formato for formato in FORMATOS if formato == "csv" or con_pyarrow]
+
+
+# ---------------------- TABLAS DEL LOTE ----------------------
+def compactar(df: pd.DataFrame) -> pd.DataFrame:
+    """Tipos compactos para las tablas del lote.
+
+    - Las fechas (COLUMNAS_FECHA_FACTURA) se analizan una sola vez a
+      datetime64. Solo se formatean como dd/mm/aaaa al escribir el Excel
+      (date_format) y los CSV.
+    - Las etiquetas que se repiten en cada fila (archivo, periodo...) pasan
+      a categóricas.
+    - Las cifras pasan a float32 solo si todas caben sin perder nada. Los
+      importes con céntimos no caben y siguen en float64: en float32,
+      1234.56 se escribiría como 1234.56005859375.
+    """
+    df = df.copy()
+    for columna in COLUMNAS_FECHA_FACTURA:
+        if columna in df and not pd.api.types.is_datetime64_any_dtype(df[columna]):
+            df[columna] = pd.to_datetime(df[columna], format=FORMATO_FECHA, errors="coerce")
+    for columna in COLUMNAS_CATEGORIA:
+        if columna in df:
+            df[columna] = df[columna].astype("category")
+    for columna in df.select_dtypes("float64"):
+        reducida = df[columna].astype("float32")
+        if reducida.astype("float64").equals(df[columna]):
+            df[columna] = reducida
+    return df
+
+
+def _ordenar_por_fecha(df: pd.DataFrame) -> pd.DataFrame:
+    """Ordena por "Periodo desde" si la columna existe, sin mezclar filas de igual fecha."""
+    return df.sort_values("Periodo desde", kind="stable") if "Periodo desde" in df else df
+
+
+def _suma_por_archivo(df, columna, columna_total) -> pd.DataFrame:
+    if columna not in df:
+        return pd.DataFrame(columns=["Archivo", columna_total])
+    # En float64: las columnas en float32 no deben acumular error al sumar
+    suma = df[columna].astype("float64").groupby(df["Archivo"], observed=True).sum()
+    return suma.rename(columna_total).reset_index()
+
+
+def totales_por_archivo(df_activa, df_reactiva, df_excesos) -> pd.DataFrame:
+    """Consumo, reactiva y excesos sumados por archivo."""
+    tablas = {"activa": df_activa, "reactiva": df_reactiva, "excesos": df_excesos}
+    totales = None
+    for columna_total, (tabla, columna) in TOTALES_FACTURA.items():
+        parte = _suma_por_archivo(tablas[tabla], columna, columna_total)
+        totales = parte if totales is None else totales.merge(parte, on="Archivo", how="outer")
+    totales["Archivo"] = totales["Archivo"].astype(str)
+    return totales.fillna(0)
+
+
+def tablas_factura(df_resumenes, df_activa, df_reactiva, df_excesos) -> dict:
+    """{tabla: DataFrame} del lote, compactas (compactar), ordenadas por fecha y con "totales" por archivo."""
+    tablas = {tabla: _ordenar_por_fecha(compactar(df)) for tabla, df in
+              (("resumen", df_resumenes), ("activa", df_activa), ("reactiva", df_reactiva), ("excesos", df_excesos))}
+    tablas["totales"] = totales_por_archivo(tablas["activa"], tablas["reactiva"], tablas["excesos"])
+    return tablas
+
+
+def tablas_documento(familia, tablas, nombre_archivo) -> dict:
+    """Tablas de un documento como se exportan, iguales en CSV, Parquet, Arrow y Excel.
+
+    En la familia "factura" las fechas pasan a datetime (_fechas_factura) y
+    se añade su fila de "totales"; en "endesa", el periodo (Inicio/Fin
+    Facturación, ya como datetime) y el Archivo en cada tabla (_tablas_endesa),
+    para que las filas de un lote se puedan atribuir a su PDF.
+    """
+    if familia == "endesa":
+        return _tablas_endesa(tablas, nombre_archivo)
+    if familia != "factura" or "totales" in tablas:
+        return tablas
+    tablas = _fechas_factura(tablas)
+    totales = {"Archivo": [nombre_archivo]}
+    for columna_total, (tabla, columna) in TOTALES_FACTURA.items():
+        totales[columna_total] = [sum(v for v in tablas[tabla].get(columna, []) if pd.notna(v))]
+    return {**tablas, "totales": totales}
+
+
+def _fecha(valor):
+    """datetime de una fecha dd/mm/aaaa; None si no es válida."""
+    try:
+        return datetime.strptime(valor, FORMATO_FECHA)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fechas_factura(tablas) -> dict:
+    """Tablas "factura" con las columnas COLUMNAS_FECHA_FACTURA como datetime, igual que en compactar."""
+    return {tabla: {columna: [_fecha(v) for v in valores] if columna in COLUMNAS_FECHA_FACTURA else valores
+                    for columna, valores in columnas.items()}
+            for tabla, columnas in tablas.items()}
+
+
+# ---------------------- LIBRO EN MEMORIA ----------------------
+def excel_de_tablas(tablas, archivos=None) -> bytes:
+    """Libro xlsx con una hoja por tabla de tablas_factura().
+
+    Con ``archivos`` ({nombre: hash}) se añade la hoja oculta HOJA_ARCHIVOS
+    que permite ampliar el libro más adelante (leer_acumulado).
+    """
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter', date_format=FORMATO_FECHA_EXCEL,
+                        datetime_format=FORMATO_FECHA_EXCEL) as writer:
+        for tabla, hoja in HOJAS_EXCEL["factura"].items():
+            tablas[tabla].to_excel(writer, sheet_name=hoja, index=False)
+        if archivos:
+            pd.DataFrame({"Archivo": list(archivos), "Hash": list(archivos.values())}).to_excel(
+                writer, sheet_name=HOJA_ARCHIVOS, index=False)
+            writer.sheets[HOJA_ARCHIVOS].hide()
+    return output.getvalue()
+
+
+def generar_excel_acumulado(df_resumenes, df_activa, df_reactiva, df_excesos):
+    return excel_de_tablas(tablas_factura(df_resumenes, df_activa, df_reactiva, df_excesos))
+
+
+# ---------------------- ACUMULADO INCREMENTAL ----------------------
+def leer_acumulado(contenido) -> tuple:
+    """(tablas, archivos) de un libro ya exportado: {tabla: DataFrame} y {nombre: hash}.
+
+    En libros sin la hoja HOJA_ARCHIVOS el hash de cada archivo del resumen es None.
+    """
+    # dtype=object conserva como texto las celdas de texto con cifras (nº de contrato, CUPS...)
+    hojas = {hoja: df.infer_objects()
+             for hoja, df in pd.read_excel(io.BytesIO(contenido), sheet_name=None, dtype=object).items()}
+    tablas = {tabla: compactar(hojas.get(hoja, pd.DataFrame())) for tabla, hoja in HOJAS_EXCEL["factura"].items()}
+    if HOJA_ARCHIVOS in hojas:
+        archivos = dict(zip(hojas[HOJA_ARCHIVOS]["Archivo"], hojas[HOJA_ARCHIVOS]["Hash"]))
+    else:
+        archivos = dict.fromkeys(tablas["resumen"].get("Archivo", []))
+    return tablas, archivos
+
+
+def ya_acumulado(archivos, nombre_archivo, hash_archivo) -> bool:
+    """Si el PDF ya está en el libro: por hash o, en libros sin hashes, por nombre."""
+    return hash_archivo in archivos.values() or (nombre_archivo in archivos and archivos[nombre_archivo] is None)
+
+
+def fusionar_acumulado(acumulado, nuevas) -> dict:
+    """Tablas de un libro acumulado con las de tablas_factura() de los documentos nuevos.
+
+    Las filas de un archivo que vuelve a procesarse (mismo nombre, otro
+    contenido) sustituyen a las anteriores. Cada tabla queda en orden de
+    fecha, con las filas del libro delante a igual fecha, y de los totales
+    solo cambian los de los archivos nuevos.
+    """
+    archivos = set()
+    for df in nuevas.values():
+        if "Archivo" in df:
+            archivos.update(df["Archivo"])
+    tablas = {}
+    for tabla, df in nuevas.items():
+        anterior = acumulado.get(tabla, pd.DataFrame())
+        if "Archivo" in anterior:
+            anterior = anterior[~anterior["Archivo"].isin(archivos)]
+        partes = [parte for parte in (anterior, df) if not parte.empty]
+        # Categorías distintas en cada parte: se unen como texto y se vuelven a compactar
+        fusion = compactar(pd.concat(partes, ignore_index=True)) if partes else df
+        tablas[tabla] = _ordenar_por_fecha(fusion).reset_index(drop=True)
+    if "Archivo" in tablas["totales"]:
+        tablas["totales"] = tablas["totales"].sort_values("Archivo", kind="stable", ignore_index=True)
+    return tablas
+
+
+# ---------------------- FORMATOS COLUMNARES ----------------------
+def exportar_tabla(df: pd.DataFrame, formato) -> bytes:
+    """Contenido del archivo de ``df`` en el formato indicado (ver FORMATOS)."""
+    salida = io.BytesIO()
+    if formato == "csv":
+        # Con BOM, como los CSV del convertidor, para que Excel lea bien los acentos
+        salida.write(df.to_csv(index=False, date_format=FORMATO_FECHA).encode("utf-8-sig"))
+    elif formato == "parquet":
+        df.to_parquet(salida, index=False)
+    elif formato == "arrow":
+        df.reset_index(drop=True).to_feather(salida)
+    else:
+        raise ValueError(f"formato de exportación desconocido: {formato}")
+    return salida.getvalue()
+
+
+def zip_tablas(tablas, formatos) -> bytes:
+    """Zip con cada tabla ({nombre: DataFrame}) en cada uno de los formatos."""
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as comprimido:
+        for formato in formatos:
+            for nombre, df in tablas.items():
+                comprimido.writestr(f"{nombre}{FORMATOS[formato]}", exportar_tabla(df, formato))
+    return salida.getvalue()
+
+
+# ---------------------- ESCRITURA EN STREAMING ----------------------
+class EscritorCSV:
+    """Un CSV por tabla, abierto durante todo el lote y con la cabecera del primer documento."""
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        self._archivos = {}
+        self._columnas = {}
+
+    def escribir(self, tablas: dict):
+        for nombre, columnas in tablas.items():
+            df = pd.DataFrame(columnas)
+            if df.empty:
+                continue
+            if nombre not in self._archivos:
+                self._archivos[nombre] = open(self.carpeta / f"{nombre}.csv", "w",
+                                              encoding="utf-8-sig", newline="")
+                self._columnas[nombre] = list(df.columns)
+                df.to_csv(self._archivos[nombre], index=False, date_format=FORMATO_FECHA)
+            else:
+                df.reindex(columns=self._columnas[nombre]).to_csv(self._archivos[nombre], index=False,
+                                                                  header=False, date_format=FORMATO_FECHA)
+            self._archivos[nombre].flush()
+
+    def cerrar(self):
+        for archivo in self._archivos.values():
+            archivo.close()
+
+
+class EscritorArrow:
+    """Un archivo Parquet o Arrow (IPC) por tabla, escrito por grupos de ``filas_por_grupo`` filas.
+
+    El esquema lo fija el primer grupo de cada tabla (una columna todavía sin
+    valores se guarda como texto) y las columnas que no estén en él se
+    descartan, como en los CSV. Solo queda en memoria el grupo en curso.
+    """
+
+    def __init__(self, carpeta, formato, filas_por_grupo=FILAS_POR_GRUPO):
+        import pyarrow  # dependencia opcional
+        import pyarrow.ipc
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self.carpeta = carpeta
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        self.formato = formato
+        self.filas_por_grupo = filas_por_grupo
+        self._pendientes = {}   # tabla -> {columna: [valores]} del grupo en curso
+        self._escritores = {}   # tabla -> (escritor de pyarrow, esquema)
+
+    def escribir(self, tablas: dict):
+        for nombre, columnas in tablas.items():
+            n = num_filas(columnas)
+            if not n:
+                continue
+            pendiente = self._pendientes.setdefault(nombre, {columna: [] for columna in columnas})
+            for columna, valores in pendiente.items():
+                valores.extend(columnas.get(columna, [None] * n))
+            if num_filas(pendiente) >= self.filas_por_grupo:
+                self._volcar(nombre)
+
+    def _volcar(self, nombre):
+        pa = self._pa
+        pendiente = self._pendientes[nombre]
+        if not num_filas(pendiente):
+            return
+        if nombre not in self._escritores:
+            esquema = pa.schema([pa.field(campo.name, pa.string()) if pa.types.is_null(campo.type) else campo
+                                 for campo in pa.Table.from_pydict(pendiente).schema])
+            ruta = str(self.carpeta / f"{nombre}{FORMATOS[self.formato]}")
+            escritor = (pa.parquet.ParquetWriter(ruta, esquema) if self.formato == "parquet"
+                        else pa.ipc.new_file(ruta, esquema))
+            self._escritores[nombre] = (escritor, esquema)
+        escritor, esquema = self._escritores[nombre]
+        for campo in esquema:
+            if pa.types.is_string(campo.type):
+                pendiente[campo.name] = [None if v is None else str(v) for v in pendiente[campo.name]]
+        escritor.write_table(pa.Table.from_pydict(pendiente, schema=esquema))
+        self._pendientes[nombre] = {columna: [] for columna in pendiente}
+
+    def cerrar(self):
+        for nombre in self._pendientes:
+            self._volcar(nombre)
+        for escritor, _ in self._escritores.values():
+            escritor.close()
+
+
+def crear_escritor(carpeta, formato):
+    """Escritor en streaming de las tablas en ``carpeta`` con el formato indicado."""
+    return EscritorCSV(carpeta) if formato == "csv" else EscritorArrow(carpeta, formato)
+
+
+def _fechas_periodo(periodo):
+    """(inicio, fin) como datetime de "dd/mm/aaaa al dd/mm/aaaa"; (None, None) si no se reconoce."""
+    fechas = _PERIODO_ENDESA.search(periodo or "")
+    if fechas is None:
+        return None, None
+    return tuple(_fecha(fecha) for fecha in fechas.groups())
+
+
+def _tablas_endesa(tablas, nombre_archivo):
+    """Tablas Endesa como en app2mejorada: Inicio/Fin Facturación delante y Archivo al final."""
+    if "Archivo" in tablas["resumen"]:
+        return tablas
+    inicio, fin = _fechas_periodo(tablas["resumen"]["Periodo Facturación"][0])
+    salida = {}
+    for tabla, columnas in tablas.items():
+        n = num_filas(columnas)
+        salida[tabla] = {"Inicio Facturación": [inicio] * n, "Fin Facturación": [fin] * n,
+                         **{c: v for c, v in columnas.items() if c != "Periodo Facturación"},
+                         "Archivo": [nombre_archivo] * n}
+    return salida
+
+
+class EscritorExcel:
+    """Libro Excel escrito fila a fila (constant_memory), con una hoja por tabla de cada familia.
+
+    Cada hoja toma la cabecera del primer documento que le aporta filas;
+    las columnas que no estén en ella se descartan, como en los CSV.
+    """
+
+    def __init__(self, destino):
+        self.libro = xlsxwriter.Workbook(destino, {"constant_memory": True})
+        self._negrita = self.libro.add_format({"bold": True})
+        self._fecha = self.libro.add_format({"num_format": FORMATO_FECHA_EXCEL})
+        self._numero = self.libro.add_format({"num_format": "#,##0.00"})
+        self._hojas = {}        # nombre de hoja -> [worksheet, columnas, siguiente fila]
+        self._totales_endesa = None
+        self._archivos = {}     # nombre -> hash, para HOJA_ARCHIVOS
+
+    def _hoja(self, nombre, columnas):
+        if nombre not in self._hojas:
+            hoja = self.libro.add_worksheet(nombre)
+            hoja.write_row(0, 0, columnas)
+            for i, columna in enumerate(columnas):
+                if columna in COLUMNAS_FECHA_ENDESA + COLUMNAS_FECHA_FACTURA:
+                    hoja.set_column(i, i, 15, self._fecha)
+            self._hojas[nombre] = [hoja, list(columnas), 1]
+        return self._hojas[nombre]
+
+    def _escribir(self, nombre, columnas: dict):
+        n = num_filas(columnas)
+        if not n:
+            return
+        entrada = self._hoja(nombre, list(columnas))
+        hoja, cabecera, fila = entrada
+        valores = [columnas.get(columna, [None] * n) for columna in cabecera]
+        for i in range(n):
+            for j, columna in enumerate(valores):
+                valor = columna[i]
+                if isinstance(valor, datetime):
+                    hoja.write_datetime(fila, j, valor, self._fecha)
+                elif valor is not None and valor == valor:     # NaN: cifra no válida, celda vacía
+                    hoja.write(fila, j, valor)
+            fila += 1
+        entrada[2] = fila
+
+    def anadir(self, familia, tablas, nombre_archivo, hash_archivo=None):
+        """Escribe las tablas de un documento en las hojas de su familia."""
+        if hash_archivo is not None:
+            self._archivos[nombre_archivo] = hash_archivo
+        tablas = tablas_documento(familia, tablas, nombre_archivo)
+        if familia == "endesa":
+            if self._totales_endesa is None:
+                self._totales_endesa = [0.0] * len(TOTALES_ENDESA)
+            for i, (_, columna) in enumerate(TOTALES_ENDESA):
+                self._totales_endesa[i] += sum(v for v in tablas["detalle"][columna] if pd.notna(v))
+        for tabla, hoja in HOJAS_EXCEL[familia].items():
+            if tabla in tablas:
+                self._escribir(hoja, tablas[tabla])
+
+    def _escribir_totales_endesa(self):
+        """Fila TOTAL bajo el detalle Endesa, en las mismas celdas que el libro de app2mejorada."""
+        hoja, columnas, fila = self._hojas[HOJAS_EXCEL["endesa"]["detalle"]]
+        for i, columna in enumerate(columnas):
+            if columna not in COLUMNAS_FECHA_ENDESA + ["Periodo", "Archivo"]:
+                hoja.set_column(i, i, 15, self._numero)
+        desplazamiento = 2
+        for i, (etiqueta, _) in enumerate(TOTALES_ENDESA, 1):
+            hoja.write(fila, desplazamiento + i, etiqueta, self._negrita)
+        hoja.write(fila + 1, desplazamiento, "TOTAL", self._negrita)
+        for i, total in enumerate(self._totales_endesa, 1):
+            hoja.write_number(fila + 1, desplazamiento + i, total, self._numero)
+
+    def cerrar(self):
+        if self._totales_endesa is not None and HOJAS_EXCEL["endesa"]["detalle"] in self._hojas:
+            self._escribir_totales_endesa()
+        if self._archivos:
+            self._escribir(HOJA_ARCHIVOS, {"Archivo": list(self._archivos), "Hash": list(self._archivos.values())})
+            self._hojas[HOJA_ARCHIVOS][0].hide()
+        self.libro.close()
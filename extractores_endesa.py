@@ -0,0 +1,292 @@
+"""Lectura y extracción de datos de las facturas Endesa ("Factura nº / Total Factura").
+
+No depende de Streamlit: los mensajes para el usuario se devuelven en la
+lista ``avisos`` como pares (nivel, mensaje).
+"""
+import re
+
+import fitz  # PyMuPDF
+
+from acumulador import filas_a_columnas, num_filas
+from cascada import comprobar_campos, comprobar_importes, comprobar_periodo, comprobar_tabla, importe_es
+from campos import BuscadorCampos
+from documento import MODO_LECTURA, Completitud, TextoDocumento, cierra_coincidencia
+from metricas import medir
+from ocr import aplicar_ocr_a_paginas, pagina_escaneada
+from plantillas import aprender_regiones, huella_formato, leer_regiones, paginas_plantilla
+from tablas_layout import MODO_TABLAS, convertir_columnas, leer_filas
+
+# Cambiar al modificar cualquier extractor: invalida los resultados en caché
+VERSION_EXTRACTOR = "endesa-4"
+if MODO_TABLAS != "regex":
+    VERSION_EXTRACTOR += f"+{MODO_TABLAS}"
+if MODO_LECTURA != "completa":
+    VERSION_EXTRACTOR += f"+{MODO_LECTURA}"
+
+# Textos que identifican el formato en su primera página (deben estar todos)
+MARCAS_FORMATO = ("Factura nº:", "Total Factura")
+
+COLUMNAS_DETALLE = [
+    "Periodo", "Consumo kWh", "Reactiva (kVArh)", "Exceso Reactiva", "Cosφ",
+    "Importe Reactiva (€)", "Potencia Contratada", "Max. Registrada", "Kp", "Te",
+    "Excesos Potencia", "Importe Potencia (€)",
+]
+
+
+def _avisar(avisos, nivel, mensaje):
+    if avisos is not None:
+        avisos.append((nivel, mensaje))
+
+# -------------------- LECTURA PDF --------------------
+
+def obtener_documento_pdf(pdf_bytes, nombre_archivo, avisos=None, completo=None, ocr=True, informe=None):
+    """TextoDocumento del PDF página a página; solo las páginas escaneadas pasan por OCR.
+
+    Con ``completo`` (una Completitud nueva, que recibe cada página con capa
+    de texto) la lectura se detiene en cuanto no falta nada. El OCR de las
+    páginas escaneadas se deja para el final y solo se hace si el documento
+    no se completa sin ellas. Con ``ocr=False`` las escaneadas se quedan con
+    la poca capa de texto que tengan. En ``informe`` se anota
+    paginas_escaneadas (de las páginas vistas).
+    """
+    with medir(informe, "abrir"):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    with doc:
+        return _leer_documento(doc, pdf_bytes, nombre_archivo, avisos, completo, ocr, informe)
+
+def _leer_documento(doc, pdf_bytes, nombre_archivo, avisos, completo, ocr, informe):
+    """Como obtener_documento_pdf, sobre el documento ya abierto."""
+    with medir(informe, "lectura"):
+        total = doc.page_count
+        textos, paginas_ocr = [], []
+        for page in doc:
+            textos.append(page.get_text())
+            if pagina_escaneada(page, textos[-1]):
+                paginas_ocr.append(page.number)
+            elif completo is not None and completo.anadir(textos[-1]):
+                # Completo sin el OCR de las escaneadas vistas hasta aquí
+                if informe is not None:
+                    informe["paginas_escaneadas"] = len(paginas_ocr)
+                if paginas_ocr:
+                    lista = ", ".join(str(numero + 1) for numero in paginas_ocr)
+                    _avisar(avisos, "info", f"⏭️ Páginas escaneadas sin OCR en {nombre_archivo}: {lista} "
+                                            "(los datos ya estaban en las demás)")
+                leidas = len(textos) - len(paginas_ocr)
+                return TextoDocumento(textos + [""] * (total - len(textos)), leidas)
+
+    if informe is not None:
+        informe["paginas_escaneadas"] = len(paginas_ocr)
+    if paginas_ocr and not ocr:
+        lista = ", ".join(str(numero + 1) for numero in paginas_ocr)
+        _avisar(avisos, "info", f"⏭️ Páginas escaneadas sin OCR en {nombre_archivo}: {lista}")
+        return TextoDocumento(textos, len(textos) - len(paginas_ocr))
+    if paginas_ocr:
+        lista = ", ".join(str(numero + 1) for numero in paginas_ocr)
+        _avisar(avisos, "info", f"🧐 Páginas escaneadas en {nombre_archivo}: {lista}. Aplicando OCR...")
+        with medir(informe, "ocr"):
+            textos_ocr = aplicar_ocr_a_paginas(pdf_bytes, paginas_ocr, avisos)
+        for numero, texto_ocr in textos_ocr.items():
+            textos[numero] = texto_ocr
+        if informe is not None:
+            informe["paginas_ocr"] = len(textos_ocr)
+    return TextoDocumento(textos)
+
+def obtener_texto_pdf(pdf_bytes, nombre_archivo, avisos=None):
+    """Texto crudo (con saltos de línea) del PDF, con OCR de las páginas escaneadas."""
+    return obtener_documento_pdf(pdf_bytes, nombre_archivo, avisos).texto
+
+# -------------------- FUNCIONES DE EXTRACCIÓN --------------------
+
+CAMPOS_GENERALES = BuscadorCampos({
+    "Factura nº": r"Factura nº:\s*([A-Z0-9]+)",
+    "Fecha Factura": r"Fecha Factura:\s*([\d/]+)",
+    "Periodo Facturación": r"Periodo facturación:\s*([\d/]+\s+al\s+[\d/]+)",
+    "Total Factura": r"Total Factura\s*([\d.,]+)\s*€",
+    "Cliente": r"Razón Social:\s*(.+)",
+    "NIF/CIF": r"NIF/CIF:\s*([A-Z0-9]+)",
+    "Dirección Fiscal": r"Dir\.Fiscal:\s*(.+)",
+    "Dirección Suministro": r"Dir\.Suministro:\s*(.+)",
+    "CUPS": r"CUPS:\s*([A-Z0-9]+)",
+    "Contrato Nº": r"Contrato nº:\s*([0-9]+)",
+    "Modalidad de Contrato": r"Modalidad de Contrato:\s*(.+)",
+    "Fecha Límite de Pago": r"antes del\s*([\d/]+)"
+})
+
+def extraer_datos_generales(texto):
+    return CAMPOS_GENERALES.buscar(texto)
+
+PATRON_DETALLE = re.compile(
+    r"Periodo\s+([1-6])(?:\s+Capacitiva)?\s+" +
+    r"([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+" +
+    r"([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+([\d.,]+)\s+" +
+    r"([\d.,]+)"
+)
+
+def _convertir_numeros(detalle, nombre_archivo, avisos):
+    """Convierte las cifras del detalle; avisa de las celdas que no son un número (quedan en NaN)."""
+    errores = convertir_columnas(detalle, COLUMNAS_DETALLE[1:])
+    if errores:
+        celdas = "; ".join(f"{detalle['Periodo'][fila]} {columna} «{celda}»" for fila, columna, celda in errores)
+        _avisar(avisos, "warning", f"⚠️ Cifras no válidas en el detalle de {nombre_archivo}: {celdas}")
+    return detalle
+
+def extraer_tabla_energia_y_potencia(texto, nombre_archivo=None, avisos=None):
+    """Filas P1 a P6 de energía y potencia como {columna: [valores]}."""
+    # El primer grupo es el número de periodo; el resto, las cifras en el orden de COLUMNAS_DETALLE
+    filas = [{"Periodo": f"P{match.group(1)}", **dict(zip(COLUMNAS_DETALLE[1:], match.groups()[1:]))}
+             for match in PATRON_DETALLE.finditer(texto)]
+    return _convertir_numeros(filas_a_columnas(filas, COLUMNAS_DETALLE), nombre_archivo, avisos)
+
+def extraer_tabla_energia_y_potencia_layout(page, nombre_archivo=None, avisos=None):
+    """Como extraer_tabla_energia_y_potencia, pero por posición de las palabras; None si no se reconoce."""
+    filas = leer_filas(page, "Periodo 1", r"Periodo", len(COLUMNAS_DETALLE))
+    if filas is None:
+        return None
+    # La primera celda es el número de periodo; el resto, las cifras en el orden de COLUMNAS_DETALLE
+    return _convertir_numeros(filas_a_columnas(
+        [{"Periodo": f"P{celdas[0]}", **dict(zip(COLUMNAS_DETALLE[1:], celdas[1:]))} for _, celdas in filas],
+        COLUMNAS_DETALLE,
+    ), nombre_archivo, avisos)
+
+def _detalle_cerrado(texto):
+    filas = list(PATRON_DETALLE.finditer(texto))
+    return bool(filas) and filas[-1].end() < len(texto.rstrip())
+
+def completitud() -> Completitud:
+    """Completitud de los campos y de la tabla de periodos cerrada, para la lectura perezosa.
+
+    La tabla está cerrada cuando tras su última fila sigue más texto, y un
+    campo cuando su coincidencia no llega al final de lo leído.
+    """
+    condiciones = {campo: cierra_coincidencia(patron) for campo, patron in CAMPOS_GENERALES.patrones.items()}
+    condiciones["detalle"] = _detalle_cerrado
+    return Completitud(condiciones)
+
+# -------------------- VALIDACIÓN --------------------
+
+CAMPOS_OBLIGATORIOS = ("Factura nº", "Periodo Facturación", "Total Factura", "CUPS")
+
+def validar_tablas(texto, tablas) -> list:
+    """Problemas de lo extraído (vacío si cuadra): campos, periodo, filas P1-P6 e importes frente al total."""
+    resumen = {campo: valores[0] for campo, valores in tablas["resumen"].items()}
+    problemas = comprobar_campos(resumen, CAMPOS_OBLIGATORIOS)
+    if resumen["Periodo Facturación"]:
+        desde, _, hasta = " ".join(resumen["Periodo Facturación"].split()).partition(" al ")
+        problemas += comprobar_periodo(desde, hasta)
+    total = importe_es(resumen["Total Factura"])
+    if resumen["Total Factura"] and total is None:
+        problemas.append(f"total de la factura no válido ({resumen['Total Factura']})")
+    detalle = tablas["detalle"]
+    problemas += comprobar_tabla(detalle, "detalle")
+    problemas += comprobar_importes(detalle["Importe Reactiva (€)"] + detalle["Importe Potencia (€)"], total,
+                                    "la suma de importes de reactiva y potencia")
+    return problemas
+
+# -------------------- PLANTILLA DEL FORMATO --------------------
+
+def _extraer_con_plantilla(doc, plantilla, nombre_archivo=None, avisos=None):
+    """(texto, tablas) leyendo solo las regiones de la plantilla, o None si el documento no cuadra."""
+    textos = leer_regiones(doc, plantilla["regiones"])
+    if textos is None:
+        return None
+    resumen_dict = CAMPOS_GENERALES.buscar_en(textos)
+    if resumen_dict is None:
+        return None
+    avisos_detalle = []
+    detalle = extraer_tabla_energia_y_potencia(textos["detalle"], nombre_archivo, avisos_detalle)
+    if num_filas(detalle) != plantilla["filas"]["detalle"]:
+        return None
+    if avisos is not None:
+        avisos.extend(avisos_detalle)
+    resumen = {campo: [valor] for campo, valor in resumen_dict.items()}
+    return "\n".join(textos.values()), {"resumen": resumen, "detalle": detalle}
+
+def _aprender_plantilla(doc, documento, tablas):
+    """Plantilla del formato a partir de una extracción completa, o None si no sirve.
+
+    Solo se acepta si leyendo únicamente sus regiones se obtienen las mismas tablas.
+    """
+    tramos = CAMPOS_GENERALES.tramos(documento.texto)
+    filas = list(PATRON_DETALLE.finditer(documento.texto))
+    if tramos is None or not filas:
+        return None
+    tramos["detalle"] = (filas[0].start(), filas[-1].end())
+
+    regiones = aprender_regiones(doc, tramos, documento.posicion_texto)
+    if regiones is None:
+        return None
+    plantilla = {"regiones": regiones, "filas": {"detalle": num_filas(tablas["detalle"])}}
+    comprobacion = _extraer_con_plantilla(doc, plantilla)
+    return plantilla if comprobacion is not None and comprobacion[1] == tablas else None
+
+# -------------------- FACTURA COMPLETA --------------------
+
+def extraer_tablas(pdf_bytes, nombre_archivo, avisos=None, modo=None, plantillas=None, lectura=None,
+                   informe=None, ocr=True):
+    """Lee el PDF (con OCR si hace falta) y devuelve (texto, {"resumen", "detalle"}).
+
+    Cada tabla es un dict {columna: [valores]}; el resumen tiene una sola fila.
+    Con modo "layout" el detalle se lee por posición de las palabras (si la
+    página de la tabla tiene capa de texto); si no, con la expresión regular.
+
+    Con ``plantillas`` (un AlmacenPlantillas), un documento de formato ya
+    conocido se lee solo en las regiones de su plantilla, sin OCR de las
+    demás páginas; si no cuadra, se lee completo y se reaprende.
+
+    Con lectura "perezosa" se dejan de leer páginas en cuanto están todos
+    los campos y la tabla (completitud), y las páginas escaneadas solo
+    pasan por OCR si sin ellas no se completa. Con ``ocr=False`` no pasan
+    nunca. En ``informe`` (un dict), si se pasa, se anotan paginas_leidas,
+    paginas_total y paginas_escaneadas.
+    """
+    with medir(informe, "abrir"):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    with doc:
+        if informe is not None:
+            informe["paginas_total"] = doc.page_count
+        if plantillas is not None:
+            huella = huella_formato(doc, "endesa")
+            plantilla = plantillas.obtener(huella, VERSION_EXTRACTOR)
+            if plantilla is not None:
+                with medir(informe, "plantilla"):
+                    resultado = _extraer_con_plantilla(doc, plantilla, nombre_archivo, avisos)
+                plantillas.anotar(huella, VERSION_EXTRACTOR, resultado is not None)
+                if resultado is not None:
+                    if informe is not None:
+                        informe["paginas_leidas"] = len(paginas_plantilla(plantilla))
+                    return resultado
+                _avisar(avisos, "info", f"🧩 {nombre_archivo} no cuadra con la plantilla de su formato; "
+                                        "se lee completo")
+
+        perezosa = (lectura or MODO_LECTURA) == "perezosa"
+        documento = _leer_documento(doc, pdf_bytes, nombre_archivo, avisos,
+                                    completitud() if perezosa else None, ocr, informe)
+        if perezosa:
+            _avisar(avisos, "info", f"📄 Páginas leídas en {nombre_archivo}: {documento.paginas_leidas} "
+                                    f"de {len(documento.paginas)}")
+        if informe is not None:
+            informe["paginas_leidas"] = documento.paginas_leidas
+        texto = documento.texto
+        if not texto.strip():
+            raise ValueError(f"No se pudo extraer texto del archivo: {nombre_archivo}")
+
+        with medir(informe, "campos"):
+            resumen_dict = extraer_datos_generales(texto)
+        detalle = None
+        with medir(informe, "tablas"):
+            if (modo or MODO_TABLAS) == "layout":
+                pagina = next((i for i, t in enumerate(documento.paginas) if PATRON_DETALLE.search(t)), None)
+                if pagina is not None:
+                    detalle = extraer_tabla_energia_y_potencia_layout(doc[pagina], nombre_archivo, avisos)
+                    if detalle is None:
+                        _avisar(avisos, "info", f"📐 Tabla de periodos no reconocida por posición en {nombre_archivo}; se usa el texto")
+            if detalle is None:
+                detalle = extraer_tabla_energia_y_potencia(texto, nombre_archivo, avisos)
+        resumen = {campo: [valor] for campo, valor in resumen_dict.items()}
+        tablas = {"resumen": resumen, "detalle": detalle}
+
+        if plantillas is not None:
+            plantilla = _aprender_plantilla(doc, documento, tablas)
+            if plantilla is not None:
+                plantillas.guardar(huella, VERSION_EXTRACTOR, "endesa", plantilla)
+    return texto, tablas
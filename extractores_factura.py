@@ -0,0 +1,500 @@
+"""Lectura y extracción de datos de las facturas con formato "Nº de factura / IMPORTE FACTURA".
+
+No depende de Streamlit: los mensajes para el usuario se devuelven en la
+lista ``avisos`` como pares (nivel, mensaje), donde nivel es el nombre de
+la función de Streamlit que debe mostrarlos ("warning", "info"...).
+"""
+import re
+
+import fitz            # PyMuPDF
+
+from acumulador import filas_a_columnas, num_filas
+from campos import BuscadorCampos
+from cascada import (comprobar_campos, comprobar_importes, comprobar_periodo, comprobar_tabla, fecha_es,
+                     importe_es)
+from documento import (MODO_LECTURA, Completitud, TextoDocumento, cierra_coincidencia, leer_hasta_completar,
+                       normalizar)
+from metricas import medir
+from ocr import aplicar_ocr_a_paginas, pagina_escaneada
+from plantillas import aprender_regiones, huella_formato, leer_regiones, paginas_plantilla
+from tablas_layout import MODO_TABLAS, convertir_columnas, leer_filas, palabras_pagina
+
+# Cambiar al modificar cualquier extractor: invalida los resultados en caché
+VERSION_EXTRACTOR = "factura-5"
+if MODO_TABLAS != "regex":
+    VERSION_EXTRACTOR += f"+{MODO_TABLAS}"
+if MODO_LECTURA != "completa":
+    VERSION_EXTRACTOR += f"+{MODO_LECTURA}"
+
+# Textos que identifican el formato en su primera página (deben estar todos)
+MARCAS_FORMATO = ("Nº de factura:", "IMPORTE FACTURA:")
+
+# Columnas de cada tabla; las tablas se devuelven como {columna: [valores]}
+COLUMNAS_ACTIVA = [
+    "Archivo", "Periodo desde", "Periodo hasta",
+    "Periodo", "Consumo (kWh)", "Tipo Lectura"
+]
+COLUMNAS_REACTIVA = [
+    "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
+    "Consumo Reactiva (kWh)", "Cos φ", "A facturar Reactiva (€)"
+]
+COLUMNAS_EXCESOS = [
+    "Archivo", "Periodo desde", "Periodo hasta", "Periodo",
+    "Contratada (kW)", "Demandada (kW)", "A facturar Exceso (€)"
+]
+# Columnas con cifras de cada tabla: se recogen como texto y se convierten juntas
+COLUMNAS_NUMERICAS = {
+    "activa": ["Consumo (kWh)"],
+    "reactiva": ["Consumo Reactiva (kWh)", "Cos φ", "A facturar Reactiva (€)"],
+    "excesos": ["Contratada (kW)", "Demandada (kW)", "A facturar Exceso (€)"],
+}
+
+
+def _avisar(avisos, nivel, mensaje):
+    if avisos is not None:
+        avisos.append((nivel, mensaje))
+
+
+# ---------------------- LECTURA PDF ----------------------
+def leer_texto_pdf(pdf_bytes):
+    """Devuelve el texto del PDF, colapsando saltos de línea y espacios extra."""
+    return TextoDocumento.desde_pdf(pdf_bytes).normalizado
+
+# ---------------------- EXTRACCIÓN DE DATOS ----------------------
+CAMPOS_RESUMEN = BuscadorCampos({
+    "Nº Factura": r"Nº de factura:\s*(\S+)",
+    "Fecha emisión": r"Fecha emisión factura:\s*(\d{2}/\d{2}/\d{4})",
+    "Periodo desde": r"Periodo de facturación:\s*del\s*(\d{2}/\d{2}/\d{4})",
+    "Periodo hasta": r"Periodo de facturación:\s*del\s*\d{2}/\d{2}/\d{4}\s*al\s*(\d{2}/\d{2}/\d{4})",
+    "Importe de la factura (€)": r"IMPORTE FACTURA:\s*([\d.,]+)",
+    # El bloque "Cliente" de la portada no tiene fin reconocible (le siguen la dirección y el
+    # código de barras del pago); el titular del contrato es el mismo y termina en su NIF
+    "Cliente": r"Titular del contrato:\s*(.+?)\s+NIF:",
+    "Dirección suministro": r"Dirección de suministro:\s*(.+?),\s*\d{5}",
+    "CUPS": r"CUPS:\s*([A-Z0-9]+)",
+    "Contrato Nº": r"Referencia del contrato:\s*(\d+)",
+})
+
+def extraer_resumen_factura(texto):
+    """Extrae los campos resumen según el nuevo formato de factura (dict campo -> valor)."""
+    return CAMPOS_RESUMEN.buscar(texto)
+
+
+# ---------------------- ÍNDICE DE SECCIONES ----------------------
+# Cabeceras de las secciones de la página de lecturas. Cada sección termina
+# donde empieza la siguiente cabecera encontrada (o al final del texto).
+CABECERAS_SECCION = {
+    "activa": re.compile(r"ENERGÍA ACTIVA kWh"),
+    "reactiva_lecturas": re.compile(r"ENERGÍA REACTIVA kVArh"),
+    "potencia_lecturas": re.compile(r"(?<!DE )POTENCIA kW"),
+    "reactiva": re.compile(r"ENERGÍA REACTIVA INDUCTIVA kWh"),
+    "excesos": re.compile(r"EXCESOS DE POTENCIA"),
+    "informacion": re.compile(r"INFORMACIÓN DE SU PRODUCTO"),
+}
+
+
+def indice_secciones(texto) -> dict:
+    """Devuelve {sección: (inicio, fin)} de las secciones presentes; se calcula una vez por documento."""
+    inicios = sorted((m.start(), nombre) for nombre, patron in CABECERAS_SECCION.items()
+                     if (m := patron.search(texto)))
+    finales = [inicio for inicio, _ in inicios[1:]] + [len(texto)]
+    return {nombre: (inicio, fin) for (inicio, nombre), fin in zip(inicios, finales)}
+
+
+def _bloque_seccion(texto, secciones, nombre):
+    """Texto de la sección ``nombre`` o None si el documento no la tiene."""
+    if secciones is None:
+        secciones = indice_secciones(texto)
+    if nombre not in secciones:
+        return None
+    inicio, fin = secciones[nombre]
+    return texto[inicio:fin]
+
+
+def _convertir_numeros(columnas, tabla, nombre_archivo, avisos):
+    """Convierte las cifras de la tabla; avisa de las celdas que no son un número (quedan en NaN)."""
+    errores = convertir_columnas(columnas, COLUMNAS_NUMERICAS[tabla])
+    if errores:
+        celdas = "; ".join(f"{columnas['Periodo'][fila]} {columna} «{celda}»" for fila, columna, celda in errores)
+        _avisar(avisos, "warning", f"⚠️ Cifras no válidas en {tabla} de {nombre_archivo}: {celdas}")
+    return columnas
+
+
+# ---------------------- ENERGÍA ACTIVA ----------------------
+# Filas tipo: P1 1.18.1 7275,00 7275,00 1,00 0,00 0,00 (el último número es el consumo)
+PATRON_ACTIVA = re.compile(
+    r"P([1-6])\s+[0-9.]+[\s,]+[\d.,]+\s+[\d.,]+\s+[\d.,]+\s+[\d.,]+\s+([\d.,]+)"
+)
+
+
+def extraer_energia_activa(texto, periodo_desde, periodo_hasta, nombre_archivo, avisos=None, secciones=None):
+    datos = []
+
+    bloque = _bloque_seccion(texto, secciones, "activa")
+    if bloque is None:
+        _avisar(avisos, "warning", f"❌ No se encontró Energía Activa en {nombre_archivo}")
+        return filas_a_columnas([], COLUMNAS_ACTIVA)
+
+    for match in PATRON_ACTIVA.finditer(bloque):
+        datos.append({
+            "Archivo": nombre_archivo,
+            "Periodo desde": periodo_desde,
+            "Periodo hasta": periodo_hasta,
+            "Periodo": f"P{match.group(1)}",
+            "Consumo (kWh)": match.group(2),
+            "Tipo Lectura": "Estimada"
+        })
+
+    if not datos:
+        _avisar(avisos, "info", f"ℹ️ Energía Activa presente pero sin consumos claros en {nombre_archivo}")
+        return filas_a_columnas([], COLUMNAS_ACTIVA)
+
+    _avisar(avisos, "success", f"✅ Energía activa extraída correctamente de {nombre_archivo}")
+    return _convertir_numeros(filas_a_columnas(datos, COLUMNAS_ACTIVA), "activa", nombre_archivo, avisos)
+
+
+# ---------------------- ENERGÍA REACTIVA INDUCTIVA ----------------------
+PATRON_REACTIVA = re.compile(
+    r"P(?P<periodo>[1-6])\s+"
+    r"(?P<consumo>[\d.,]+)\s+"
+    r"(?P<cosphi>[\d.,]+)\s+"
+    r"(?P<a_facturar>[\d.,]+)"
+)
+
+
+def extraer_reactiva_inducida(texto, periodo_desde, periodo_hasta, nombre_archivo, avisos=None, secciones=None):
+    datos = []
+    try:
+        bloque = _bloque_seccion(texto, secciones, "reactiva")
+        if bloque is None:
+            _avisar(avisos, "warning", f"❌ Energía reactiva inductiva no encontrada en {nombre_archivo}")
+            return filas_a_columnas([], COLUMNAS_REACTIVA)
+
+        for m in PATRON_REACTIVA.finditer(bloque):
+            datos.append({
+                "Archivo": nombre_archivo,
+                "Periodo desde": periodo_desde,
+                "Periodo hasta": periodo_hasta,
+                "Periodo": f'P{m["periodo"]}',
+                "Consumo Reactiva (kWh)": m["consumo"],
+                "Cos φ": m["cosphi"],
+                "A facturar Reactiva (€)": m["a_facturar"],
+            })
+
+        if not datos:
+            _avisar(avisos, "info", f"ℹ️ Energía reactiva inductiva sin valores claros en {nombre_archivo}")
+            return filas_a_columnas([], COLUMNAS_REACTIVA)
+
+        _avisar(avisos, "success", f"✅ Energía reactiva inductiva extraída correctamente de {nombre_archivo}")
+        return _convertir_numeros(filas_a_columnas(datos, COLUMNAS_REACTIVA), "reactiva", nombre_archivo, avisos)
+
+    except Exception as e:
+        _avisar(avisos, "error", f"Error al procesar Energía Reactiva Inductiva en {nombre_archivo}: {e}")
+        return filas_a_columnas([], COLUMNAS_REACTIVA)
+
+
+# ---------------------- EXCESOS DE POTENCIA ----------------------
+PATRON_EXCESOS = re.compile(
+    r"P(?P<periodo>[1-6])\s+"
+    r"(?P<contratada>[\d.,]+)\s+"
+    r"(?P<demandada>[\d.,]+)\s+"
+    r"(?P<a_facturar>[\d.,]+)"
+)
+
+
+def extraer_excesos_potencia(texto, periodo_desde, periodo_hasta, nombre_archivo, avisos=None, secciones=None):
+    bloque = _bloque_seccion(texto, secciones, "excesos")
+    if bloque is None:
+        _avisar(avisos, "warning", f"❌ No se encontró Excesos de Potencia en {nombre_archivo}")
+        return filas_a_columnas([], COLUMNAS_EXCESOS)
+
+    datos = []
+    for m in PATRON_EXCESOS.finditer(bloque):
+        datos.append({
+            "Archivo": nombre_archivo,
+            "Periodo desde": periodo_desde,
+            "Periodo hasta": periodo_hasta,
+            "Periodo": f'P{m["periodo"]}',
+            "Contratada (kW)": m["contratada"],
+            "Demandada (kW)": m["demandada"],
+            "A facturar Exceso (€)": m["a_facturar"],
+        })
+
+    if not datos:
+        _avisar(avisos, "warning", f"❌ No se reconocieron filas de Excesos en {nombre_archivo}")
+        return filas_a_columnas([], COLUMNAS_EXCESOS)
+
+    _avisar(avisos, "write", f"✅ Excesos de potencia encontrados en {nombre_archivo}")
+    return _convertir_numeros(filas_a_columnas(datos, COLUMNAS_EXCESOS), "excesos", nombre_archivo, avisos)
+
+
+# ---------------------- TABLAS POR POSICIÓN ----------------------
+# Tabla -> (ancla, nº de celdas por fila, borde derecho como fracción del ancho).
+# La página de lecturas va a dos columnas: la energía activa ocupa la izquierda.
+TABLAS_LAYOUT = {
+    "activa": ("ENERGÍA ACTIVA", 6, 0.53),
+    "reactiva": ("ENERGÍA REACTIVA INDUCTIVA", 3, 1.0),
+    "excesos": ("EXCESOS DE POTENCIA", 3, 1.0),
+}
+# Los mismos avisos de éxito que dan los extractores por expresión regular
+AVISOS_LAYOUT = {
+    "activa": ("success", "✅ Energía activa extraída correctamente de {}"),
+    "reactiva": ("success", "✅ Energía reactiva inductiva extraída correctamente de {}"),
+    "excesos": ("write", "✅ Excesos de potencia encontrados en {}"),
+}
+
+
+def _filas_layout(tabla, celdas):
+    """Fila de ``tabla`` con las columnas del extractor por expresión regular (cifras aún como texto)."""
+    if tabla == "activa":
+        # Código, lectura anterior, lectura actual, multiplicador, ajuste, consumo
+        return {"Consumo (kWh)": celdas[5], "Tipo Lectura": "Estimada"}
+    return dict(zip(COLUMNAS_NUMERICAS[tabla], celdas))
+
+
+def extraer_tabla_layout(page, tabla, periodo_desde, periodo_hasta, nombre_archivo, avisos=None, analisis=None):
+    """Tabla P1-P6 leída por posición de las palabras; None si no se reconoce."""
+    ancla, num_columnas, x_fin = TABLAS_LAYOUT[tabla]
+    filas = leer_filas(page, ancla, r"P[1-6]", num_columnas, x_fin, analisis=analisis)
+    if filas is None:
+        return None
+    nivel, mensaje = AVISOS_LAYOUT[tabla]
+    _avisar(avisos, nivel, mensaje.format(nombre_archivo))
+    columnas = {"activa": COLUMNAS_ACTIVA, "reactiva": COLUMNAS_REACTIVA, "excesos": COLUMNAS_EXCESOS}[tabla]
+    return _convertir_numeros(filas_a_columnas(
+        [{"Archivo": nombre_archivo, "Periodo desde": periodo_desde, "Periodo hasta": periodo_hasta,
+          "Periodo": etiqueta, **_filas_layout(tabla, celdas)} for etiqueta, celdas in filas],
+        columnas,
+    ), tabla, nombre_archivo, avisos)
+
+
+# ---------------------- PLANTILLA DEL FORMATO ----------------------
+# Tabla -> (extractor por expresión regular, patrón de sus filas)
+TABLAS_REGEX = {
+    "activa": (extraer_energia_activa, PATRON_ACTIVA),
+    "reactiva": (extraer_reactiva_inducida, PATRON_REACTIVA),
+    "excesos": (extraer_excesos_potencia, PATRON_EXCESOS),
+}
+
+
+def _extraer_con_plantilla(doc, plantilla, nombre_archivo, avisos=None):
+    """(texto, tablas) leyendo solo las regiones de la plantilla, o None si el documento no cuadra."""
+    textos = leer_regiones(doc, plantilla["regiones"])
+    if textos is None:
+        return None
+    textos = {nombre: normalizar(texto) for nombre, texto in textos.items()}
+    resumen = CAMPOS_RESUMEN.buscar_en(textos)
+    if resumen is None:
+        return None
+    resumen["Archivo"] = nombre_archivo
+
+    tablas = {"resumen": {campo: [valor] for campo, valor in resumen.items()}}
+    avisos_tablas = []
+    for tabla, (extraer, _) in TABLAS_REGEX.items():
+        columnas = extraer(textos[tabla], resumen["Periodo desde"], resumen["Periodo hasta"],
+                           nombre_archivo, avisos_tablas)
+        if num_filas(columnas) != plantilla["filas"][tabla]:
+            return None
+        tablas[tabla] = columnas
+    if avisos is not None:
+        avisos.extend(avisos_tablas)
+    return " ".join(textos.values()), tablas
+
+
+def _aprender_plantilla(doc, documento, secciones, tablas, nombre_archivo):
+    """Plantilla del formato a partir de una extracción completa, o None si no sirve.
+
+    Solo se acepta si leyendo únicamente sus regiones se obtienen las mismas tablas.
+    """
+    texto = documento.normalizado
+    tramos = CAMPOS_RESUMEN.tramos(texto)
+    if tramos is None:
+        return None
+    for tabla, (_, patron) in TABLAS_REGEX.items():
+        if tabla not in secciones:
+            return None
+        inicio, fin = secciones[tabla]
+        filas = list(patron.finditer(texto, inicio, fin))
+        if not filas:
+            return None
+        # Desde la cabecera de la sección hasta su última fila
+        tramos[tabla] = (inicio, filas[-1].end())
+
+    regiones = aprender_regiones(doc, tramos, documento.posicion)
+    if regiones is None:
+        return None
+    plantilla = {"regiones": regiones, "filas": {tabla: num_filas(tablas[tabla]) for tabla in TABLAS_REGEX}}
+    comprobacion = _extraer_con_plantilla(doc, plantilla, nombre_archivo)
+    return plantilla if comprobacion is not None and comprobacion[1] == tablas else None
+
+
+# ---------------------- VALIDACIÓN ----------------------
+CAMPOS_OBLIGATORIOS = ("Nº Factura", "Periodo desde", "Periodo hasta", "Importe de la factura (€)", "CUPS")
+
+# Total de energía activa que la factura imprime junto al consumo por periodo
+PATRON_CONSUMO_TOTAL = re.compile(r"Consumo Total\s*([\d.,]+)\s*kWh")
+
+
+def validar_tablas(texto, tablas) -> list:
+    """Problemas de lo extraído (vacío si cuadra): campos, fechas, filas P1-P6 e importes frente al total."""
+    resumen = {campo: valores[0] for campo, valores in tablas["resumen"].items()}
+    problemas = comprobar_campos(resumen, CAMPOS_OBLIGATORIOS)
+    if resumen["Periodo desde"] and resumen["Periodo hasta"]:
+        problemas += comprobar_periodo(resumen["Periodo desde"], resumen["Periodo hasta"])
+    if resumen["Fecha emisión"] and fecha_es(resumen["Fecha emisión"]) is None:
+        problemas.append(f"fecha de emisión no válida ({resumen['Fecha emisión']})")
+    total = importe_es(resumen["Importe de la factura (€)"])
+    if resumen["Importe de la factura (€)"] and total is None:
+        problemas.append(f"importe de la factura no válido ({resumen['Importe de la factura (€)']})")
+
+    for tabla in TABLAS_REGEX:
+        problemas += comprobar_tabla(tablas[tabla], tabla)
+    problemas += comprobar_importes(
+        tablas["reactiva"]["A facturar Reactiva (€)"] + tablas["excesos"]["A facturar Exceso (€)"], total,
+        "la suma de reactiva y excesos a facturar")
+
+    # Solo si el texto lo trae (con plantilla se leen únicamente las regiones)
+    consumo_total = PATRON_CONSUMO_TOTAL.search(texto)
+    if consumo_total and tablas["activa"]["Consumo (kWh)"]:
+        esperado = importe_es(consumo_total.group(1))
+        suma = sum(valor for valor in tablas["activa"]["Consumo (kWh)"] if valor is not None)
+        if esperado is not None and abs(suma - esperado) > 0.5:
+            problemas.append(f"la energía activa por periodo ({suma:.0f} kWh) no suma el consumo total "
+                             f"({esperado:.0f} kWh)")
+    return problemas
+
+
+# ---------------------- FACTURA COMPLETA ----------------------
+def _seccion_cerrada(tabla):
+    def cumple(texto):
+        secciones = indice_secciones(texto)
+        return tabla in secciones and secciones[tabla][1] < len(texto)
+    return cumple
+
+
+def completitud() -> Completitud:
+    """Completitud de los campos resumen y de cada tabla con su sección cerrada, para la lectura perezosa.
+
+    Una sección está cerrada cuando detrás aparece la cabecera de otra, y un
+    campo cuando su coincidencia no llega al final de lo leído (podría seguir
+    en la página siguiente).
+    """
+    condiciones = {campo: cierra_coincidencia(patron) for campo, patron in CAMPOS_RESUMEN.patrones.items()}
+    condiciones.update({tabla: _seccion_cerrada(tabla) for tabla in TABLAS_REGEX})
+    return Completitud(condiciones, normalizada=True)
+
+
+def _leer_documento(doc, pdf_bytes, nombre_archivo, avisos, lectura, ocr, informe):
+    """Páginas de texto (todas o, en lectura perezosa, las necesarias), con OCR de las escaneadas si ``ocr``."""
+    textos_ocr = {}
+    if ocr:
+        with medir(informe, "lectura"):
+            textos = [page.get_text() for page in doc]
+            escaneadas = [page.number for page in doc if pagina_escaneada(page, textos[page.number])]
+        if escaneadas:
+            lista = ", ".join(str(numero + 1) for numero in escaneadas)
+            _avisar(avisos, "info", f"🧐 Páginas escaneadas en {nombre_archivo}: {lista}. Aplicando OCR...")
+            with medir(informe, "ocr"):
+                textos_ocr = aplicar_ocr_a_paginas(pdf_bytes, escaneadas, avisos)
+            for numero, texto_ocr in textos_ocr.items():
+                textos[numero] = texto_ocr
+        documento = TextoDocumento(textos)
+    else:
+        with medir(informe, "lectura"):
+            if (lectura or MODO_LECTURA) == "perezosa":
+                documento = leer_hasta_completar(doc, completitud())
+                _avisar(avisos, "info", f"📄 Páginas leídas en {nombre_archivo}: {documento.paginas_leidas} "
+                                        f"de {len(documento.paginas)}")
+            else:
+                documento = TextoDocumento(page.get_text() for page in doc)
+            escaneadas = [numero for numero in range(documento.paginas_leidas)
+                          if pagina_escaneada(doc[numero], documento.paginas[numero])]
+    if informe is not None:
+        informe["paginas_escaneadas"] = len(escaneadas)
+        if ocr and escaneadas:
+            informe["paginas_ocr"] = len(textos_ocr)
+    return documento
+
+
+def _extraer_completo(doc, pdf_bytes, nombre_archivo, avisos, modo, lectura, ocr, informe):
+    """Lectura de las páginas y extracción de todas las tablas: devuelve (documento, secciones, tablas)."""
+    documento = _leer_documento(doc, pdf_bytes, nombre_archivo, avisos, lectura, ocr, informe)
+    with medir(informe, "lectura"):
+        texto = documento.normalizado
+    with medir(informe, "campos"):
+        resumen = extraer_resumen_factura(texto)
+    periodo_desde = resumen["Periodo desde"]
+    periodo_hasta = resumen["Periodo hasta"]
+    resumen["Archivo"] = nombre_archivo
+
+    tablas = {"resumen": {campo: [valor] for campo, valor in resumen.items()}}
+    sin_posicion = []
+    analisis = {}       # nº de página -> (página, palabras_pagina()), compartido por sus tablas
+    with medir(informe, "tablas"):
+        secciones = indice_secciones(texto)
+        argumentos = (texto, periodo_desde, periodo_hasta, nombre_archivo, avisos, secciones)
+        for tabla, (extraer, _) in TABLAS_REGEX.items():
+            columnas = None
+            if (modo or MODO_TABLAS) == "layout" and tabla in secciones:
+                pagina, _ = documento.posicion(secciones[tabla][0])
+                if pagina not in analisis:
+                    page = doc[pagina]      # el TextPage solo guarda una referencia débil a la página
+                    analisis[pagina] = (page, palabras_pagina(page))
+                page, palabras = analisis[pagina]
+                columnas = extraer_tabla_layout(page, tabla, periodo_desde, periodo_hasta,
+                                                nombre_archivo, avisos, palabras)
+                if columnas is None:
+                    sin_posicion.append(tabla)
+            tablas[tabla] = columnas if columnas is not None else extraer(*argumentos)
+
+    if sin_posicion:
+        _avisar(avisos, "info", f"📐 Tablas no reconocidas por posición en {nombre_archivo}: "
+                                f"{', '.join(sin_posicion)}; se usa el texto")
+    return documento, secciones, tablas
+
+
+def extraer_tablas(pdf_bytes, nombre_archivo, avisos=None, modo=None, plantillas=None, lectura=None,
+                   informe=None, ocr=False):
+    """Lee el PDF y devuelve (texto, {tabla: {columna: [valores]}}) con resumen, activa, reactiva y excesos.
+
+    Con modo "layout" las tablas P1-P6 se leen por posición de las palabras;
+    la que no se reconozca así se extrae del texto con su expresión regular.
+
+    Con ``plantillas`` (un AlmacenPlantillas), un documento de formato ya
+    conocido se lee solo en las regiones de su plantilla y el texto devuelto
+    es el de esas regiones; si no cuadra, se lee completo y se reaprende.
+
+    Con lectura "perezosa" se dejan de leer páginas en cuanto están todos
+    los campos y tablas (completitud). Con ``ocr`` se leen todas las
+    páginas y las escaneadas pasan por OCR. En ``informe`` (un dict), si se
+    pasa, se anotan paginas_leidas, paginas_total y paginas_escaneadas.
+    """
+    with medir(informe, "abrir"):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    with doc:
+        if informe is not None:
+            informe["paginas_total"] = doc.page_count
+        if plantillas is not None:
+            huella = huella_formato(doc, "factura")
+            plantilla = plantillas.obtener(huella, VERSION_EXTRACTOR)
+            if plantilla is not None:
+                with medir(informe, "plantilla"):
+                    resultado = _extraer_con_plantilla(doc, plantilla, nombre_archivo, avisos)
+                plantillas.anotar(huella, VERSION_EXTRACTOR, resultado is not None)
+                if resultado is not None:
+                    if informe is not None:
+                        informe["paginas_leidas"] = len(paginas_plantilla(plantilla))
+                    return resultado
+                _avisar(avisos, "info", f"🧩 {nombre_archivo} no cuadra con la plantilla de su formato; "
+                                        "se lee completo")
+
+        documento, secciones, tablas = _extraer_completo(doc, pdf_bytes, nombre_archivo, avisos, modo, lectura,
+                                                         ocr, informe)
+        if informe is not None:
+            informe["paginas_leidas"] = documento.paginas_leidas
+
+        if plantillas is not None:
+            plantilla = _aprender_plantilla(doc, documento, secciones, tablas, nombre_archivo)
+            if plantilla is not None:
+                plantillas.guardar(huella, VERSION_EXTRACTOR, "factura", plantilla)
+    return documento.normalizado, tablas
@@ -0,0 +1,424 @@
+"""Facturas PDF sintéticas con sus datos verdaderos, para pruebas de carga y de acierto.
+
+Ejemplos:
+    python generar_facturas.py sinteticas/ -n 10000
+    python generar_facturas.py sinteticas/ -n 500 --familia endesa --escaneadas 0.2 --paginas 2 6
+    python benchmark.py acierto sinteticas/
+
+Crea con PyMuPDF documentos de las dos familias que leen los extractores:
+"factura" (Nº de factura / ENERGÍA ACTIVA kWh, ver extractores_factura) y
+"endesa" (Factura nº / Periodo 1..6, ver extractores_endesa), con cifras
+al azar pero coherentes entre sí (el consumo total es la suma de los
+periodos, los importes no superan el total). Las tablas se colocan en
+columnas alineadas a la derecha, así que también se leen por posición.
+
+Cada documento tiene entre --paginas MIN MAX páginas: las dos de datos y
+el resto de relleno. Una fracción --escaneadas de los documentos se
+rasteriza salvo la primera página (la que usa clasificar_pdf), de modo
+que sus tablas solo se pueden leer con OCR.
+
+Junto a los PDF se escribe verdad.jsonl, una línea por documento con su
+archivo, familia, páginas, páginas escaneadas (desde 1) y las tablas tal
+como deberían salir de extraer_tablas ({tabla: {columna: [valores]}},
+cifras como float). Con la misma --semilla salen los mismos documentos,
+byte a byte.
+"""
+import argparse
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from extractores_endesa import COLUMNAS_DETALLE
+from procesamiento import PROCESOS_POR_DEFECTO
+
+NOMBRE_VERDAD = "verdad.jsonl"
+FAMILIAS_GENERADAS = ("factura", "endesa")
+ANCHO, ALTO = 595, 842      # A4 en puntos, como las facturas reales
+MARGEN = 40
+TAMANO_LETRA = 9
+TAMANO_TABLA = 7
+# Helvetica de MuPDF incrustada: a diferencia de la Base14 sin incrustar, tiene el símbolo €
+FUENTE = fitz.Font("helv")
+DPI_ESCANEO = 150
+METADATOS = {"creator": "generar_facturas", "producer": "PyMuPDF", "creationDate": "", "modDate": ""}
+
+CLIENTES = ["AYUNTAMIENTO DE ESTEPA", "AYUNTAMIENTO DE OSUNA", "AYUNTAMIENTO DE ECIJA",
+            "AYUNTAMIENTO DE MARCHENA", "MANCOMUNIDAD SIERRA SUR", "CONSORCIO DE AGUAS DEL SUR"]
+CALLES = ["AV DE ANDALUCIA", "CL MAYOR", "PZ DEL CARMEN", "CL FUENTE DE SANTIAGO", "CR DE LA ESTACION",
+          "CL REAL", "AV DE LA CONSTITUCION", "CL SAN SEBASTIAN"]
+MUNICIPIOS = [("41560", "ESTEPA"), ("41640", "OSUNA"), ("41400", "ECIJA"), ("41620", "MARCHENA")]
+RELLENO = [
+    "Información sobre sus derechos como consumidor de energía eléctrica.",
+    "Puede presentar una reclamación ante el servicio de atención al cliente de la comercializadora.",
+    "Si no queda satisfecho con la respuesta, puede acudir a la Junta Arbitral de Consumo.",
+    "La energía suministrada procede de fuentes diversas según el etiquetado de la electricidad.",
+    "Conserve esta factura: le servirá para comprobar sus consumos y como justificante de pago.",
+    "Los datos personales se tratan conforme a la normativa vigente de protección de datos.",
+]
+
+
+# ---------------------- UTILIDADES ----------------------
+def cifra_es(valor, decimales=2) -> str:
+    """1234.5 -> "1.234,50", como imprimen las facturas."""
+    return f"{valor:,.{decimales}f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def fecha_es(dia: date) -> str:
+    return dia.strftime("%d/%m/%Y")
+
+
+def _cifra(rng, minimo, maximo, decimales=2):
+    """Valor al azar ya redondeado: su texto con cifra_es vuelve a dar exactamente el mismo float."""
+    return round(rng.uniform(minimo, maximo), decimales)
+
+
+class _Pagina:
+    """Escribe una página de arriba abajo: líneas sueltas y filas de tabla alineadas a la derecha.
+
+    Se usa con ``with``: el texto se acumula en un TextWriter y se vuelca a
+    la página de una vez al salir (insert_text por línea es unas 20 veces
+    más lento).
+    """
+
+    def __init__(self, doc):
+        self.page = doc.new_page(width=ANCHO, height=ALTO)
+        self.escritor = fitz.TextWriter(self.page.rect)
+        self.y = MARGEN + TAMANO_LETRA
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.escritor.write_text(self.page)
+
+    def texto(self, x, y, texto, tamano=TAMANO_LETRA):
+        self.escritor.append((x, y), texto, font=FUENTE, fontsize=tamano)
+
+    def linea(self, texto, x=MARGEN, tamano=TAMANO_LETRA):
+        self.texto(x, self.y, texto, tamano)
+        self.y += tamano * 1.6
+
+    def fila(self, etiqueta, celdas, bordes, x=MARGEN, tamano=TAMANO_TABLA):
+        """Etiqueta en ``x`` y cada celda con su borde derecho en ``bordes``."""
+        self.texto(x, self.y, etiqueta, tamano)
+        for celda, borde in zip(celdas, bordes):
+            self.texto(borde - FUENTE.text_length(celda, fontsize=tamano), self.y, celda, tamano)
+        self.y += tamano * 1.8
+
+    def saltar(self, lineas=1):
+        self.y += TAMANO_LETRA * 1.6 * lineas
+
+
+def _pagina_relleno(doc, numero, total, rng):
+    with _Pagina(doc) as pagina:
+        for parrafo in rng.sample(RELLENO, 4):
+            pagina.linea(parrafo)
+        pagina.linea(f"Pagina {numero} de {total}")
+
+
+def _datos_comunes(rng):
+    """Cliente, suministro, contrato y periodo de facturación, compartidos por las dos familias."""
+    codigo_postal, municipio = rng.choice(MUNICIPIOS)
+    desde = date(2024, 1, 1) + timedelta(days=rng.randrange(730))
+    hasta = desde + timedelta(days=rng.randint(27, 31))
+    return {
+        "cliente": rng.choice(CLIENTES),
+        "suministro": f"{rng.choice(CALLES)} {rng.randint(1, 120)}",
+        "codigo_postal": codigo_postal,
+        "municipio": municipio,
+        "cups": f"ES0031{rng.randrange(10 ** 12):012d}{rng.choice('ABCDEFGHJKLMNPQRSTVWXYZ')}"
+                f"{rng.choice('ABCDEFGHJKLMNPQRSTVWXYZ')}0F",
+        "contrato": f"{rng.randrange(10 ** 11, 10 ** 12)}",
+        "numero": f"P{hasta:%y}CON{rng.randrange(10 ** 9):09d}",
+        "desde": desde,
+        "hasta": hasta,
+        "emision": hasta + timedelta(days=rng.randint(3, 15)),
+    }
+
+
+# ---------------------- FAMILIA "factura" ----------------------
+def _factura(doc, rng, nombre, paginas):
+    """Portada con los datos de la factura y página de lecturas; devuelve las tablas verdaderas."""
+    datos = _datos_comunes(rng)
+    periodos = [f"P{p}" for p in range(1, 7)]
+    consumos = [0.0 if rng.random() < 0.3 else float(rng.randint(1, 5000)) for _ in periodos]
+    reactiva = [(_cifra(rng, 0, 400), _cifra(rng, 0.8, 1), _cifra(rng, 0, 30)) for _ in periodos]
+    excesos = [(float(rng.choice([15, 30, 33, 36, 50])), _cifra(rng, 0, 60, 3), _cifra(rng, 0, 20))
+               for _ in periodos]
+    potencia, energia = _cifra(rng, 50, 400), _cifra(rng, 100, 3000)
+    impuestos = round((potencia + energia) * 0.26, 2)
+    importe = round(potencia + energia + impuestos + sum(r[2] for r in reactiva) + sum(e[2] for e in excesos), 2)
+    nif = f"P{rng.randrange(10 ** 7):07d}E"
+
+    with _Pagina(doc) as portada:
+        portada.linea("Cliente")
+        portada.linea(datos["cliente"])
+        portada.linea(f"{datos['suministro']} {datos['codigo_postal']} {datos['municipio']}, SEVILLA")
+        portada.saltar()
+        portada.linea("DATOS DE LA FACTURA")
+        portada.linea(f"IMPORTE FACTURA: {cifra_es(importe)} €")
+        portada.linea(f"Nº de factura: {datos['numero']}")
+        portada.linea(f"Fecha emisión factura: {fecha_es(datos['emision'])}")
+        portada.linea(f"Periodo de facturación: del {fecha_es(datos['desde'])} al {fecha_es(datos['hasta'])}  "
+                      f"({(datos['hasta'] - datos['desde']).days} días)")
+        portada.saltar()
+        portada.linea("RESUMEN DE LA FACTURA")
+        for concepto, valor in (("Potencia", potencia), ("Energía", energia), ("Impuestos", impuestos),
+                                ("Total", importe)):
+            portada.linea(f"{concepto} {cifra_es(valor)} €")
+        portada.linea(f"Consumo Total {cifra_es(sum(consumos), 3)} kWh")
+        portada.saltar()
+        portada.linea("DATOS DEL CONTRATO")
+        portada.linea(f"Titular del contrato: {datos['cliente']}  NIF: {nif}")
+        portada.linea(f"Dirección de suministro: {datos['suministro']}, {datos['codigo_postal']}")
+        portada.linea(f"{datos['municipio']}, SEVILLA")
+        portada.linea(f"CUPS: {datos['cups']}")
+        portada.linea(f"Referencia del contrato: {datos['contrato']}")
+
+    # Página de lecturas a dos columnas: energía activa a la izquierda (extractores_factura.TABLAS_LAYOUT)
+    with _Pagina(doc) as lecturas:
+        lecturas.linea("LECTURAS")
+        inicio_tablas = lecturas.y
+        lecturas.linea("ENERGÍA ACTIVA kWh")
+        for i, (periodo, consumo) in enumerate(zip(periodos, consumos), 1):
+            anterior = float(rng.randint(10_000, 500_000))
+            lecturas.fila(periodo, [f"1.18.{i}", cifra_es(anterior), cifra_es(anterior + consumo), "1,00", "0,00",
+                                    cifra_es(consumo)], [95, 145, 195, 225, 255, 300])
+        fin_activa = lecturas.y
+        lecturas.y = inicio_tablas
+        lecturas.linea("ENERGÍA REACTIVA kVArh", x=340)
+        for i, periodo in enumerate(periodos, 1):
+            anterior = float(rng.randint(10_000, 200_000))
+            lecturas.fila(periodo, [f"1.58.{i}", cifra_es(anterior), cifra_es(anterior), "1,00"],
+                          [395, 445, 495, 525], x=340)
+        lecturas.linea("POTENCIA kW", x=340)
+        for i, (periodo, (_, demandada, _)) in enumerate(zip(periodos, excesos), 1):
+            lecturas.fila(periodo, [f"1.16.{i}", cifra_es(demandada, 3), "1", cifra_es(demandada, 3)],
+                          [395, 445, 475, 525], x=340)
+        lecturas.y = max(lecturas.y, fin_activa)
+        lecturas.saltar(2)
+        lecturas.linea("ENERGÍA REACTIVA INDUCTIVA kWh")
+        lecturas.linea("Periodo horario    Consumo    Cos    A facturar")
+        for periodo, (consumo, cos, facturar) in zip(periodos, reactiva):
+            lecturas.fila(periodo, [cifra_es(consumo), cifra_es(cos), cifra_es(facturar)], [150, 230, 310])
+        lecturas.saltar(2)
+        lecturas.linea("EXCESOS DE POTENCIA kW")
+        lecturas.linea("Periodo horario    Contratada    Demandada    A facturar")
+        for periodo, (contratada, demandada, facturar) in zip(periodos, excesos):
+            lecturas.fila(periodo, [cifra_es(contratada, 3), cifra_es(demandada, 3), cifra_es(facturar)],
+                          [150, 230, 310])
+        lecturas.saltar(2)
+        lecturas.linea("INFORMACIÓN DE SU PRODUCTO")
+        lecturas.linea("Ante cualquier necesidad no dude en contactar con su gestor personal.")
+
+    for numero in range(3, paginas + 1):
+        _pagina_relleno(doc, numero, paginas, rng)
+
+    desde, hasta = fecha_es(datos["desde"]), fecha_es(datos["hasta"])
+    comunes = {"Archivo": [nombre] * 6, "Periodo desde": [desde] * 6, "Periodo hasta": [hasta] * 6,
+               "Periodo": periodos}
+    return {
+        "resumen": {
+            "Nº Factura": [datos["numero"]], "Fecha emisión": [fecha_es(datos["emision"])],
+            "Periodo desde": [desde], "Periodo hasta": [hasta],
+            "Importe de la factura (€)": [cifra_es(importe)], "Cliente": [datos["cliente"]],
+            "Dirección suministro": [datos["suministro"]], "CUPS": [datos["cups"]],
+            "Contrato Nº": [datos["contrato"]], "Archivo": [nombre],
+        },
+        "activa": {**comunes, "Consumo (kWh)": consumos, "Tipo Lectura": ["Estimada"] * 6},
+        "reactiva": {**comunes, "Consumo Reactiva (kWh)": [r[0] for r in reactiva],
+                     "Cos φ": [r[1] for r in reactiva], "A facturar Reactiva (€)": [r[2] for r in reactiva]},
+        "excesos": {**comunes, "Contratada (kW)": [e[0] for e in excesos], "Demandada (kW)": [e[1] for e in excesos],
+                    "A facturar Exceso (€)": [e[2] for e in excesos]},
+    }
+
+
+# ---------------------- FAMILIA "endesa" ----------------------
+# Decimales de cada cifra del detalle, en el orden de extractores_endesa.COLUMNAS_DETALLE[1:]
+DECIMALES_DETALLE = [2, 2, 2, 2, 2, 3, 3, 6, 4, 3, 2]
+
+
+def _endesa(doc, rng, nombre, paginas):
+    """Resumen en la primera página y detalle por periodos en la última; devuelve las tablas verdaderas."""
+    datos = _datos_comunes(rng)
+    filas = []
+    for p in range(1, 7):
+        consumo = 0.0 if rng.random() < 0.3 else _cifra(rng, 1, 10_000)
+        contratada = float(rng.choice([100, 150, 200, 450]))
+        filas.append([consumo, _cifra(rng, 0, consumo / 3), 0.0, _cifra(rng, 0.8, 1), _cifra(rng, 0, 50),
+                      contratada, _cifra(rng, 0, contratada * 1.2, 3), 1.0, _cifra(rng, 0, 4, 4),
+                      _cifra(rng, 0, 200, 3), _cifra(rng, 0, 100)])
+    energia, potencia = _cifra(rng, 200, 5000), _cifra(rng, 50, 500)
+    base = round(energia + potencia + sum(fila[4] + fila[10] for fila in filas), 2)
+    impuesto, iva = round(base * 0.051127, 2), round(base * 1.051127 * 0.21, 2)
+    total = round(base + impuesto + iva, 2)
+    periodo = f"{fecha_es(datos['desde'])} al {fecha_es(datos['hasta'])}"
+    limite = datos["emision"] + timedelta(days=25)
+    nif = f"P{rng.randrange(10 ** 7):07d}E"
+    fiscal = f"{rng.choice(CALLES)} {rng.randint(1, 120)} - {datos['codigo_postal']} {datos['municipio']} SEVILLA"
+    suministro = f"{datos['suministro']}, {datos['codigo_postal']} {datos['municipio']}, SEVILLA"
+
+    with _Pagina(doc) as resumen:
+        resumen.linea("RESUMEN DE LA FACTURA")
+        resumen.linea(f"Fecha Factura: {fecha_es(datos['emision'])}")
+        resumen.linea(f"Periodo facturación: {periodo}")
+        resumen.linea(f"Factura nº: {datos['numero']}")
+        resumen.linea(f"Total Factura       {cifra_es(total)} €")
+        resumen.saltar()
+        resumen.linea("Datos del Cliente")
+        resumen.linea(f"Razón Social: {datos['cliente']}")
+        resumen.linea(f"NIF/CIF: {nif}")
+        resumen.linea(f"Dir.Fiscal: {fiscal}")
+        resumen.linea(f"Dir.Suministro: {suministro}")
+        resumen.linea(f"CUPS: {datos['cups']}")
+        resumen.linea("Modalidad de Contrato: 6.1TD")
+        resumen.saltar()
+        resumen.linea("Datos de Pago")
+        resumen.linea("El pago del importe de la factura debe realizarse antes del")
+        resumen.linea(f"{fecha_es(limite)} a través de una transferencia a n/c.c.")
+        resumen.linea(f"Contrato nº: {datos['contrato']}")
+        resumen.saltar()
+        resumen.linea("Facturación")
+        for concepto, valor in (("Término de Energía Variable", energia), ("Fact. Potencia Contratada", potencia),
+                                ("Impuesto sobre la Electricidad", impuesto), ("IVA normal", iva)):
+            resumen.linea(f"{concepto}    {cifra_es(valor)}")
+        resumen.linea("Total Factura")
+        resumen.linea(f"{cifra_es(total)} EUR")
+
+    for numero in range(2, paginas):
+        _pagina_relleno(doc, numero, paginas, rng)
+
+    with _Pagina(doc) as detalle:
+        detalle.linea(f"Razón Social: {datos['cliente']}")
+        detalle.linea(f"Periodo facturación: del {periodo}")
+        detalle.saltar()
+        detalle.linea("Desglose de Consumos")
+        detalle.linea("Energía Activa    Energía Reactiva (kVArh)    Potencia kW")
+        bordes = [105 + 42 * i for i in range(12)]
+        for p, fila in enumerate(filas, 1):
+            # El "1" de "Periodo 1" es la primera celda de la fila (extractores_endesa, lectura por posición)
+            detalle.fila("Periodo", [str(p)] + [cifra_es(v, d) for v, d in zip(fila, DECIMALES_DETALLE)], bordes)
+        detalle.saltar()
+        detalle.linea("Definición de los periodos según la Circular 3/2020 de la CNMC.")
+        detalle.linea(f"Pagina {paginas} de {paginas}")
+
+    return {
+        "resumen": {
+            "Factura nº": [datos["numero"]], "Fecha Factura": [fecha_es(datos["emision"])],
+            "Periodo Facturación": [periodo], "Total Factura": [cifra_es(total)], "Cliente": [datos["cliente"]],
+            "NIF/CIF": [nif], "Dirección Fiscal": [fiscal], "Dirección Suministro": [suministro],
+            "CUPS": [datos["cups"]], "Contrato Nº": [datos["contrato"]], "Modalidad de Contrato": ["6.1TD"],
+            "Fecha Límite de Pago": [fecha_es(limite)],
+        },
+        "detalle": {"Periodo": [f"P{p}" for p in range(1, 7)],
+                    **{columna: [fila[i] for fila in filas] for i, columna in enumerate(COLUMNAS_DETALLE[1:])}},
+    }
+
+
+GENERADORES = {"factura": _factura, "endesa": _endesa}
+
+
+# ---------------------- ESCANEO ----------------------
+def rasterizar(doc, paginas, dpi=DPI_ESCANEO):
+    """Copia de ``doc`` con las páginas indicadas (desde 0) convertidas en imagen gris, sin capa de texto."""
+    salida = fitz.open()
+    for page in doc:
+        if page.number in paginas:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            nueva = salida.new_page(width=page.rect.width, height=page.rect.height)
+            nueva.insert_image(nueva.rect, stream=pix.tobytes("jpeg"))
+        else:
+            salida.insert_pdf(doc, from_page=page.number, to_page=page.number)
+    return salida
+
+
+# ---------------------- GENERACIÓN ----------------------
+def generar_documento(carpeta, indice, familia, paginas, escaneadas, semilla, dpi=DPI_ESCANEO) -> dict:
+    """Escribe el documento ``indice`` en ``carpeta`` y devuelve su línea de verdad.jsonl.
+
+    Cada documento sale de su propio generador aleatorio (semilla e índice),
+    así que el resultado no depende del orden ni del número de procesos.
+    """
+    rng = random.Random(f"{semilla}:{indice}")
+    if familia not in GENERADORES:
+        familia = rng.choice(FAMILIAS_GENERADAS)
+    num_paginas = rng.randint(*paginas)
+    escaneada = rng.random() < escaneadas
+    nombre = f"{familia}_{indice:06d}.pdf"
+
+    doc = fitz.open()
+    tablas = GENERADORES[familia](doc, rng, nombre, num_paginas)
+    paginas_escaneadas = list(range(1, num_paginas)) if escaneada else []
+    if paginas_escaneadas:
+        escaneado = rasterizar(doc, set(paginas_escaneadas), dpi)
+        doc.close()
+        doc = escaneado
+    doc.set_metadata(METADATOS)
+    doc.subset_fonts()      # solo los glifos usados: la mitad de tamaño
+    doc.save(Path(carpeta) / nombre, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return {"archivo": nombre, "familia": familia, "paginas": num_paginas,
+            "escaneadas": [numero + 1 for numero in paginas_escaneadas], "tablas": tablas}
+
+
+def _generar_tarea(tarea):
+    return generar_documento(*tarea)
+
+
+def leer_verdad(carpeta) -> dict:
+    """{archivo: línea de verdad.jsonl} de una carpeta generada."""
+    with open(Path(carpeta) / NOMBRE_VERDAD, encoding="utf-8") as f:
+        return {registro["archivo"]: registro for registro in map(json.loads, f) if registro}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Genera facturas PDF sintéticas y su verdad.jsonl.")
+    parser.add_argument("salida", type=Path, help="carpeta donde escribir los PDF y verdad.jsonl")
+    parser.add_argument("-n", "--documentos", type=int, default=100, help="número de documentos (por defecto: 100)")
+    parser.add_argument("--familia", choices=list(FAMILIAS_GENERADAS) + ["ambas"], default="ambas",
+                        help="familia de los documentos; con ambas, una al azar en cada uno (por defecto: ambas)")
+    parser.add_argument("--paginas", type=int, nargs=2, metavar=("MIN", "MAX"), default=[2, 4],
+                        help="páginas de cada documento, las dos de datos más relleno (por defecto: 2 4)")
+    parser.add_argument("--escaneadas", type=float, default=0.0, metavar="FRACCION",
+                        help="fracción de documentos escaneados salvo la primera página (por defecto: 0)")
+    parser.add_argument("--dpi", type=int, default=DPI_ESCANEO,
+                        help=f"resolución de las páginas escaneadas (por defecto: {DPI_ESCANEO})")
+    parser.add_argument("--semilla", type=int, default=0, help="semilla de los datos al azar (por defecto: 0)")
+    parser.add_argument("--procesos", type=int, default=PROCESOS_POR_DEFECTO,
+                        help=f"procesos en paralelo (por defecto: {PROCESOS_POR_DEFECTO})")
+    args = parser.parse_args(argv)
+    if args.paginas[0] < 2 or args.paginas[0] > args.paginas[1]:
+        parser.error("--paginas necesita 2 <= MIN <= MAX (las dos primeras son las de datos)")
+    if not 0 <= args.escaneadas <= 1:
+        parser.error("--escaneadas es una fracción entre 0 y 1")
+
+    args.salida.mkdir(parents=True, exist_ok=True)
+    tareas = [(str(args.salida), i, args.familia, tuple(args.paginas), args.escaneadas, args.semilla, args.dpi)
+              for i in range(args.documentos)]
+    por_familia, escaneados = {}, 0
+    # Con varios procesos, pool.map devuelve los documentos en el orden de las tareas
+    pool = ProcessPoolExecutor(max_workers=args.procesos) if args.procesos > 1 and len(tareas) > 1 else None
+    try:
+        registros = pool.map(_generar_tarea, tareas, chunksize=32) if pool else map(_generar_tarea, tareas)
+        with open(args.salida / NOMBRE_VERDAD, "w", encoding="utf-8") as verdad:
+            for registro in registros:
+                verdad.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                por_familia[registro["familia"]] = por_familia.get(registro["familia"], 0) + 1
+                escaneados += bool(registro["escaneadas"])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    detalle = ", ".join(f"{familia} {cuenta}" for familia, cuenta in sorted(por_familia.items()))
+    print(f"{args.documentos} documentos en {args.salida} ({detalle}; {escaneados} escaneados)")
+    print(f"Datos verdaderos en {args.salida / NOMBRE_VERDAD}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
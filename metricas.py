@@ -0,0 +1,101 @@
+"""Métricas de cada archivo por etapa del proceso: tiempos, páginas, OCR y bytes.
+
+procesar_archivo y los extractores anotan en el ``informe`` de cada
+resultado lo que tarda cada etapa (ETAPAS) con ``medir``, además de
+bytes, paginas_total, paginas_leidas y paginas_ocr. De ahí salen la tabla
+de métricas de las apps (tabla_metricas) y las líneas JSON de
+``convertir_facturas.py --metricas`` (linea_metricas).
+
+Con ``perfilar`` se envuelve una ejecución en cProfile para ver qué
+funciones se llevan el tiempo (ver ``convertir_facturas.py --perfil``).
+"""
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Etapas por archivo, en el orden del proceso (y de las columnas de tabla_metricas)
+ETAPAS = ("clasificar", "cache", "abrir", "lectura", "ocr", "plantilla", "campos", "tablas", "total")
+
+
+@contextmanager
+def medir(informe, etapa):
+    """Suma a informe["tiempos"][etapa] lo que tarda el bloque; con informe None no mide nada."""
+    if informe is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos = informe.setdefault("tiempos", {})
+        tiempos[etapa] = tiempos.get(etapa, 0.0) + time.perf_counter() - inicio
+
+
+def sumar_tiempos(*informes) -> dict:
+    """Tiempos por etapa sumados de varios informes (p. ej. los niveles de la cascada)."""
+    suma = {}
+    for informe in informes:
+        for etapa, segundos in informe.get("tiempos", {}).items():
+            suma[etapa] = suma.get(etapa, 0.0) + segundos
+    return suma
+
+
+def linea_metricas(resultado) -> dict:
+    """Métricas de un resultado de procesar_archivo, listas para json.dumps (tiempos en segundos)."""
+    informe = resultado["informe"]
+    return {
+        "archivo": resultado["archivo"],
+        "familia": resultado["familia"],
+        "bytes": informe.get("bytes"),
+        "paginas_total": informe.get("paginas_total"),
+        "paginas_leidas": informe.get("paginas_leidas"),
+        "paginas_ocr": informe.get("paginas_ocr", 0),
+        "nivel": informe.get("nivel"),
+        "desde_cache": resultado["desde_cache"],
+        "error": resultado["error"],
+        "tiempos": {etapa: round(segundos, 6) for etapa, segundos in informe.get("tiempos", {}).items()},
+    }
+
+
+def tabla_metricas(resultados) -> pd.DataFrame:
+    """Una fila por archivo con bytes, páginas y los milisegundos de cada etapa que se haya medido."""
+    lineas = [linea_metricas(resultado) for resultado in resultados]
+    medidas = [etapa for etapa in ETAPAS if any(etapa in linea["tiempos"] for linea in lineas)]
+    return pd.DataFrame([{
+        "Archivo": linea["archivo"],
+        "Familia": linea["familia"],
+        "KB": round((linea["bytes"] or 0) / 1024, 1),
+        "Páginas": linea["paginas_total"],
+        "Leídas": linea["paginas_leidas"],
+        "OCR": linea["paginas_ocr"],
+        "Caché": linea["desde_cache"],
+        **{f"{etapa} (ms)": round(linea["tiempos"].get(etapa, 0.0) * 1000, 1) for etapa in medidas},
+    } for linea in lineas])
+
+
+@contextmanager
+def perfilar(ruta=None):
+    """Ejecuta el bloque bajo cProfile y guarda las estadísticas en ``ruta`` (si se indica).
+
+    Devuelve el Profile; resumen_perfil() da las funciones con más tiempo
+    acumulado. Solo ve el proceso actual: con un pool, lo de los workers no aparece.
+    """
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+        if ruta is not None:
+            perfil.dump_stats(ruta)
+
+
+def resumen_perfil(perfil, lineas=25) -> str:
+    """Las ``lineas`` funciones con más tiempo acumulado, como las imprime pstats."""
+    salida = io.StringIO()
+    pstats.Stats(perfil, stream=salida).sort_stats("cumulative").print_stats(lineas)
+    return salida.getvalue()
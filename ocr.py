@@ -0,0 +1,222 @@
+"""OCR de páginas escaneadas con Tesseract.
+
+Las páginas se rasterizan de una en una (generador), de modo que la
+memoria pico depende del tamaño de una página y no del número de páginas.
+
+Configuración por variables de entorno:
+    PDF_A_EXCEL_RENDERIZADOR   "pymupdf" (por defecto) o "poppler" (pdf2image)
+    PDF_A_EXCEL_POPPLER_PATH   carpeta bin de Poppler; si no se indica, se busca pdftoppm en el PATH
+    PDF_A_EXCEL_OCR_DPI        resolución de rasterizado (200, la de pdf2image)
+    PDF_A_EXCEL_OCR_MAX_MB     tamaño máximo de una página rasterizada; si se supera se baja el DPI
+    PDF_A_EXCEL_OCR_MOTOR      "auto" (por defecto), "tesserocr" o "pytesseract"
+    PDF_A_EXCEL_OCR_HILOS      páginas reconocidas a la vez por proceso
+
+El motor "tesserocr" (dependencia opcional) mantiene Tesseract cargado en
+el propio proceso, con el idioma ya inicializado en cada hilo; "pytesseract"
+lanza un proceso tesseract por página. "auto" usa tesserocr si está
+instalado.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import fitz  # PyMuPDF
+from pdf2image import convert_from_path
+import pytesseract
+from PIL import Image
+
+from cache_facturas import CacheOCR
+
+RENDERIZADOR = os.environ.get("PDF_A_EXCEL_RENDERIZADOR", "pymupdf")
+DPI_OCR = int(os.environ.get("PDF_A_EXCEL_OCR_DPI", "200"))
+MAX_BYTES_PAGINA = int(os.environ.get("PDF_A_EXCEL_OCR_MAX_MB", "64")) * 1024 * 1024
+MOTOR_OCR = os.environ.get("PDF_A_EXCEL_OCR_MOTOR", "auto")
+HILOS_OCR = int(os.environ.get("PDF_A_EXCEL_OCR_HILOS", min(4, os.cpu_count() or 1)))
+IDIOMA_OCR = "spa"
+
+if HILOS_OCR > 1:
+    # Varios tesseract a la vez: que cada uno use un solo hilo de OpenMP. libgomp lee la
+    # variable al cargarse, así que tiene que estar antes de importar tesserocr (MotorTesserocr)
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Una página se considera escaneada si tiene menos texto que esto...
+MIN_CARACTERES_PAGINA = 100
+# ...y sus imágenes cubren al menos esta fracción de la página
+MIN_COBERTURA_IMAGEN = 0.3
+
+
+def _avisar(avisos, nivel, mensaje):
+    if avisos is not None:
+        avisos.append((nivel, mensaje))
+
+
+def pagina_escaneada(page, texto):
+    """True si la página apenas tiene capa de texto pero sí una imagen grande."""
+    if len(texto.strip()) >= MIN_CARACTERES_PAGINA:
+        return False
+    cubierta = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return cubierta >= MIN_COBERTURA_IMAGEN * abs(page.rect)
+
+
+def ruta_poppler():
+    """Carpeta bin de Poppler configurada o detectada; None para usar el PATH tal cual."""
+    ruta = os.environ.get("PDF_A_EXCEL_POPPLER_PATH")
+    if ruta:
+        return ruta
+    pdftoppm = shutil.which("pdftoppm")
+    return os.path.dirname(pdftoppm) if pdftoppm else None
+
+
+def _dpi_acotado(rect, dpi, max_bytes):
+    """Baja el DPI lo justo para que la página en escala de grises (1 byte/píxel) quepa en max_bytes."""
+    pixeles = (rect.width * dpi / 72) * (rect.height * dpi / 72)
+    if pixeles <= max_bytes:
+        return dpi
+    return max(int(dpi * (max_bytes / pixeles) ** 0.5), 1)
+
+
+def renderizar_paginas(pdf_bytes, paginas, dpi=None, renderizador=None, max_bytes=None):
+    """Genera (página, imagen PIL en gris) de una en una para las páginas indicadas (desde 0).
+
+    Solo hay una página rasterizada en memoria a la vez: la siguiente no se
+    renderiza hasta que quien consume el generador pide el siguiente elemento.
+    """
+    dpi = dpi or DPI_OCR
+    renderizador = renderizador or RENDERIZADOR
+    max_bytes = max_bytes or MAX_BYTES_PAGINA
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        if renderizador == "poppler":
+            # pdf2image necesita el PDF en disco; se escribe una vez para todas las páginas
+            with tempfile.TemporaryDirectory() as carpeta:
+                ruta_pdf = Path(carpeta) / "documento.pdf"
+                ruta_pdf.write_bytes(pdf_bytes)
+                for numero in paginas:
+                    imagenes = convert_from_path(
+                        ruta_pdf, dpi=_dpi_acotado(doc[numero].rect, dpi, max_bytes),
+                        first_page=numero + 1, last_page=numero + 1,
+                        grayscale=True, poppler_path=ruta_poppler(),
+                    )
+                    yield numero, imagenes[0]
+        else:
+            for numero in paginas:
+                page = doc[numero]
+                pix = page.get_pixmap(dpi=_dpi_acotado(page.rect, dpi, max_bytes), colorspace=fitz.csGRAY)
+                yield numero, Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+# ---------------------- MOTORES OCR ----------------------
+class MotorPytesseract:
+    """Un proceso tesseract por página (recarga el idioma en cada llamada)."""
+
+    nombre = "pytesseract"
+
+    def __init__(self, idioma=IDIOMA_OCR):
+        self.idioma = idioma
+
+    def reconocer(self, img) -> str:
+        return pytesseract.image_to_string(img, lang=self.idioma)
+
+
+class MotorTesserocr:
+    """Tesseract dentro del proceso: cada hilo conserva su API con el idioma cargado."""
+
+    nombre = "tesserocr"
+
+    def __init__(self, idioma=IDIOMA_OCR):
+        import tesserocr  # dependencia opcional
+        self._tesserocr = tesserocr
+        self.idioma = idioma
+        self._local = threading.local()
+
+    def reconocer(self, img) -> str:
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = self._tesserocr.PyTessBaseAPI(lang=self.idioma)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+
+def crear_motor(nombre=None):
+    """Crea el motor indicado; con "auto" prueba tesserocr y si no está usa pytesseract."""
+    nombre = nombre or MOTOR_OCR
+    if nombre in ("auto", "tesserocr"):
+        try:
+            return MotorTesserocr()
+        except ImportError:
+            if nombre == "tesserocr":
+                raise
+    return MotorPytesseract()
+
+
+_motor = None
+_pool_ocr = None
+_cache_ocr = None
+
+
+def _obtener_cache_ocr():
+    global _cache_ocr
+    if _cache_ocr is None:
+        _cache_ocr = CacheOCR()
+    return _cache_ocr
+
+
+def _obtener_motor_y_pool():
+    # Motor y pool de hilos viven lo que el proceso: los hilos siguen "calientes" entre documentos
+    global _motor, _pool_ocr
+    if _motor is None:
+        _motor = crear_motor()
+        _pool_ocr = ThreadPoolExecutor(max_workers=HILOS_OCR, thread_name_prefix="ocr")
+    return _motor, _pool_ocr
+
+
+def _reconocer(motor, img):
+    try:
+        return motor.reconocer(img)
+    finally:
+        img.close()
+
+
+def aplicar_ocr_a_paginas(pdf_bytes, paginas, avisos=None):
+    """OCR solo de las páginas indicadas (índices desde 0); devuelve {página: texto}.
+
+    Las páginas se reconocen en paralelo con HILOS_OCR hilos; como mucho hay
+    HILOS_OCR páginas rasterizadas esperando, así que la memoria sigue acotada.
+    Una página cuyos píxeles ya se reconocieron con los mismos ajustes sale
+    de CacheOCR sin pasar por Tesseract. Si una página falla se avisa y se
+    omite, sin perder el resto.
+    """
+    motor, pool = _obtener_motor_y_pool()
+    cache = _obtener_cache_ocr()
+    ajustes = f"dpi={DPI_OCR}|idioma={motor.idioma}|motor={motor.nombre}|gris"
+    textos = {}
+    en_vuelo = deque()
+
+    def recoger():
+        numero, clave, futuro = en_vuelo.popleft()
+        try:
+            textos[numero] = futuro.result() + "\n"
+            cache.guardar(clave, textos[numero])
+        except Exception as e:
+            _avisar(avisos, "warning", f"OCR falló en la página {numero + 1}: {e}")
+
+    try:
+        for numero, img in renderizar_paginas(pdf_bytes, paginas):
+            clave = cache.clave(img, ajustes)
+            texto = cache.obtener(clave)
+            if texto is not None:
+                textos[numero] = texto
+                img.close()
+                continue
+            en_vuelo.append((numero, clave, pool.submit(_reconocer, motor, img)))
+            if len(en_vuelo) >= HILOS_OCR:
+                recoger()
+    except Exception as e:
+        _avisar(avisos, "warning", f"No se pudo rasterizar el PDF para OCR: {e}")
+    while en_vuelo:
+        recoger()
+    return textos
@@ -0,0 +1,201 @@
+"""Plantillas aprendidas de cada formato de factura: dónde está cada campo y cada tabla.
+
+Las facturas de un mismo formato colocan sus datos siempre en el mismo
+sitio. Tras una extracción completa correcta, el extractor guarda por
+huella del formato la página y el recuadro de cada campo y tabla. El
+siguiente documento con la misma huella se lee solo en esas regiones
+(``get_text("words", clip=...)``, una vez por página) y se salta el resto
+de páginas, incluido el OCR de las escaneadas. Si algo no cuadra con la
+plantilla (falta un campo, cambia el número de filas, una palabra queda
+cortada por el borde de una región), el extractor vuelve a la lectura
+completa y la reaprende.
+
+A lo ancho, cada región ocupa todo el hueco libre de su columna de texto
+(hasta el bloque vecino o el borde de la página), no solo lo que ocupaba
+el texto del documento del que se aprendió: una dirección o un nombre más
+largos en otra factura siguen cabiendo.
+
+Las plantillas se guardan en plantillas.sqlite3, en el directorio de las
+cachés (PDF_A_EXCEL_CACHE_DIR).
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from cache_facturas import DIRECTORIO_CACHE
+
+# Holgura en puntos alrededor de cada región aprendida
+MARGEN_REGION = 2.0
+
+
+def huella_formato(doc, familia) -> str:
+    """Identifica el formato por familia, generador del PDF, nº de páginas y tamaño de cada una."""
+    metadatos = doc.metadata or {}
+    partes = [familia, metadatos.get("creator", ""), metadatos.get("producer", ""), str(doc.page_count)]
+    partes += [f"{round(page.rect.width)}x{round(page.rect.height)}" for page in doc]
+    return hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()
+
+
+def _lineas_pagina(page):
+    """(recuadros de los bloques de texto, [(recuadro, bloque)] de cada línea en el orden de page.get_text()).
+
+    El recuadro de cada línea toma el ancho de su bloque.
+    """
+    bloques, lineas = [], []
+    for bloque in page.get_text("dict")["blocks"]:
+        if bloque["type"] != 0:
+            continue
+        x0, _, x1, _ = bloque["bbox"]
+        for linea in bloque["lines"]:
+            lineas.append((fitz.Rect(x0, linea["bbox"][1], x1, linea["bbox"][3]), len(bloques)))
+        bloques.append(fitz.Rect(bloque["bbox"]))
+    return bloques, lineas
+
+
+def _ensanchar(recuadro, propios, bloques, page):
+    """El recuadro a lo ancho de su columna: hasta el bloque ajeno más cercano a cada lado
+    a su altura (menos MARGEN_REGION) o, si no hay, hasta el borde de la página."""
+    vecinos = [bloque for i, bloque in enumerate(bloques)
+               if i not in propios and bloque.y0 < recuadro.y1 and bloque.y1 > recuadro.y0]
+    x0 = max([bloque.x1 + MARGEN_REGION for bloque in vecinos if bloque.x1 <= recuadro.x0] + [page.rect.x0])
+    x1 = min([bloque.x0 - MARGEN_REGION for bloque in vecinos if bloque.x0 >= recuadro.x1] + [page.rect.x1])
+    return fitz.Rect(min(x0, recuadro.x0), recuadro.y0, max(x1, recuadro.x1), recuadro.y1)
+
+
+def aprender_regiones(doc, tramos, posicion):
+    """{nombre: [[página, [x0, y0, x1, y1]], ...]} de cada tramo (inicio, fin) del texto.
+
+    ``posicion`` traduce un offset del texto a (página, línea), como
+    TextoDocumento.posicion. Un tramo que sigue en otra página tiene un
+    recuadro por página, ensanchado a todo el hueco de su columna
+    (_ensanchar). Devuelve None si algún tramo
+    cae en líneas que no están en la capa de texto (p. ej. una página leída por OCR).
+    """
+    lineas_por_pagina = {}
+    regiones = {}
+    for nombre, (inicio, fin) in tramos.items():
+        pagina_inicio, primera = posicion(inicio)
+        pagina_fin, ultima = posicion(max(fin - 1, inicio))
+        partes = []
+        for pagina in range(pagina_inicio, pagina_fin + 1):
+            if pagina not in lineas_por_pagina:
+                lineas_por_pagina[pagina] = _lineas_pagina(doc[pagina])
+            bloques, lineas = lineas_por_pagina[pagina]
+            desde = primera if pagina == pagina_inicio else 0
+            hasta = ultima if pagina == pagina_fin else len(lineas) - 1
+            if hasta >= len(lineas):
+                return None
+            if desde > hasta:
+                continue    # página intermedia sin texto
+            tramo = lineas[desde:hasta + 1]
+            recuadro = fitz.Rect(tramo[0][0])
+            for linea, _ in tramo[1:]:
+                recuadro |= linea
+            recuadro = _ensanchar(recuadro, {bloque for _, bloque in tramo}, bloques, doc[pagina])
+            recuadro += (0, -MARGEN_REGION, 0, MARGEN_REGION)
+            partes.append([pagina, list(recuadro)])
+        regiones[nombre] = partes
+    return regiones
+
+
+def paginas_plantilla(plantilla) -> set:
+    """Números de las páginas que hay que leer para una plantilla."""
+    return {pagina for partes in plantilla["regiones"].values() for pagina, _ in partes}
+
+
+def leer_regiones(doc, regiones):
+    """{nombre: texto} de cada región: sus palabras, una línea del PDF por línea de texto.
+
+    Cada página se lee una sola vez, recortada a la franja (a todo lo ancho)
+    que cubren sus regiones; las páginas sin regiones no se tocan. Devuelve
+    None si alguna palabra de una región se sale por su borde izquierdo o
+    derecho: el texto quedaría cortado y el documento no cuadra con la plantilla.
+    """
+    por_pagina = {}
+    for nombre, partes in regiones.items():
+        for orden, (pagina, recuadro) in enumerate(partes):
+            por_pagina.setdefault(pagina, []).append((nombre, orden, fitz.Rect(recuadro)))
+
+    trozos = {}
+    for pagina, grupo in por_pagina.items():
+        page = doc[pagina]
+        area = fitz.Rect(grupo[0][2])
+        for *_, recuadro in grupo[1:]:
+            area |= recuadro
+        # A todo lo ancho: el recorte no corta las palabras que se salen de una región
+        area.x0, area.x1 = page.rect.x0, page.rect.x1
+        # Sin ordenar: las palabras salen en el orden de bloques y líneas de get_text()
+        palabras = page.get_text("words", clip=area)
+        for nombre, orden, r in grupo:
+            lineas = {}
+            for x0, y0, x1, y1, palabra, bloque, linea, _ in palabras:
+                if not (r.y0 <= (y0 + y1) / 2 < r.y1 and x1 > r.x0 and x0 < r.x1):
+                    continue
+                if x0 < r.x0 or x1 > r.x1:
+                    return None
+                lineas.setdefault((bloque, linea), []).append(palabra)
+            trozos[nombre, orden] = "\n".join(" ".join(linea) for linea in lineas.values())
+    return {nombre: "\n".join(trozos[nombre, orden] for orden in range(len(partes)))
+            for nombre, partes in regiones.items()}
+
+
+class AlmacenPlantillas:
+    """Plantillas SQLite por (huella del formato, versión del extractor), con contadores de uso."""
+
+    def __init__(self, directorio=None):
+        self.directorio = Path(directorio or DIRECTORIO_CACHE)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.ruta = self.directorio / "plantillas.sqlite3"
+        with self._conectar() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS plantillas ("
+                " huella TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " familia TEXT NOT NULL,"
+                " plantilla TEXT NOT NULL,"
+                " aciertos INTEGER NOT NULL DEFAULT 0,"
+                " fallos INTEGER NOT NULL DEFAULT 0,"
+                " ultimo_uso REAL NOT NULL,"
+                " PRIMARY KEY (huella, version))"
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def obtener(self, huella: str, version: str):
+        """Devuelve la plantilla ({"regiones", "filas"}) o None si el formato no se conoce."""
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT plantilla FROM plantillas WHERE huella = ? AND version = ?", (huella, version)
+            ).fetchone()
+        return json.loads(fila[0]) if fila is not None else None
+
+    def guardar(self, huella: str, version: str, familia: str, plantilla: dict):
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO plantillas (huella, version, familia, plantilla, ultimo_uso)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT(huella, version)"
+                " DO UPDATE SET plantilla = excluded.plantilla, ultimo_uso = excluded.ultimo_uso",
+                (huella, version, familia, json.dumps(plantilla), time.time()),
+            )
+
+    def anotar(self, huella: str, version: str, acierto: bool):
+        """Cuenta un documento leído con la plantilla (acierto) o que no cuadró con ella (fallo)."""
+        contador = "aciertos" if acierto else "fallos"
+        with self._conectar() as conn:
+            conn.execute(
+                f"UPDATE plantillas SET {contador} = {contador} + 1, ultimo_uso = ?"
+                " WHERE huella = ? AND version = ?",
+                (time.time(), huella, version),
+            )
+
+    def estadisticas(self) -> dict:
+        with self._conectar() as conn:
+            plantillas, aciertos, fallos = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(aciertos), 0), COALESCE(SUM(fallos), 0) FROM plantillas"
+            ).fetchone()
+        return {"plantillas": plantillas, "aciertos": aciertos, "fallos": fallos}
@@ -0,0 +1,207 @@
+"""Procesamiento de facturas por archivo y por lotes, sin depender de Streamlit.
+
+Cada archivo pasa por la caché en disco (cache_facturas) y, si no está,
+por el extractor de su familia, que en las familias de
+FAMILIAS_CON_PLANTILLAS lee solo las regiones de la plantilla del formato
+si ya la ha aprendido (plantillas). Con
+PDF_A_EXCEL_MODO_TABLAS=cascada el extractor se aplica por niveles y solo
+los documentos que no validan pasan a los más caros (cascada). Con la
+familia "auto", la familia de cada archivo se decide por el texto de su
+primera página (clasificar_pdf), así que un lote puede mezclar formatos.
+Los lotes se reparten entre un pool de procesos y los resultados se
+devuelven en el mismo orden de entrada; un fallo en un archivo se anota en
+su resultado sin detener el resto.
+
+El número de procesos por defecto se configura con PDF_A_EXCEL_PROCESOS
+(por defecto, un proceso por CPU).
+"""
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+import extractores_endesa
+import extractores_factura
+from cache_facturas import CacheFacturas, hash_pdf
+from cascada import extraer_en_cascada
+from metricas import medir
+from plantillas import AlmacenPlantillas
+from tablas_layout import MODO_TABLAS
+
+PROCESOS_POR_DEFECTO = int(os.environ.get("PDF_A_EXCEL_PROCESOS", os.cpu_count() or 1))
+
+# Familia -> (función extraer_tablas(pdf_bytes, nombre, avisos, plantillas=..., informe=...),
+#            versión del extractor, textos que identifican el formato en la primera página,
+#            función validar_tablas(texto, tablas) para la cascada)
+FAMILIAS = {
+    "factura": (extractores_factura.extraer_tablas, extractores_factura.VERSION_EXTRACTOR,
+                extractores_factura.MARCAS_FORMATO, extractores_factura.validar_tablas),
+    "endesa": (extractores_endesa.extraer_tablas, extractores_endesa.VERSION_EXTRACTOR,
+               extractores_endesa.MARCAS_FORMATO, extractores_endesa.validar_tablas),
+}
+FAMILIA_AUTO = "auto"
+# Familias que leen con plantillas. En "factura" leer las regiones es más lento que leer el
+# documento entero (benchmark.py plantillas), aunque se salten páginas: sus PDF son cortos
+FAMILIAS_CON_PLANTILLAS = ("endesa",)
+
+# Niveles de aviso de una extracción que falló a medias: no se guarda en caché. Los "warning"
+# (una sección que la factura no trae, cifras no válidas...) salen igual al repetirla y sí se
+# guardan; el OCR fallido o las páginas que no se pudieron rasterizar se ven en paginas_ocr
+NIVELES_INCOMPLETA = ("error",)
+# Sustituye al nombre del archivo en los avisos guardados: el mismo PDF puede llegar con otro nombre
+MARCA_ARCHIVO = "{archivo}"
+
+_cache = None
+_plantillas = None
+
+
+def _obtener_cache():
+    # Una instancia por proceso: cada worker abre su propia conexión SQLite
+    global _cache
+    if _cache is None:
+        _cache = CacheFacturas()
+    return _cache
+
+
+def _obtener_plantillas():
+    global _plantillas
+    if _plantillas is None:
+        _plantillas = AlmacenPlantillas()
+    return _plantillas
+
+
+def _extraccion_completa(informe, avisos) -> bool:
+    """Si se puede guardar en caché: sin avisos de error ni problemas y, si se intentó el OCR
+    (hay paginas_ocr en el informe), con todas las páginas escaneadas reconocidas."""
+    if "paginas_ocr" in informe and informe["paginas_ocr"] < informe.get("paginas_escaneadas", 0):
+        return False
+    return not informe.get("problemas") and not any(nivel in NIVELES_INCOMPLETA for nivel, _ in avisos)
+
+
+def clasificar_pdf(pdf_bytes):
+    """Familia del PDF según su primera página con texto, o None si no es de ninguna o de varias.
+
+    Solo se extrae el texto de esa página: una página escaneada (sin capa de
+    texto) se salta y se mira la siguiente.
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        texto = next((t for t in (page.get_text() for page in doc) if t.strip()), "")
+    familias = [familia for familia, (_, _, marcas, _) in FAMILIAS.items()
+                if all(marca in texto for marca in marcas)]
+    return familias[0] if len(familias) == 1 else None
+
+
+def procesar_archivo(familia, contenido, nombre_archivo, usar_cache=True) -> dict:
+    """Procesa un PDF (bytes o ruta) y devuelve un dict de resultado.
+
+    Claves: archivo, familia (la indicada o, con "auto", la detectada), hash,
+    tablas ({nombre: {columna: [valores]}}), avisos (pares nivel/mensaje),
+    informe (bytes, tiempos por etapa y, si se leyó el PDF, paginas_leidas,
+    paginas_total y paginas_ocr; en cascada, también nivel y problemas; ver
+    metricas), desde_cache y error (None o el mensaje del fallo).
+
+    Solo se guardan en caché las extracciones completas (_extraccion_completa);
+    al recuperar una de la caché se repiten sus avisos. La caché se consulta
+    por el hash antes de clasificar: con "auto" se prueba la versión de cada
+    familia, así que un PDF repetido no se llega a abrir.
+    """
+    resultado = {"archivo": nombre_archivo, "familia": None, "hash": None, "tablas": {},
+                 "avisos": [], "informe": {}, "desde_cache": False, "error": None}
+    informe = resultado["informe"]
+    inicio = time.perf_counter()
+    try:
+        pdf_bytes = contenido if isinstance(contenido, bytes) else Path(contenido).read_bytes()
+        informe["bytes"] = len(pdf_bytes)
+        en_cache = None
+        with medir(informe, "cache"):
+            resultado["hash"] = hash_pdf(pdf_bytes)
+            if usar_cache:
+                for candidata in (FAMILIAS if familia == FAMILIA_AUTO else [familia]):
+                    en_cache = _obtener_cache().obtener(resultado["hash"], FAMILIAS[candidata][1])
+                    if en_cache is not None:
+                        familia = candidata
+                        break
+        if familia == FAMILIA_AUTO:
+            with medir(informe, "clasificar"):
+                familia = clasificar_pdf(pdf_bytes)
+            if familia is None:
+                raise ValueError("formato de factura no reconocido en la primera página")
+        resultado["familia"] = familia
+        extraer_tablas, version, _, validar = FAMILIAS[familia]
+
+        if en_cache is not None:
+            _, tablas, avisos = en_cache
+            # El mismo contenido puede llegar con otro nombre de archivo
+            for columnas in tablas.values():
+                if "Archivo" in columnas:
+                    columnas["Archivo"] = [nombre_archivo] * len(columnas["Archivo"])
+            resultado["tablas"] = tablas
+            resultado["avisos"] = [(nivel, mensaje.replace(MARCA_ARCHIVO, nombre_archivo)) for nivel, mensaje in avisos]
+            resultado["desde_cache"] = True
+            return resultado
+
+        plantillas = _obtener_plantillas() if usar_cache and familia in FAMILIAS_CON_PLANTILLAS else None
+        if MODO_TABLAS == "cascada":
+            texto, tablas = extraer_en_cascada(extraer_tablas, validar, pdf_bytes, nombre_archivo,
+                                               resultado["avisos"], plantillas, informe)
+        else:
+            texto, tablas = extraer_tablas(pdf_bytes, nombre_archivo, resultado["avisos"], plantillas=plantillas,
+                                           informe=informe)
+        if usar_cache and _extraccion_completa(informe, resultado["avisos"]):
+            avisos = [(nivel, mensaje.replace(nombre_archivo, MARCA_ARCHIVO)) for nivel, mensaje in resultado["avisos"]]
+            with medir(informe, "cache"):
+                _obtener_cache().guardar(resultado["hash"], version, texto, tablas, avisos)
+        resultado["tablas"] = tablas
+    except Exception as e:
+        resultado["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        informe.setdefault("tiempos", {})["total"] = time.perf_counter() - inicio
+    return resultado
+
+
+def _procesar_tarea(tarea):
+    return procesar_archivo(*tarea)
+
+
+def iterar_lote(familia, archivos, procesos=None, usar_cache=True):
+    """Genera los resultados de cada (nombre, contenido) de ``archivos`` en orden de entrada.
+
+    Con más de un proceso los archivos se reparten en un pool; como mucho
+    hay ``4 * procesos`` archivos en vuelo para acotar la memoria.
+    """
+    procesos = procesos or PROCESOS_POR_DEFECTO
+    tareas = ((familia, contenido, nombre, usar_cache) for nombre, contenido in archivos)
+
+    if procesos <= 1:
+        for tarea in tareas:
+            yield _procesar_tarea(tarea)
+        return
+
+    # "spawn" evita heredar hilos del proceso padre (Streamlit) al hacer fork
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        en_vuelo = deque()
+        for tarea in tareas:
+            en_vuelo.append((tarea[2], pool.submit(_procesar_tarea, tarea)))
+            if len(en_vuelo) >= 4 * procesos:
+                yield _resultado_de(*en_vuelo.popleft())
+        while en_vuelo:
+            yield _resultado_de(*en_vuelo.popleft())
+
+
+def _resultado_de(nombre_archivo, futuro):
+    try:
+        return futuro.result()
+    except Exception as e:
+        # El worker murió (p. ej. sin memoria): se anota y se sigue con el lote
+        return {"archivo": nombre_archivo, "familia": None, "hash": None, "tablas": {}, "avisos": [],
+                "informe": {}, "desde_cache": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def procesar_lote(familia, archivos, procesos=None, usar_cache=True) -> list:
+    """Como iterar_lote, pero devuelve la lista completa de resultados."""
+    return list(iterar_lote(familia, archivos, procesos, usar_cache))
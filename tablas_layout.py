@@ -0,0 +1,132 @@
+"""Lectura de las tablas por periodo (P1-P6) a partir de la posición de las palabras.
+
+En lugar de aplanar la página a texto y casar una expresión regular larga,
+se localiza la tabla por un texto ancla (``page.search_for``) y solo se
+leen las palabras dentro de su recuadro. El análisis de la página
+(``TextPage``) se hace una vez y se comparte entre todas sus tablas:
+recortar con ``clip=`` obliga a PyMuPDF a analizarla de nuevo en cada
+llamada.
+Cada fila empieza por una etiqueta (P1, "Periodo"...) y las celdas se
+asignan a columnas por su borde derecho (las cifras van alineadas a la
+derecha), así que una celda vacía no desplaza a las demás.
+
+El modo se elige con PDF_A_EXCEL_MODO_TABLAS: "regex" (por defecto),
+"layout" o "cascada" (regex y, solo para los documentos que no validan,
+layout y OCR; ver cascada.py). Si una tabla no se reconoce por posición,
+los extractores usan la expresión regular.
+
+Las cifras se pasan a número por columnas (convertir_columnas): los
+extractores recogen las celdas como texto y convierten las de cada tabla
+al terminarla; una celda que no es un número queda en NaN y se avisa. La
+conversión es celda a celda: con las decenas de cifras de una factura,
+pasarlas a pyarrow.compute cuesta más de lo que ahorra ("benchmark.py
+numeros").
+"""
+import math
+import os
+import re
+from statistics import median
+
+
+MODO_TABLAS = os.environ.get("PDF_A_EXCEL_MODO_TABLAS", "regex")
+
+_NUMERO = re.compile(r"[\d.,]+")
+
+
+def numero_es(celda):
+    """"1.234,56" -> 1234.56; None para una celda vacía."""
+    return None if celda is None else float(celda.replace(".", "").replace(",", "."))
+
+
+def convertir_columnas(columnas, nombres) -> list:
+    """Pasa a número, en su sitio, las columnas ``nombres`` de celdas "1.234,56".
+
+    Las celdas vacías quedan en None y las que no son un número ("1,2,3")
+    en NaN; se devuelve (fila, columna, celda) de cada una de estas.
+    """
+    errores = []
+    for nombre in nombres:
+        valores = []
+        for celda in columnas[nombre]:
+            try:
+                valores.append(float(celda.replace(".", "").replace(",", ".")))
+            except ValueError:
+                errores.append((len(valores), nombre, celda))
+                valores.append(math.nan)
+            except AttributeError:      # None: celda vacía
+                valores.append(None)
+        columnas[nombre] = valores
+    return errores
+
+
+def _agrupar_columnas(bordes, tolerancia):
+    """Agrupa bordes derechos cercanos; devuelve el centro de cada columna."""
+    columnas = []
+    for borde in sorted(bordes):
+        if columnas and borde - columnas[-1][-1] <= tolerancia:
+            columnas[-1].append(borde)
+        else:
+            columnas.append([borde])
+    return [sum(grupo) / len(grupo) for grupo in columnas]
+
+
+def palabras_pagina(page):
+    """(TextPage, palabras) de la página, para leer varias tablas sin volver a analizarla."""
+    textpage = page.get_textpage()
+    return textpage, textpage.extractWORDS()
+
+
+def leer_filas(page, ancla, etiqueta, num_columnas, x_fin=1.0, tolerancia=3.0, analisis=None):
+    """Filas de la tabla que empieza en el texto ``ancla`` de la página.
+
+    ``etiqueta`` es la expresión que debe cumplir la primera palabra de cada
+    fila; ``x_fin`` limita el recuadro por la derecha (fracción del ancho,
+    para páginas a varias columnas); ``analisis`` es el resultado de
+    palabras_pagina() si ya se tiene. Devuelve [(etiqueta, [celda o None, ...])]
+    con ``num_columnas`` celdas por fila, o None si la tabla no aparece o sus
+    columnas no se distinguen.
+    """
+    textpage, todas = analisis or palabras_pagina(page)
+    rectangulos = page.search_for(ancla, textpage=textpage)
+    if not rectangulos:
+        return None
+    inicio = rectangulos[0]
+    # Recuadro de la tabla: palabras cuyo centro cae entre el ancla y el borde derecho/inferior
+    x0, y0 = inicio.x0 - tolerancia, inicio.y0
+    x1 = page.rect.x0 + page.rect.width * x_fin
+    palabras = sorted((p for p in todas if x0 <= (p[0] + p[2]) / 2 < x1 and y0 <= (p[1] + p[3]) / 2),
+                      key=lambda p: (p[3], p[0]))
+
+    # Etiquetas de fila seguidas; la tabla acaba en el primer salto grande entre filas
+    patron = re.compile(etiqueta)
+    etiquetas = [p for p in palabras if patron.fullmatch(p[4]) and p[0] <= inicio.x0 + tolerancia]
+    if not etiquetas:
+        return None
+    alto_fila = median(b[1] - a[1] for a, b in zip(etiquetas, etiquetas[1:])) if len(etiquetas) > 1 \
+        else etiquetas[0][3] - etiquetas[0][1]
+    filas = [etiquetas[0]]
+    for siguiente in etiquetas[1:]:
+        if siguiente[1] - filas[-1][1] > 2 * alto_fila:
+            break
+        filas.append(siguiente)
+
+    # Cifras de cada fila: las que caen en su franja vertical, a la derecha de la etiqueta
+    cifras_por_fila = []
+    for i, fila in enumerate(filas):
+        desde = fila[1] - tolerancia
+        hasta = filas[i + 1][1] - tolerancia if i + 1 < len(filas) else fila[1] + alto_fila - tolerancia
+        cifras_por_fila.append([p for p in palabras
+                                if desde <= (p[1] + p[3]) / 2 < hasta and p[0] >= fila[2]
+                                and _NUMERO.fullmatch(p[4])])
+
+    columnas = _agrupar_columnas([p[2] for cifras in cifras_por_fila for p in cifras], tolerancia)
+    if len(columnas) != num_columnas:
+        return None
+
+    resultado = []
+    for fila, cifras in zip(filas, cifras_por_fila):
+        celdas = [None] * num_columnas
+        for p in cifras:
+            celdas[min(range(num_columnas), key=lambda c: abs(columnas[c] - p[2]))] = p[4]
+        resultado.append((fila[4], celdas))
+    return resultado
@@ -1,6 +1,8 @@
 import streamlit as st
 from pdf2image import convert_from_bytes
 
+from ocr import ruta_poppler
+
 st.title("Test OCR con pdf2image y Poppler")
 
 uploaded_file = st.file_uploader("Sube un PDF escaneado", type=["pdf"])
@@ -9,7 +11,7 @@ if uploaded_file is not None:
     pdf_bytes = uploaded_file.read()
 
     try:
-        images = convert_from_bytes(pdf_bytes, poppler_path=r"C:\Users\Maria\Documents\poppler-24.08.0\Library\bin")
+        images = convert_from_bytes(pdf_bytes, poppler_path=ruta_poppler())
         st.success(f"Se generaron {len(images)} imágenes del PDF")
         for i, img in enumerate(images):
             st.image(img, caption=f"Página {i+1}")